@@ -1,22 +1,51 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, abort, render_template, request, jsonify, redirect, url_for
 from datetime import datetime
 import os
 import sys
+import threading
 
 # Add the parent directory to the path so we can import from the root
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from db import db
+from models import Patient, Alert
+from utils.alert_index import alert_index, init_alert_index
+from utils.alert_rollups import count_acknowledged, rollup_key
+from utils.alerting import VITAL_TYPES
+from utils.change_feed import ack_change, record_changes
+from utils.ingest import UnknownPatient, ingest_in_app
+from utils.ingest_queue import IngestQueue, InvalidReading, QueueFull, validate_reading
+from utils.metrics import init_metrics
+from utils.patient_rows import patient_row, patient_rows
+from utils.patient_status import clear_alert_flags
+from utils.shards import configure_shards, create_shard_tables, shard_for_alert, use_shard
+from utils.sparklines import init_sparklines
+from utils.template_cache import configure_template_cache
+from utils.threshold_profiles import evaluator_for, init_threshold_profiles
+from utils.trends import init_trends
+from utils.vitals import init_vitals
 
 app = Flask(__name__, template_folder='../templates')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///patients.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///patients.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
 
-db = SQLAlchemy(app)
+# Use the shared db instance the models are bound to. The engine is still
+# built here rather than on first request: Vercel runs module import in the
+# init phase, so paying for the dialect import now keeps it off the first
+# response (see bench_cold_start.py). Metrics only register hooks and the
+# /metrics route, which Flask allows before the first request only.
+configure_shards(app)
+db.init_app(app)
+init_metrics(app)
+app.config['TREND_ALERTS'] = os.environ.get('TREND_ALERTS', '0') == '1'
+app.config['THRESHOLD_REFRESH_SECONDS'] = int(os.environ.get('THRESHOLD_REFRESH_SECONDS', '30'))
 
-# Import models after db is defined to avoid circular imports
-from models import Patient, VitalSign, Alert
-from utils.notifications import send_critical_alert_notification
+# Cold-start mode loads templates precompiled by precompile_templates.py and
+# caches bytecode for any that are not. On by default when running on Vercel.
+COLD_START_MODE = os.environ.get('COLD_START_MODE', '1' if os.environ.get('VERCEL') else '0') == '1'
 
 # Custom Jinja2 filters
 @app.template_filter('datetime')
@@ -26,21 +55,37 @@ def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
         return ""
     return value.strftime(format)
 
-# Define vital sign thresholds with warning and critical levels
-THRESHOLDS = {
-    'heart_rate': {
-        'warning': {'min': 60, 'max': 100},
-        'critical': {'min': 50, 'max': 120}
-    },
-    'spo2': {
-        'warning': {'min': 95, 'max': 100},
-        'critical': {'min': 90, 'max': 100}
-    },
-    'temp': {
-        'warning': {'min': 36.5, 'max': 37.5},
-        'critical': {'min': 35.5, 'max': 38.5}
-    }
-}
+if COLD_START_MODE:
+    configure_template_cache(app)
+
+INGEST_TIMEOUT = float(os.environ.get('INGEST_TIMEOUT', 10))
+
+# Created by setup_app, so importing this module stays cheap
+trends = sparklines = ingest_queue = None
+_setup_lock = threading.Lock()
+
+@app.before_request
+def setup_app():
+    """Create the app's in-memory indexes and the ingest writer, once.
+
+    Runs before the first request; processes that use the app without
+    serving requests (gateway.py) call it themselves.
+    """
+    global trends, sparklines, ingest_queue
+    if ingest_queue is not None:
+        return
+    with _setup_lock:
+        if ingest_queue is not None:
+            return
+        init_alert_index(app)
+        trends = init_trends(app)
+        sparklines = init_sparklines(app)
+        init_vitals(app)
+        init_threshold_profiles(app)
+        # Readings from /update are written by a single background writer, with
+        # critical readings first and normal ones shed when it falls behind.
+        # Set last: it marks the setup as done.
+        ingest_queue = IngestQueue(ingest_in_app(app), capacity=int(os.environ.get('INGEST_QUEUE_CAPACITY', 1000)))
 
 @app.route('/')
 def index():
@@ -50,206 +95,116 @@ def index():
 @app.route('/status')
 def dashboard():
     """Display the main dashboard with all patients."""
-    patients = Patient.query.all()
+    patients = patient_rows()
     now = datetime.now()
-    return render_template('dashboard.html', patients=patients, now=now)
+    sparklines.warm([patient.id for patient in patients])
+    return render_template('dashboard.html', patients=patients, now=now, sparklines=sparklines)
 
 @app.route('/status/<int:patient_id>')
 def patient_status(patient_id):
     """Return HTMX fragment for a specific patient."""
-    patient = Patient.query.get_or_404(patient_id)
-    latest_vitals = VitalSign.query.filter_by(patient_id=patient_id).order_by(VitalSign.timestamp.desc()).first()
-    return render_template('_patient_card.html', patient=patient, vitals=latest_vitals)
+    patient = patient_row(patient_id)
+    if patient is None:
+        abort(404)
+    patient_trends = trends.get(patient_id)
+    sparklines.warm([patient_id])
+    return render_template('_patient_card.html', patient=patient,
+                           trends=patient_trends.summary() if patient_trends else None,
+                           sparklines=sparklines)
 
 @app.route('/update', methods=['POST'])
 def update_vitals():
     """Receive and process vital signs data, create alerts if thresholds exceeded."""
-    data = request.json
-    
-    patient_id = data.get('patient_id')
-    heart_rate = data.get('heart_rate')
-    spo2 = data.get('spo2')
-    temp = data.get('temp')
-    
-    # Record the vital signs
-    vital = VitalSign(
-        patient_id=patient_id,
-        heart_rate=heart_rate,
-        spo2=spo2,
-        temp=temp,
-        timestamp=datetime.now()
-    )
-    db.session.add(vital)
-    
-    # Check thresholds and create alerts
-    alerts = []
-    patient = Patient.query.get(patient_id)
-    patient_at_risk = False
-    has_critical_alert = False
-    
-    # Check heart rate
-    if heart_rate:
-        severity = 'normal'
-        threshold_str = ""
-        
-        # Check critical threshold first
-        if heart_rate < THRESHOLDS['heart_rate']['critical']['min'] or heart_rate > THRESHOLDS['heart_rate']['critical']['max']:
-            severity = 'critical'
-            threshold_str = f"{THRESHOLDS['heart_rate']['critical']['min']}-{THRESHOLDS['heart_rate']['critical']['max']}"
-            patient_at_risk = True
-            has_critical_alert = True
-        # Then check warning threshold
-        elif heart_rate < THRESHOLDS['heart_rate']['warning']['min'] or heart_rate > THRESHOLDS['heart_rate']['warning']['max']:
-            severity = 'warning'
-            threshold_str = f"{THRESHOLDS['heart_rate']['warning']['min']}-{THRESHOLDS['heart_rate']['warning']['max']}"
-            patient_at_risk = True
-        
-        # Create alert if not normal
-        if severity != 'normal':
-            alerts.append(Alert(
-                patient_id=patient_id,
-                vital_type='heart_rate',
-                value=heart_rate,
-                threshold=threshold_str,
-                severity=severity,
-                timestamp=datetime.now(),
-                acknowledged=False
-            ))
-    
-    # Check SpO2
-    if spo2:
-        severity = 'normal'
-        threshold_str = ""
-        
-        # Check critical threshold first
-        if spo2 < THRESHOLDS['spo2']['critical']['min']:
-            severity = 'critical'
-            threshold_str = f">= {THRESHOLDS['spo2']['critical']['min']}"
-            patient_at_risk = True
-            has_critical_alert = True
-        # Then check warning threshold
-        elif spo2 < THRESHOLDS['spo2']['warning']['min']:
-            severity = 'warning'
-            threshold_str = f">= {THRESHOLDS['spo2']['warning']['min']}"
-            patient_at_risk = True
-        
-        # Create alert if not normal
-        if severity != 'normal':
-            alerts.append(Alert(
-                patient_id=patient_id,
-                vital_type='spo2',
-                value=spo2,
-                threshold=threshold_str,
-                severity=severity,
-                timestamp=datetime.now(),
-                acknowledged=False
-            ))
-    
-    # Check temperature
-    if temp:
-        severity = 'normal'
-        threshold_str = ""
-        
-        # Check critical threshold first
-        if temp < THRESHOLDS['temp']['critical']['min'] or temp > THRESHOLDS['temp']['critical']['max']:
-            severity = 'critical'
-            threshold_str = f"{THRESHOLDS['temp']['critical']['min']}-{THRESHOLDS['temp']['critical']['max']}"
-            patient_at_risk = True
-            has_critical_alert = True
-        # Then check warning threshold
-        elif temp < THRESHOLDS['temp']['warning']['min'] or temp > THRESHOLDS['temp']['warning']['max']:
-            severity = 'warning'
-            threshold_str = f"{THRESHOLDS['temp']['warning']['min']}-{THRESHOLDS['temp']['warning']['max']}"
-            patient_at_risk = True
-        
-        # Create alert if not normal
-        if severity != 'normal':
-            alerts.append(Alert(
-                patient_id=patient_id,
-                vital_type='temp',
-                value=temp,
-                threshold=threshold_str,
-                severity=severity,
-                timestamp=datetime.now(),
-                acknowledged=False
-            ))
-    
-    # Update patient risk status
-    patient.current_risk = patient_at_risk
-    
-    # Add all alerts to the database
-    for alert in alerts:
-        db.session.add(alert)
-    
-    db.session.commit()
-    
-    # Send notifications for critical alerts
-    if has_critical_alert:
-        for alert in alerts:
-            if alert.severity == 'critical':
-                send_critical_alert_notification(patient, alert)
-                # Mark as notified
-                alert.notified = True
-        db.session.commit()
+    try:
+        reading = validate_reading(request.get_json(silent=True))
+    except InvalidReading as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    patient_id = reading['patient_id']
+    vitals = {vital_type: reading.get(vital_type) for vital_type in VITAL_TYPES}
+    
+    # Classify up front so the reading is admitted by severity
+    alerts = evaluator_for(patient_id).classify(vitals)
+    severities = {severity for _, _, severity, _ in alerts}
+    severity = 'critical' if 'critical' in severities else 'warning' if severities else None
+    
+    # Queue the reading; alerts and notifications are handled by the writer
+    reading = dict(vitals, patient_id=patient_id, timestamp=datetime.now())
+    try:
+        future = ingest_queue.submit(reading, severity)
+    except QueueFull as e:
+        return jsonify({"success": False, "message": "Ingest queue is full"}), 429, {'Retry-After': str(e.retry_after)}
+    try:
+        future.result(timeout=INGEST_TIMEOUT)
+    except TimeoutError:
+        # Still queued and will be stored; don't resend it
+        return jsonify({"success": True, "message": "Reading queued"}), 202
+    except UnknownPatient:
+        return jsonify({"success": False, "message": "Patient not found"}), 404
+    except Exception:
+        app.logger.exception('Reading for patient %s could not be stored', patient_id)
+        return (jsonify({"success": False, "message": "Reading could not be stored"}), 503,
+                {'Retry-After': str(ingest_queue.retry_after())})
     
     # Return the updated patient card HTML fragment
-    return render_template('_patient_card.html', patient=patient, vitals=vital)
+    patient = patient_row(patient_id)
+    patient_trends = trends.get(patient_id)
+    sparklines.warm([patient_id])
+    return render_template('_patient_card.html', patient=patient,
+                           trends=patient_trends.summary() if patient_trends else None,
+                           sparklines=sparklines)
 
 @app.route('/alerts')
 def alerts_queue():
     """Display a queue of all unacknowledged alerts."""
-    # Get all unacknowledged alerts, ordered by timestamp (newest first)
-    alerts = Alert.query.filter_by(acknowledged=False).order_by(Alert.timestamp.desc()).all()
-    
-    # Get patient information for each alert
-    patients_dict = {}
-    for alert in alerts:
-        if alert.patient_id not in patients_dict:
-            patients_dict[alert.patient_id] = Patient.query.get(alert.patient_id)
+    # Worst unacknowledged alerts first (critical, then oldest), from the in-memory index
+    index = alert_index()
+    alerts = index.top(200)
+    patients_dict = index.patients_for(alerts)
     
     now = datetime.now()
-    return render_template('alerts.html', alerts=alerts, patients=patients_dict, now=now)
+    return render_template('alerts.html', alerts=alerts, patients=patients_dict, total=len(index), now=now)
 
 @app.route('/acknowledge_from_queue/<int:alert_id>', methods=['POST'])
 def acknowledge_from_queue(alert_id):
     """Acknowledge an alert from the alerts queue."""
-    alert = db.session.get(Alert, alert_id)
-    if not alert:
-        return jsonify({"success": False, "message": "Alert not found"})
-    
-    # Get patient and vital type information
-    patient_id = alert.patient_id
-    vital_type = alert.vital_type
-    
-    # Mark all unacknowledged alerts of the same type for this patient as acknowledged
-    related_alerts = Alert.query.filter_by(
-        patient_id=patient_id,
-        vital_type=vital_type,
-        acknowledged=False
-    ).all()
-    
-    for related_alert in related_alerts:
-        related_alert.acknowledged = True
-    
-    # Also clear the corresponding alert flag on the patient
-    patient = db.session.get(Patient, patient_id)
-    if patient:
-        if vital_type == 'heart_rate':
-            patient.heart_rate_alert = False
-        elif vital_type == 'spo2':
-            patient.spo2_alert = False
-        elif vital_type == 'temp':
-            patient.temp_alert = False
-    
-    db.session.commit()
-    
-    # Return success response
-    return jsonify({"success": True, "message": f"All alerts for {patient.name} ({vital_type}) acknowledged"})
+    with use_shard(shard_for_alert(alert_id)):
+        alert = db.session.get(Alert, alert_id)
+        if not alert:
+            return jsonify({"success": False, "message": "Alert not found"})
+        
+        # Get patient and vital type information
+        patient_id = alert.patient_id
+        vital_type = alert.vital_type
+        
+        # Mark all unacknowledged alerts of the same type for this patient as acknowledged
+        related_alerts = Alert.query.filter_by(
+            patient_id=patient_id,
+            vital_type=vital_type,
+            acknowledged=False
+        ).all()
+        
+        now = datetime.now()
+        for related_alert in related_alerts:
+            related_alert.acknowledged = True
+            related_alert.acknowledged_at = now
+        count_acknowledged([rollup_key(related_alert) for related_alert in related_alerts], now)
+        record_changes([ack_change(related_alert, now) for related_alert in related_alerts])
+        
+        # Also clear the corresponding alert flag on the patient
+        patient = db.session.get(Patient, patient_id)
+        if patient:
+            clear_alert_flags([patient_id], vital_type)
+        
+        db.session.commit()
+        
+        # Return success response
+        return jsonify({"success": True, "message": f"All alerts for {patient.name} ({vital_type}) acknowledged"})
 
 # Initialize the database when in development mode
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        create_shard_tables()
     app.run(debug=True)
 
 # For Vercel serverless function
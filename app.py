@@ -1,21 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, url_for, flash, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from datetime import datetime, timedelta
 import os
 import random
 from db import db
 from models import User, Patient, Alert
+from utils.alert_index import alert_index, init_alert_index
+from utils.alert_rollups import DEFAULT_STATS_HOURS, alert_stats, count_acknowledged, count_raised, rollup_key
+from utils.change_feed import (DEFAULT_LIMIT, MAX_WAIT_SECONDS, ack_change, alert_change, head_cursor,
+                               record_changes, vitals_changes, wait_for_changes)
+from utils.cold_storage import cold_store
+from utils.escalation import init_escalation
+from utils.export import EXPORT_FORMATS, EXPORT_TABLES, parse_timestamp, stream_export
+from utils.flight_recorder import init_flight_recorder, span
+from utils.metrics import init_metrics, READINGS_INGESTED, ALERTS_CREATED, VITALS_REGENERATION_RUNS
+from utils.patient_rows import patient_rows
+from utils.patient_status import clear_alert_flags, status_row, upsert_status
+from utils.shards import (configure_shards, create_patient, create_shard_tables, each_shard,
+                          group_by_shard, shard_engines, shard_for_alert, shard_for_patient, use_shard)
+from utils.sparklines import init_sparklines
+from utils.threshold_profiles import evaluator_for, init_threshold_profiles, threshold_profiles
+from utils.vitals import VITALS, init_vitals, simulated_value
 from werkzeug.security import generate_password_hash
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///patients.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-for-testing')
+app.config['COLD_STORAGE_DIR'] = os.environ.get('COLD_STORAGE_DIR')
 
 # Initialize extensions
+configure_shards(app)
 db.init_app(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+init_metrics(app)
+init_flight_recorder(app, view_decorator=login_required)
+init_alert_index(app)
+init_escalation(app)
+sparklines = init_sparklines(app)
+init_vitals(app)
+init_threshold_profiles(app)
+
+# Alerts shown on the queue page, worst first
+ALERTS_QUEUE_LIMIT = 200
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -30,18 +58,12 @@ def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
         return ""
     return value.strftime(format)
 
-# Define vital sign thresholds
-THRESHOLDS = {
-    'heart_rate': {'min': 60, 'max': 100},
-    'spo2': {'min': 95, 'max': 100},
-    'temp': {'min': 36.5, 'max': 37.5}
-}
-
 @app.route('/')
 def index():
     """Redirect to patients list."""
     return redirect(url_for('patients'))
 
+@span('generate_fresh_vitals')
 def generate_fresh_vitals(force_update=False):
     """Generate fresh vitals for all patients if needed.
     
@@ -49,7 +71,7 @@ def generate_fresh_vitals(force_update=False):
         tuple: (all_patients, current_time, vitals_updated)
         where vitals_updated indicates whether new vitals were generated
     """
-    all_patients = Patient.query.all()
+    all_patients = patient_rows()
     current_time = datetime.now()
     vitals_updated = False
     
@@ -63,12 +85,21 @@ def generate_fresh_vitals(force_update=False):
     should_update = force_update or time_threshold_passed
     
     if should_update:
-        for patient in all_patients:
-            has_alerts = generate_vitals_for_patient(patient, current_time)
-            patient.current_risk = has_alerts
-            db.session.add(patient)
-        db.session.commit()
+        profiles = threshold_profiles()
+        if profiles is not None:
+            # Look up the wards for threshold profiles in one query per shard
+            profiles.prepare([patient.id for patient in all_patients])
+        # Only the narrow patient_status rows are rewritten, one upsert and
+        # commit per shard
+        for key, shard_patients in group_by_shard(all_patients, lambda p: p.id).items():
+            with use_shard(key):
+                statuses = [generate_vitals_for_patient(patient, current_time) for patient in shard_patients]
+                upsert_status(statuses)
+                record_changes(vitals_changes(statuses))
+                db.session.commit()
+        all_patients = patient_rows()
         vitals_updated = True
+        VITALS_REGENERATION_RUNS.inc()
     
     return all_patients, current_time, vitals_updated
 
@@ -79,141 +110,76 @@ def patients():
     # Generate new vitals if needed or requested
     should_update = request.args.get('generate') == 'true'
     all_patients, current_time, _ = generate_fresh_vitals(force_update=should_update)
+    sparklines.warm([patient.id for patient in all_patients])
     
     # Check if this is an HTMX request
     if request.headers.get('HX-Request'):
         # Return only the tbody content for HTMX refresh
-        return render_template('table_content.html', patients=all_patients, now=current_time)
+        return render_template('table_content.html', patients=all_patients, now=current_time,
+                               sparklines=sparklines)
     
     # Return the full page for normal requests
-    return render_template('patients.html', patients=all_patients, now=current_time)
+    return render_template('patients.html', patients=all_patients, now=current_time, sparklines=sparklines)
 
 def generate_vitals_for_patient(patient, timestamp):
-    """Generate vital signs for a patient."""
-    # Track if any vital sign alerts need to be created
-    new_alerts = []
-    
-    # 30% chance of abnormal vitals
+    """Generate vital signs for a patient.
+
+    Returns:
+        dict: The patient's new patient_status row
+    """
+    values = {vital.name: simulated_value(vital) for vital in VITALS}
+    # 30% chance of one abnormal vital sign
     if random.random() < 0.3:
-        # Choose which vital to make abnormal
-        risk_type = random.choice(['heart_rate', 'spo2', 'temp'])
-        
-        if risk_type == 'heart_rate':
-            # Either too high or too low heart rate
-            heart_rate = random.choice([
-                random.randint(40, 59),  # Too low
-                random.randint(101, 140)  # Too high
-            ])
-            patient.heart_rate = heart_rate
-            patient.heart_rate_alert = True
-            
-            # Determine threshold violation and create an alert
-            if heart_rate < 60:
-                threshold_str = f">= 60"
-            else:
-                threshold_str = f"<= 100"
-            
-            new_alerts.append(Alert(
-                patient_id=patient.id,
-                vital_type='heart_rate',
-                value=heart_rate,
-                threshold=threshold_str,
-                timestamp=timestamp,
-                acknowledged=False
-            ))
-        else:
-            patient.heart_rate = random.randint(60, 100)
-            patient.heart_rate_alert = False
-            
-        if risk_type == 'spo2':
-            spo2 = round(random.uniform(85, 94), 1)
-            patient.spo2 = spo2
-            patient.spo2_alert = True
-            
-            # Create an alert for low SpO2
-            new_alerts.append(Alert(
-                patient_id=patient.id,
-                vital_type='spo2',
-                value=spo2,
-                threshold=f">= 95",
-                timestamp=timestamp,
-                acknowledged=False
-            ))
-        else:
-            patient.spo2 = round(random.uniform(95, 100), 1)
-            patient.spo2_alert = False
-            
-        if risk_type == 'temp':
-            # Either too high or too low temperature
-            temp_choice = random.choice([0, 1])
-            if temp_choice == 0:
-                temp = round(random.uniform(35, 36.4), 1)  # Too low
-                threshold_str = f">= 36.5"
-            else:
-                temp = round(random.uniform(37.6, 39), 1)  # Too high
-                threshold_str = f"<= 37.5"
-                
-            patient.temp = temp
-            patient.temp_alert = True
-            
-            # Create an alert for abnormal temperature
-            new_alerts.append(Alert(
-                patient_id=patient.id,
-                vital_type='temp',
-                value=temp,
-                threshold=threshold_str,
-                timestamp=timestamp,
-                acknowledged=False
-            ))
-        else:
-            patient.temp = round(random.uniform(36.5, 37.5), 1)
-            patient.temp_alert = False
-    else:
-        # Normal vitals
-        patient.heart_rate = random.randint(60, 100)
-        patient.spo2 = round(random.uniform(95, 100), 1)
-        patient.temp = round(random.uniform(36.5, 37.5), 1)
-        
-        patient.heart_rate_alert = False
-        patient.spo2_alert = False
-        patient.temp_alert = False
-    
-    patient.vitals_updated = timestamp
-    
-    # Add all new alerts to the session
+        vital = random.choice(VITALS)
+        values[vital.name] = simulated_value(vital, abnormal=True)
+
+    sparklines.add(patient.id, timestamp, values)
+
+    # Alerts are classified like ingested readings, with the patient's threshold profile
+    new_alerts = [
+        Alert(patient_id=patient.id, vital_type=vital_type, value=value, threshold=threshold_str,
+              severity=severity, timestamp=timestamp, acknowledged=False)
+        for vital_type, value, severity, threshold_str in evaluator_for(patient.id).classify(values)
+    ]
     for alert in new_alerts:
         db.session.add(alert)
-    
-    # Return whether the patient has any alerts
-    return len(new_alerts) > 0
+        ALERTS_CREATED.inc(severity=alert.severity)
+    count_raised([rollup_key(alert) for alert in new_alerts], rooms={patient.id: patient.room})
+    if new_alerts:
+        db.session.flush()  # Assigns the alert ids for the change feed
+        record_changes([alert_change(alert) for alert in new_alerts])
+    READINGS_INGESTED.inc()
+    
+    # Alert flags are set for the vitals that raised alerts
+    return status_row(patient.id, timestamp, values, {alert.vital_type for alert in new_alerts})
 
 @app.route('/acknowledge/<int:patient_id>/<string:vital_type>', methods=['POST'])
 @login_required
 def acknowledge_alert(patient_id, vital_type):
     """Acknowledge a vital sign alert."""
-    patient = db.session.get(Patient, patient_id)
-    if not patient:
-        flash('Patient not found', 'danger')
-        return redirect(url_for('patients'))
-    
-    if vital_type == 'heart_rate':
-        patient.heart_rate_alert = False
-    elif vital_type == 'spo2':
-        patient.spo2_alert = False
-    elif vital_type == 'temp':
-        patient.temp_alert = False
-    
-    # Also mark any corresponding alerts in the Alert table as acknowledged
-    alerts = Alert.query.filter_by(
-        patient_id=patient_id, 
-        vital_type=vital_type,
-        acknowledged=False
-    ).all()
-    
-    for alert in alerts:
-        alert.acknowledged = True
-    
-    db.session.commit()
+    with use_shard(shard_for_patient(patient_id)):
+        patient = db.session.get(Patient, patient_id)
+        if not patient:
+            flash('Patient not found', 'danger')
+            return redirect(url_for('patients'))
+        
+        clear_alert_flags([patient_id], vital_type)
+        
+        # Also mark any corresponding alerts in the Alert table as acknowledged
+        alerts = Alert.query.filter_by(
+            patient_id=patient_id, 
+            vital_type=vital_type,
+            acknowledged=False
+        ).all()
+        
+        now = datetime.now()
+        for alert in alerts:
+            alert.acknowledged = True
+            alert.acknowledged_at = now
+        count_acknowledged([rollup_key(alert) for alert in alerts], now, rooms={patient.id: patient.room})
+        record_changes([ack_change(alert, now) for alert in alerts])
+        
+        db.session.commit()
     
     return redirect(url_for('patients'))
 
@@ -254,56 +220,53 @@ def alerts_queue():
     force_update = request.args.get('generate') == 'true'
     _, current_time, vitals_updated = generate_fresh_vitals(force_update=force_update)
     
-    # Get all unacknowledged alerts, ordered by timestamp (newest first)
-    alerts = Alert.query.filter_by(acknowledged=False).order_by(Alert.timestamp.desc()).all()
-    
-    # Get patient information for each alert
-    patients_dict = {}
-    for alert in alerts:
-        if alert.patient_id not in patients_dict:
-            patients_dict[alert.patient_id] = Patient.query.get(alert.patient_id)
+    # Worst unacknowledged alerts first (critical, then oldest), from the in-memory index
+    index = alert_index()
+    alerts = index.top(ALERTS_QUEUE_LIMIT)
+    patients_dict = index.patients_for(alerts)
+    total = len(index)
     
     # Check if this is a request for just the fragment
     if request.args.get('fragment') == 'true':
-        return render_template('_alerts_table.html', alerts=alerts, patients=patients_dict, now=current_time)
+        return render_template('_alerts_table.html', alerts=alerts, patients=patients_dict, total=total, now=current_time)
     
-    return render_template('alerts.html', alerts=alerts, patients=patients_dict, now=current_time)
+    return render_template('alerts.html', alerts=alerts, patients=patients_dict, total=total, now=current_time)
 
 @app.route('/acknowledge_from_queue/<int:alert_id>', methods=['POST'])
 @login_required
 def acknowledge_from_queue(alert_id):
     """Acknowledge an alert from the alerts queue."""
-    alert = db.session.get(Alert, alert_id)
-    if not alert:
-        flash('Alert not found', 'danger')
-        return redirect(url_for('alerts_queue'))
-    
-    # Get patient and vital type information
-    patient_id = alert.patient_id
-    vital_type = alert.vital_type
-    
-    # Mark all unacknowledged alerts of the same type for this patient as acknowledged
-    related_alerts = Alert.query.filter_by(
-        patient_id=patient_id,
-        vital_type=vital_type,
-        acknowledged=False
-    ).all()
-    
-    for related_alert in related_alerts:
-        related_alert.acknowledged = True
-    
-    # Also clear the corresponding alert flag on the patient
-    patient = db.session.get(Patient, patient_id)
-    if patient:
-        if vital_type == 'heart_rate':
-            patient.heart_rate_alert = False
-        elif vital_type == 'spo2':
-            patient.spo2_alert = False
-        elif vital_type == 'temp':
-            patient.temp_alert = False
-    
-    db.session.commit()
-    flash(f'Alert for {patient.name} ({vital_type}) acknowledged', 'success')
+    with use_shard(shard_for_alert(alert_id)):
+        alert = db.session.get(Alert, alert_id)
+        if not alert:
+            flash('Alert not found', 'danger')
+            return redirect(url_for('alerts_queue'))
+        
+        # Get patient and vital type information
+        patient_id = alert.patient_id
+        vital_type = alert.vital_type
+        
+        # Mark all unacknowledged alerts of the same type for this patient as acknowledged
+        related_alerts = Alert.query.filter_by(
+            patient_id=patient_id,
+            vital_type=vital_type,
+            acknowledged=False
+        ).all()
+        
+        now = datetime.now()
+        for related_alert in related_alerts:
+            related_alert.acknowledged = True
+            related_alert.acknowledged_at = now
+        count_acknowledged([rollup_key(related_alert) for related_alert in related_alerts], now)
+        record_changes([ack_change(related_alert, now) for related_alert in related_alerts])
+        
+        # Also clear the corresponding alert flag on the patient
+        patient = db.session.get(Patient, patient_id)
+        if patient:
+            clear_alert_flags([patient_id], vital_type)
+        
+        db.session.commit()
+        flash(f'Alert for {patient.name} ({vital_type}) acknowledged', 'success')
     
     return redirect(url_for('alerts_queue'))
 
@@ -311,44 +274,102 @@ def acknowledge_from_queue(alert_id):
 @login_required
 def acknowledge_all_alerts():
     """Acknowledge all unacknowledged alerts at once."""
-    # Get all unacknowledged alerts
-    unacknowledged_alerts = Alert.query.filter_by(acknowledged=False).all()
-    
-    if not unacknowledged_alerts:
-        flash('No alerts to acknowledge', 'info')
-        return redirect(url_for('alerts_queue'))
-    
-    # Track which patients and vital types we've processed
-    processed = {}  # Format: {patient_id: set(vital_types)}
     count = 0
     
-    # Mark all alerts as acknowledged
-    for alert in unacknowledged_alerts:
-        alert.acknowledged = True
-        count += 1
+    # Each shard is acknowledged in its own transaction
+    for _ in each_shard():
+        # Get all unacknowledged alerts
+        unacknowledged_alerts = Alert.query.filter_by(acknowledged=False).all()
+        
+        # Track which patients we've processed per vital type
+        processed = {}  # Format: {vital_type: set(patient_ids)}
+        
+        # Mark all alerts as acknowledged
+        now = datetime.now()
+        for alert in unacknowledged_alerts:
+            alert.acknowledged = True
+            alert.acknowledged_at = now
+            count += 1
+            
+            # Track which patient/vital type combinations we've seen
+            processed.setdefault(alert.vital_type, set()).add(alert.patient_id)
         
-        # Track which patient/vital type combinations we've seen
-        if alert.patient_id not in processed:
-            processed[alert.patient_id] = set()
-        processed[alert.patient_id].add(alert.vital_type)
+        # Reset alert flags on patients, one UPDATE per vital type
+        for vital_type, patient_ids in processed.items():
+            clear_alert_flags(patient_ids, vital_type)
+        count_acknowledged([rollup_key(alert) for alert in unacknowledged_alerts], now)
+        record_changes([ack_change(alert, now) for alert in unacknowledged_alerts])
+        
+        db.session.commit()
     
-    # Reset alert flags on patients
-    for patient_id, vital_types in processed.items():
-        patient = db.session.get(Patient, patient_id)
-        if patient:
-            for vital_type in vital_types:
-                if vital_type == 'heart_rate':
-                    patient.heart_rate_alert = False
-                elif vital_type == 'spo2':
-                    patient.spo2_alert = False
-                elif vital_type == 'temp':
-                    patient.temp_alert = False
+    if not count:
+        flash('No alerts to acknowledge', 'info')
+        return redirect(url_for('alerts_queue'))
     
-    db.session.commit()
     flash(f'All {count} alerts acknowledged', 'success')
     
     return redirect(url_for('alerts_queue'))
 
+def _alert_stats_from_request():
+    return alert_stats(request.args.get('hours', DEFAULT_STATS_HOURS, type=int), request.args.get('room') or None)
+
+@app.route('/alerts/stats')
+@login_required
+def alert_stats_view():
+    """Display alert counts and mean time to acknowledge, from the hourly rollups."""
+    return render_template('alert_stats.html', stats=_alert_stats_from_request())
+
+@app.route('/alerts/stats.json')
+@login_required
+def alert_stats_json():
+    """Export the alert statistics shown on /alerts/stats as JSON."""
+    return jsonify(_alert_stats_from_request())
+
+@app.route('/changes.json')
+@login_required
+def changes_json():
+    """Return the change feed after ?cursor=, waiting up to ?wait= seconds for new changes.
+
+    cursor=head skips the existing entries and waits for new ones.
+    """
+    cursor = request.args.get('cursor', '')
+    try:
+        if cursor == 'head':
+            cursor = head_cursor()
+        page = wait_for_changes(cursor,
+                                timeout=min(request.args.get('wait', 0, type=float), MAX_WAIT_SECONDS),
+                                limit=request.args.get('limit', DEFAULT_LIMIT, type=int))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify(page)
+
+@app.route('/export/<string:dataset>')
+@login_required
+def export_history(dataset):
+    """Stream vital sign or alert history as CSV, NDJSON or Parquet.
+
+    Query parameters: format (csv, ndjson, parquet), patient_id, and start/end
+    as ISO 8601 timestamps (start inclusive, end exclusive).
+    """
+    fmt = request.args.get('format', 'csv')
+    if dataset not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        abort(404)
+    
+    try:
+        patient_id = request.args.get('patient_id', type=int)
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'))
+        chunks = stream_export(shard_engines(), dataset, fmt, patient_id, start, end, cold=cold_store())
+    except (ValueError, RuntimeError) as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+    
+    filename = f"{dataset}.{fmt}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 def create_sample_data():
     """Create sample patients and users."""
     # Create attender user if it doesn't exist
@@ -360,27 +381,31 @@ def create_sample_data():
         )
         db.session.add(attender)
     
+    db.session.commit()
+    
     # Create patients if they don't exist
-    if db.session.query(Patient).count() == 0:
+    if not patient_rows():
         patients = [
-            Patient(name="John Smith", room="101"),
-            Patient(name="Sarah Johnson", room="102"),
-            Patient(name="Michael Williams", room="103"),
-            Patient(name="Emma Brown", room="104"),
-            Patient(name="James Davis", room="105"),
-            Patient(name="Olivia Miller", room="106")
+            ("John Smith", "101"),
+            ("Sarah Johnson", "102"),
+            ("Michael Williams", "103"),
+            ("Emma Brown", "104"),
+            ("James Davis", "105"),
+            ("Olivia Miller", "106")
         ]
         
-        # Initialize vital signs for each patient
+        # Add each patient to its ward's shard and initialize its vital signs
         current_time = datetime.now()
-        for patient in patients:
-            generate_vitals_for_patient(patient, current_time)
-            db.session.add(patient)
-    
-    db.session.commit()
+        for name, room in patients:
+            patient, key = create_patient(name, room)
+            with use_shard(key):
+                statuses = [generate_vitals_for_patient(patient, current_time)]
+                upsert_status(statuses)
+                record_changes(vitals_changes(statuses))
+                db.session.commit()
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        create_shard_tables()
         create_sample_data()
     app.run(debug=True, port=5001) 
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""
+Seal vital signs older than the retention window into cold storage.
+
+Each patient's readings from each whole day before the cutoff are written
+as an immutable columnar segment under COLD_STORAGE_DIR and deleted from
+the vital_sign table. Exports still include them. Re-running after an
+interruption picks up where it stopped.
+
+Usage:
+    COLD_STORAGE_DIR=cold python archive_vitals.py
+    python archive_vitals.py --dir cold --days 90
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from app import app
+from utils.cold_storage import DEFAULT_RETENTION_DAYS, ColdStore, seal_vitals
+
+def archive_vitals(root, days=DEFAULT_RETENTION_DAYS, verbose=False):
+    """Seal readings older than ``days`` days into ``root``, printing progress."""
+    started = time.perf_counter()
+    before = datetime.now() - timedelta(days=days)
+
+    def report(patient_id, day, rows):
+        if verbose:
+            print(f"  patient {patient_id} {day}: {rows} rows sealed")
+
+    with app.app_context():
+        moved = seal_vitals(ColdStore(root), before, report)
+
+    print(f"Moved {moved} readings before {before:%Y-%m-%d} to {root} in {time.perf_counter() - started:.1f}s.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old vital signs into cold storage.")
+    parser.add_argument('--dir', default=app.config.get('COLD_STORAGE_DIR'),
+                        help="Cold storage directory (default: $COLD_STORAGE_DIR)")
+    parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS,
+                        help="Keep this many days of readings in the database")
+    parser.add_argument('--verbose', action='store_true', help="Print each sealed segment")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("set COLD_STORAGE_DIR or pass --dir")
+    archive_vitals(args.dir, args.days, args.verbose)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark cold-start latency of the serverless entry point.
+
+Each run starts a fresh Python process, imports api/index.py and serves one
+patient card refresh (GET /status/<id>), reporting the time from the start of
+the import to the first response. Runs are repeated with cold-start mode off
+and on so the effect of precompiled templates can be compared.
+
+Usage:
+    python bench_cold_start.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Executed in a fresh interpreter for every run
+CHILD_SCRIPT = """
+import time
+start = time.perf_counter()
+import api.index
+imported = time.perf_counter()
+response = api.index.app.test_client().get('/status/1')
+done = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(imported - start, done - imported)
+"""
+
+def create_database(path):
+    """Create a database with one patient for the benchmark to render."""
+    from flask import Flask
+    from db import db
+    from models import Patient, PatientStatus
+    from datetime import datetime
+
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(bench_app)
+    with bench_app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Bench Patient", room="101"))
+        db.session.add(PatientStatus(patient_id=1, heart_rate=72, spo2=98.0, temp=36.8,
+                                     vitals_updated=datetime.now()))
+        db.session.commit()
+
+def run_once(env):
+    """Run one cold start and return (import_seconds, first_response_seconds)."""
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=ROOT_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    import_time, response_time = (float(x) for x in output.split())
+    return import_time, response_time
+
+def bench_cold_start(runs=10):
+    """Measure import-to-first-response time with cold-start mode off and on."""
+    with tempfile.TemporaryDirectory() as tmp:
+        create_database(os.path.join(tmp, 'bench.db'))
+        base_env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        base_env.pop('VERCEL', None)
+
+        for mode in ('0', '1'):
+            env = dict(base_env, COLD_START_MODE=mode,
+                       TMPDIR=os.path.join(tmp, f'cache-{mode}'))
+            os.makedirs(env['TMPDIR'])
+            results = [run_once(env) for _ in range(runs)]
+            imports = [r[0] * 1000 for r in results]
+            totals = [(r[0] + r[1]) * 1000 for r in results]
+            print(f"COLD_START_MODE={mode}: "
+                  f"import {statistics.median(imports):.1f} ms, "
+                  f"import-to-first-response {statistics.median(totals):.1f} ms "
+                  f"(median of {runs})")
+
+if __name__ == "__main__":
+    bench_cold_start(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -10,10 +10,11 @@ def check_db():
     with app.app_context():
         # Check Alert table
         print("Alert table contents:")
-        alerts = Alert.query.all()
-        print(f"Total alerts: {len(alerts)}")
+        # Count in SQL and only load the rows we print
+        print(f"Total alerts: {Alert.query.count()}")
+        alerts = Alert.query.order_by(Alert.id).limit(5).all()
         
-        for i, alert in enumerate(alerts[:5]):  # Show just the first 5
+        for i, alert in enumerate(alerts):  # Show just the first 5
             print(f"Alert {i+1}:")
             print(f"  Patient ID: {alert.patient_id}")
             print(f"  Vital type: {alert.vital_type}")
@@ -21,10 +22,10 @@ def check_db():
             print(f"  Acknowledged: {alert.acknowledged}")
         
         # Check Patient table
-        patients = Patient.query.all()
-        print(f"\nTotal patients: {len(patients)}")
+        print(f"\nTotal patients: {Patient.query.count()}")
+        patients = Patient.query.order_by(Patient.id).limit(3).all()
         
-        for i, patient in enumerate(patients[:3]):  # Show just the first 3
+        for i, patient in enumerate(patients):  # Show just the first 3
             print(f"Patient {i+1}: {patient.name}")
             print(f"  Room: {patient.room}")
             print(f"  Heart rate alert: {patient.heart_rate_alert}")
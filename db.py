@@ -1,3 +1,19 @@
+from contextvars import ContextVar
+
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+# Bind key of the shard the session is routed to (None: the default database).
+# Set with utils.shards.use_shard.
+current_shard = ContextVar('current_shard', default=None)
+
+class ShardSession(Session):
+    """Session that sends every statement to the current shard, if one is set."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = current_shard.get()
+        if bind is None and shard is not None:
+            return self._db.engines[shard]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 
-db = SQLAlchemy() 
\ No newline at end of file
+db = SQLAlchemy(session_options={'class_': ShardSession})
@@ -0,0 +1,56 @@
+"""
+Export vital sign or alert history as CSV, NDJSON or Parquet.
+
+Rows are streamed from the database (every shard) in chunks, so exports of
+any size run in constant memory. Vital signs sealed into COLD_STORAGE_DIR by
+archive_vitals.py are included.
+
+Usage:
+    python export_data.py vitals --patient 3 --start 2024-01-01 --end 2024-02-01 > vitals.csv
+    python export_data.py alerts --format ndjson --output alerts.ndjson
+    python export_data.py vitals --format parquet --output vitals.parquet
+"""
+
+import argparse
+import sys
+
+from app import app
+from utils.cold_storage import cold_store
+from utils.export import EXPORT_FORMATS, EXPORT_TABLES, DEFAULT_CHUNK_SIZE, parse_timestamp, stream_export
+from utils.shards import shard_engines
+
+def export_data(dataset, fmt='csv', patient_id=None, start=None, end=None,
+                output=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write an export of ``dataset`` to ``output`` (stdout if not given)."""
+    with app.app_context():
+        chunks = stream_export(shard_engines(), dataset, fmt, patient_id, start, end, chunk_size,
+                               cold=cold_store())
+        if fmt == 'parquet':
+            if output is None:
+                raise SystemExit("Parquet export needs --output")
+            with open(output, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        elif output is None:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export vital sign or alert history.")
+    parser.add_argument('dataset', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--format', dest='fmt', choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--patient', type=int, help="Only export this patient ID")
+    parser.add_argument('--start', type=parse_timestamp, help="Inclusive start (ISO 8601)")
+    parser.add_argument('--end', type=parse_timestamp, help="Exclusive end (ISO 8601)")
+    parser.add_argument('--output', help="Output file (default: stdout)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    export_data(args.dataset, args.fmt, args.patient, args.start, args.end,
+                args.output, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
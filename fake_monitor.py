@@ -0,0 +1,83 @@
+"""
+Fake bedside monitors for testing the device gateway.
+
+Opens one persistent connection per simulated monitor and streams readings
+at a fixed rate, mostly within normal ranges with occasional abnormal ones.
+Readings carry every vital sign in the registry (utils.vitals).
+
+Usage:
+    python fake_monitor.py --devices 1000 --rate 1 --count 60
+    python fake_monitor.py --devices 10 --format line --port 9000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from utils.vitals import VITALS, simulated_value
+
+def fake_reading(patient_id, rng=random):
+    """Return a random reading for a patient (10% abnormal)."""
+    reading = {'patient_id': patient_id}
+    reading.update((vital.name, simulated_value(vital, rng=rng)) for vital in VITALS)
+    if rng.random() < 0.1:
+        vital = rng.choice(VITALS)
+        reading[vital.name] = simulated_value(vital, abnormal=True, rng=rng)
+    return reading
+
+def encode_reading(reading, fmt='json'):
+    """Encode a reading as one JSON or line-protocol line."""
+    if fmt == 'json':
+        return (json.dumps(reading) + '\n').encode('utf-8')
+    fields = ','.join(f"{vital.name}={reading[vital.name]}" for vital in VITALS
+                      if reading.get(vital.name) is not None)
+    return f"vitals,patient_id={reading['patient_id']} {fields}\n".encode('utf-8')
+
+async def run_monitor(host, port, patient_id, count, rate, fmt='json', readings=None):
+    """Stream ``count`` readings for one patient over a single connection.
+
+    Args:
+        readings: Optional list of readings to send instead of random ones
+        rate: Readings per second (0 sends as fast as possible)
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(count):
+            reading = readings[i] if readings is not None else fake_reading(patient_id)
+            writer.write(encode_reading(reading, fmt))
+            # Respects TCP flow control when the gateway applies backpressure
+            await writer.drain()
+            if rate:
+                await asyncio.sleep(1 / rate)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def run_monitors(host, port, devices, count, rate, fmt='json', first_patient_id=1):
+    """Run ``devices`` monitors concurrently, one per patient."""
+    await asyncio.gather(*(
+        run_monitor(host, port, first_patient_id + i, count, rate, fmt)
+        for i in range(devices)
+    ))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate bedside monitors.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--count', type=int, default=60, help="Readings per device")
+    parser.add_argument('--rate', type=float, default=1.0, help="Readings per second per device")
+    parser.add_argument('--format', dest='fmt', choices=['json', 'line'], default='json')
+    parser.add_argument('--first-patient-id', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    asyncio.run(run_monitors(args.host, args.port, args.devices, args.count, args.rate,
+                             args.fmt, args.first_patient_id))
+    total = args.devices * args.count
+    elapsed = time.perf_counter() - started
+    print(f"Sent {total} readings from {args.devices} monitors in {elapsed:.1f}s ({total / elapsed:,.0f}/s).")
+
+if __name__ == "__main__":
+    main()
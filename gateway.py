@@ -0,0 +1,182 @@
+"""
+asyncio gateway for bedside monitors.
+
+Monitors keep a persistent TCP connection open and send one reading per
+line, either as JSON or in line protocol:
+
+    {"patient_id": 3, "heart_rate": 72, "spo2": 97.5, "temp": 36.9}
+    vitals,patient_id=3 heart_rate=72,spo2=97.5,temp=36.9
+
+Lines are parsed as they arrive and put on a bounded queue. A single writer
+takes whatever has accumulated as a micro-batch and hands it to the same
+ingest logic as POST /update (utils.ingest.ingest_readings), with one commit
+per batch. As for /update, only readings that were not stored are retried
+(utils.ingest_queue.ingest_with_retry), so a failed batch never stores a
+reading twice. Because there is one queue and one writer, each device's
+readings are stored in the order they were sent. When the queue is full,
+connections stop being read, so TCP flow control slows the monitors down
+instead of the gateway buffering without bound.
+
+Malformed lines are answered with "ERR <reason>" and skipped.
+
+Usage:
+    python gateway.py --port 9000 --batch-size 500
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.ingest_queue import ingest_with_retry, validate_reading
+
+logger = logging.getLogger('gateway')
+
+def parse_reading(line):
+    """Parse one JSON or line-protocol reading.
+
+    Returns:
+        dict: patient_id plus any registered vital signs (see
+            utils.ingest_queue.validate_reading)
+
+    Raises:
+        ValueError: If the line is not a valid reading
+    """
+    text = line.decode('utf-8').strip()
+    if text.startswith('{'):
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+    else:
+        # measurement,tag=value field=value,field=value [timestamp]
+        parts = text.split(' ')
+        if len(parts) < 2:
+            raise ValueError("expected 'measurement,tags fields'")
+        data = {}
+        for pair in parts[0].split(',')[1:] + parts[1].split(','):
+            key, sep, value = pair.partition('=')
+            if not sep:
+                raise ValueError(f"bad field {pair!r}")
+            data[key] = value
+
+    return validate_reading(data)
+
+class DeviceGateway:
+    """TCP server that batches device readings into ingest calls.
+
+    Args:
+        ingest: Callable taking a list of reading dicts, run in a worker
+            thread (e.g. ingest_in_app(app)); see ingest_with_retry
+        batch_size: Maximum readings per ingest call
+        queue_size: Readings buffered before connections are paused
+        linger: Seconds to wait for more readings when a batch is not full
+    """
+
+    def __init__(self, ingest, batch_size=500, queue_size=10000, linger=0.005):
+        self.ingest = ingest
+        self.batch_size = batch_size
+        self.linger = linger
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = {'connections': 0, 'readings': 0, 'batches': 0,
+                      'parse_errors': 0, 'dropped': 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+        self._server = None
+        self._writer_task = None
+
+    async def start(self, host='0.0.0.0', port=9000):
+        """Start listening and return the bound (host, port)."""
+        self._writer_task = asyncio.create_task(self._batch_writer())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        """Stop accepting readings and flush everything already queued."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.queue.join()
+        self._writer_task.cancel()
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    reading = parse_reading(line)
+                except (ValueError, TypeError) as e:
+                    self.stats['parse_errors'] += 1
+                    writer.write(f"ERR {e}\n".encode('utf-8'))
+                    await writer.drain()
+                    continue
+                # Blocks while the queue is full, which stops reading from
+                # this connection until the writer catches up
+                await self.queue.put(reading)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats['connections'] -= 1
+            writer.close()
+
+    def _drain_queue(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _batch_writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            self._drain_queue(batch)
+            if len(batch) < self.batch_size and self.linger:
+                await asyncio.sleep(self.linger)
+                self._drain_queue(batch)
+
+            # Retries run in the worker thread, which also holds back the next batch
+            errors = await loop.run_in_executor(self._executor, ingest_with_retry, self.ingest, batch)
+            self.stats['dropped'] += sum(error is not None for error in errors)
+
+            self.stats['readings'] += len(batch)
+            self.stats['batches'] += 1
+            for _ in batch:
+                self.queue.task_done()
+
+async def serve(host, port, batch_size, queue_size):
+    from api.index import app, setup_app
+    from utils.ingest import ingest_in_app
+
+    setup_app()
+
+    gateway = DeviceGateway(ingest_in_app(app), batch_size, queue_size)
+    host, port = await gateway.start(host, port)
+    logger.info("Listening for monitors on %s:%d", host, port)
+    while True:
+        await asyncio.sleep(10)
+        stats = gateway.stats
+        logger.info("%d connections, %d readings in %d batches, queue %d, %d parse errors, %d dropped",
+                    stats['connections'], stats['readings'], stats['batches'], gateway.queue.qsize(),
+                    stats['parse_errors'], stats['dropped'])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gateway for bedside monitor connections.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--queue-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port, args.batch_size, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
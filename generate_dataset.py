@@ -0,0 +1,267 @@
+"""
+Generate a reproducible synthetic dataset at hospital scale.
+
+Each registered vital sign (utils.vitals) is generated. Each patient gets a
+baseline, slow drift shared across their vitals (heart rate and
+temperature rise together while SpO2 falls), a circadian rhythm,
+measurement noise and occasional deterioration episodes that ramp up over a
+few hours and then recover. Series are generated with NumPy a block of
+patients at a time; alerts are classified in bulk with the same thresholds
+as the /update endpoint (including ward and patient profiles), and everything is bulk-loaded into the database,
+each patient in its ward's shard (utils.shards).
+Alternatively the readings can be written to a CSV/NDJSON file in the format
+import_vitals.py reads.
+
+The same seed always produces the same dataset, independent of block size.
+
+Usage:
+    python generate_dataset.py --patients 1000 --days 30 --interval 300 --seed 42
+    python generate_dataset.py --patients 50 --days 7 --output ward_history.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+
+from models import Patient
+from utils.alerting import VITAL_TYPES
+from utils.bulk_import import VITAL_COLUMNS, insert_readings
+from utils.patient_status import status_row, upsert_status
+from utils.shards import ShardRouter, group_by_engine, shard_router, ward_of
+from utils.threshold_profiles import classify_batch_for
+from utils.vitals import VITALS
+
+# Rows generated per block, bounding memory use
+BLOCK_ROWS = 500000
+
+BEDS_PER_WARD = 25
+
+# Hours between the random knots that shape each patient's drift
+DRIFT_KNOT_HOURS = 3
+
+# Expected deterioration episodes per patient per day
+EPISODES_PER_DAY = 0.05
+
+# Per-vital (baseline mean, baseline sd, drift sd, loading on the shared
+# drift, circadian amplitude, noise sd, episode peak change); other
+# registered vitals get a model derived from their ranges (vital_model)
+VITAL_MODEL = {
+    'heart_rate': (78.0, 8.0, 4.0, 6.0, 4.0, 2.0, 35.0),
+    'spo2': (97.6, 0.8, 0.4, -0.6, 0.0, 0.4, -9.0),
+    'temp': (36.9, 0.15, 0.08, 0.1, 0.15, 0.05, 1.9),
+}
+
+def vital_model(vital):
+    """Return the VITAL_MODEL entry for a VitalType.
+
+    Vitals without one are centred in their warning range, and their
+    episodes peak twice as far past the warning limit as the critical one.
+    """
+    if vital.name in VITAL_MODEL:
+        return VITAL_MODEL[vital.name]
+    low, high = vital.warning
+    width = high - low
+    peak = -2 * (low - vital.critical[0]) if vital.lower_bound_only else 2 * (vital.critical[1] - high)
+    return ((low + high) / 2, width / 10, width / 20, 0.0, 0.0, width / 40, peak)
+
+def patient_series(rng, steps, interval):
+    """Generate one patient's vitals as a dict of arrays of length ``steps``.
+
+    Returns:
+        dict: {vital_type: np.ndarray}
+    """
+    hours = np.arange(steps) * (interval / 3600.0)
+
+    # Shared drift: random knots every few hours, linearly interpolated
+    knots = int(hours[-1] // DRIFT_KNOT_HOURS) + 2 if steps else 2
+    knot_hours = np.arange(knots) * DRIFT_KNOT_HOURS
+    shared = np.interp(hours, knot_hours, rng.standard_normal(knots))
+
+    # Deterioration episodes: linear ramp up to the peak, then recovery
+    episode = np.zeros(steps)
+    days = hours[-1] / 24 if steps else 0
+    for _ in range(rng.poisson(EPISODES_PER_DAY * days)):
+        start = rng.uniform(0, hours[-1])
+        rise = rng.uniform(1, 6)
+        recovery = rng.uniform(2, 12)
+        peak = rng.uniform(0.4, 1.0)
+        ramp = np.interp(hours, [start, start + rise, start + rise + recovery], [0, peak, 0],
+                         left=0, right=0)
+        episode = np.maximum(episode, ramp)
+
+    phase = rng.uniform(0, 2 * np.pi)
+    circadian = np.sin(2 * np.pi * hours / 24 + phase)
+
+    series = {}
+    for vital in VITALS:
+        mean, sd, drift_sd, loading, amplitude, noise_sd, episode_peak = vital_model(vital)
+        own_drift = np.interp(hours, knot_hours, rng.standard_normal(knots)) * drift_sd
+        values = (rng.normal(mean, sd) + own_drift + loading * shared + amplitude * circadian
+                  + episode_peak * episode + rng.normal(0, noise_sd, steps))
+        if vital.lower_bound_only:
+            # e.g. SpO2 tops out at 100%
+            values = np.minimum(values, vital.warning[1])
+        series[vital.name] = np.round(values, vital.decimals)
+    return series
+
+def generate_blocks(patient_ids, start, steps, interval, seed):
+    """Yield (patient_ids, timestamps, {vital_type: 2-D array}) blocks."""
+    timestamps = [start + timedelta(seconds=interval * i) for i in range(steps)]
+    streams = np.random.SeedSequence(seed).spawn(len(patient_ids))
+    block_size = max(1, BLOCK_ROWS // max(steps, 1))
+    for offset in range(0, len(patient_ids), block_size):
+        block_ids = patient_ids[offset:offset + block_size]
+        series = [patient_series(np.random.default_rng(stream), steps, interval)
+                  for stream in streams[offset:offset + block_size]]
+        yield block_ids, timestamps, {
+            vital_type: np.stack([s[vital_type] for s in series]) for vital_type in VITAL_TYPES
+        }
+
+def block_readings(block_ids, timestamps, values):
+    """Flatten a block into tuples in VITAL_COLUMNS order (patient_id, timestamp, heart_rate, ...)."""
+    steps = len(timestamps)
+    return list(zip(
+        np.repeat(block_ids, steps).tolist(),
+        timestamps * len(block_ids),
+        *(values[vital_type].ravel().tolist() for vital_type in VITAL_TYPES),
+    ))
+
+def create_patients(engines, count):
+    """Insert ``count`` patients spread over wards and return their IDs.
+
+    As with utils.shards.create_patient, each patient is stored in its
+    ward's shard, with an id that routes to that shard.
+
+    Args:
+        engines: shard_engines(), or a single Engine for all patients
+    """
+    table = Patient.__table__
+    router = shard_router() if isinstance(engines, dict) else ShardRouter()
+    targets = engines if isinstance(engines, dict) else {None: engines}
+    first_id = 1
+    for engine in targets.values():
+        with engine.connect() as conn:
+            first_id = max(first_id, (conn.execute(sa.select(sa.func.max(table.c.id))).scalar() or 0) + 1)
+    # Format: {shard key: next id that routes to it}
+    next_ids = {key: first_id + (router.index(key) - first_id) % len(router) for key in router.keys}
+
+    rows = {}  # Format: {shard key: [patient rows]}
+    ids = []
+    for i in range(count):
+        room = f"W{i // BEDS_PER_WARD + 1:02d}-{i % BEDS_PER_WARD + 1:02d}"
+        key = router.for_ward(ward_of(room))
+        patient_id = next_ids[key]
+        next_ids[key] += len(router)
+        rows.setdefault(key, []).append({'id': patient_id, 'name': f"Synthetic Patient {patient_id:05d}",
+                                         'room': room})
+        ids.append(patient_id)
+    for key, shard_rows in rows.items():
+        with targets[key].begin() as conn:
+            conn.execute(table.insert(), shard_rows)
+    return ids
+
+def latest_state_rows(block_ids, timestamps, values):
+    """Return patient_status rows with each patient's latest vitals and alert flags."""
+    latest = [[values[vital_type][i, -1].item() for vital_type in VITAL_TYPES] for i in range(len(block_ids))]
+    return [
+        status_row(patient_id, timestamps[-1], dict(zip(VITAL_TYPES, row)),
+                   {vital_type for vital_type, _, _, _ in alerts})
+        for patient_id, row, alerts in zip(block_ids, latest, classify_batch_for(block_ids, latest))
+    ]
+
+def generate_to_database(engine, patients, days, interval, seed, acknowledged=True, end=None, report=None):
+    """Generate a dataset and bulk-load it into the database.
+
+    Args:
+        engine: Engine to load into, or shard_engines() to load each
+            patient into its shard
+        report: Optional callback(readings, alerts) with the running totals
+            after each block
+
+    Returns:
+        tuple: (readings, alerts) inserted
+    """
+    steps = int(days * 86400 // interval)
+    end = end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(seconds=interval * (steps - 1))
+
+    patient_ids = create_patients(engine, patients)
+
+    readings = alerts = 0
+    for block_ids, timestamps, values in generate_blocks(patient_ids, start, steps, interval, seed):
+        block = block_readings(block_ids, timestamps, values)
+        statuses = group_by_engine(engine, latest_state_rows(block_ids, timestamps, values))
+        for target, rows in group_by_engine(engine, block, lambda row: row[0]).items():
+            with target.begin() as conn:
+                # Readings and their alerts, classified in bulk
+                alerts += insert_readings(conn, rows, acknowledged)
+                upsert_status(statuses[target], conn)
+        readings += len(block)
+        if report:
+            report(readings, alerts)
+    return readings, alerts
+
+def generate_to_file(path, patients, days, interval, seed, end=None):
+    """Generate a dataset of readings into a CSV or NDJSON file.
+
+    Returns:
+        int: Number of readings written
+    """
+    steps = int(days * 86400 // interval)
+    end = end or datetime.now().replace(microsecond=0)
+    start = end - timedelta(seconds=interval * (steps - 1))
+    patient_ids = list(range(1, patients + 1))
+    is_csv = os.path.splitext(path)[1].lower() == '.csv'
+
+    readings = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f) if is_csv else None
+        if writer:
+            writer.writerow(VITAL_COLUMNS)
+        for block_ids, timestamps, values in generate_blocks(patient_ids, start, steps, interval, seed):
+            rows = [(patient_id, timestamp.isoformat(), *vitals)
+                    for patient_id, timestamp, *vitals in block_readings(block_ids, timestamps, values)]
+            if writer:
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(VITAL_COLUMNS, row))) + '\n' for row in rows)
+            readings += len(rows)
+    return readings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic vitals dataset.")
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--interval', type=int, default=300, help="Seconds between readings")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write readings to a .csv/.ndjson file instead of the database")
+    parser.add_argument('--unacknowledged', action='store_true',
+                        help="Leave generated alerts unacknowledged")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.output:
+        readings = generate_to_file(args.output, args.patients, args.days, args.interval, args.seed)
+        print(f"Wrote {readings} readings to {args.output} in {time.perf_counter() - started:.1f}s.")
+        return
+
+    def report(readings, alerts):
+        print(f"  {readings} readings, {alerts} alerts")
+
+    from app import app
+    from utils.shards import create_shard_tables, shard_engines
+    with app.app_context():
+        create_shard_tables()
+        readings, alerts = generate_to_database(shard_engines(), args.patients, args.days, args.interval,
+                                                args.seed, not args.unacknowledged, report=report)
+    print(f"Created {args.patients} patients with {readings} readings and {alerts} alerts "
+          f"in {time.perf_counter() - started:.1f}s.")
+
+if __name__ == "__main__":
+    main()
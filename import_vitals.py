@@ -0,0 +1,50 @@
+"""
+Bulk import historical vital signs from CSV or NDJSON files.
+
+Rows are inserted in chunks, each in its own transaction together with the
+alerts classified for it, in the shard of each row's patient. Re-running the
+same command after an interruption resumes from the last committed chunk.
+
+Usage:
+    python import_vitals.py ward7_history.csv
+    python import_vitals.py ward7_history.ndjson --chunk-size 50000
+    python import_vitals.py ward7_history.csv --restart
+"""
+
+import argparse
+import time
+
+from app import app
+from db import db
+from utils.bulk_import import DEFAULT_CHUNK_SIZE, import_readings
+from utils.shards import create_shard_tables, shard_engines
+
+def import_vitals(path, chunk_size=DEFAULT_CHUNK_SIZE, acknowledged=True, restart=False):
+    """Import a file of readings into the database, printing progress."""
+    started = time.perf_counter()
+    
+    def report(rows_done):
+        print(f"  {rows_done} rows committed")
+    
+    with app.app_context():
+        create_shard_tables()
+        rows, alerts = import_readings(shard_engines(), path, chunk_size, acknowledged, restart, report)
+    
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed * 60 if elapsed else 0
+    print(f"Imported {rows} readings and {alerts} alerts in {elapsed:.1f}s ({rate:,.0f} rows/min).")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import historical vital signs.")
+    parser.add_argument('path', help="CSV, NDJSON or JSONL file of readings")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows per transaction")
+    parser.add_argument('--unacknowledged', action='store_true',
+                        help="Leave alerts for imported readings unacknowledged")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore any checkpoint and import from the start")
+    args = parser.parse_args(argv)
+    import_vitals(args.path, args.chunk_size, not args.unacknowledged, args.restart)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+List, set and clear per-ward and per-patient alert threshold profiles
+(see utils.threshold_profiles).
+
+Each override is <vital>.<severity>.<min|max>=<value>. Setting a profile
+replaces the ward's or patient's previous one. Running servers pick up
+changes within THRESHOLD_REFRESH_SECONDS.
+
+Usage:
+    python manage_thresholds.py list
+    python manage_thresholds.py set --patient 3 --name COPD spo2.warning.min=88 spo2.critical.min=85
+    python manage_thresholds.py set --ward 2 --name Paediatrics heart_rate.warning.max=140
+    python manage_thresholds.py clear --patient 3
+"""
+
+import argparse
+import json
+import sys
+
+from app import app
+from db import db
+from models import ThresholdProfile
+from utils.shards import each_shard
+from utils.threshold_profiles import delete_profile, merge_thresholds, set_profile
+
+def parse_assignments(assignments):
+    """Turn ['spo2.warning.min=88', ...] into nested overrides.
+
+    Raises:
+        ValueError: For assignments not of the form vital.severity.limit=value
+    """
+    overrides = {}
+    for assignment in assignments:
+        path, _, value = assignment.partition('=')
+        parts = path.split('.')
+        if len(parts) != 3 or not value:
+            raise ValueError(f"Expected <vital>.<severity>.<min|max>=<value>, got {assignment!r}")
+        vital_type, severity, limit = parts
+        overrides.setdefault(vital_type, {}).setdefault(severity, {})[limit] = float(value)
+    return overrides
+
+def list_profiles():
+    """Print every profile with the thresholds it changes."""
+    with app.app_context():
+        profiles = []
+        for _ in each_shard():
+            profiles.extend(db.session.execute(db.select(ThresholdProfile)).scalars())
+        if not profiles:
+            print("No threshold profiles; the default thresholds apply to every patient.")
+            return
+        for profile in sorted(profiles, key=lambda p: (p.patient_id is not None, p.ward or '', p.patient_id or 0)):
+            scope = f"ward {profile.ward}" if profile.ward is not None else f"patient {profile.patient_id}"
+            print(f"{scope}: {profile.name} (updated {profile.updated:%Y-%m-%d %H:%M})")
+            overrides = json.loads(profile.overrides)
+            merged = merge_thresholds(overrides)
+            for vital_type, levels in overrides.items():
+                for severity in levels:
+                    limits = merged[vital_type][severity]
+                    print(f"  {vital_type} {severity}: {limits['min']:g} - {limits['max']:g}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage per-ward and per-patient alert thresholds.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Show all profiles")
+    for name, help_text in (('set', "Create or replace a profile"), ('clear', "Delete a profile")):
+        command = commands.add_parser(name, help=help_text)
+        scope = command.add_mutually_exclusive_group(required=True)
+        scope.add_argument('--ward', help="Ward, e.g. 1 for rooms 101-199")
+        scope.add_argument('--patient', type=int, help="Patient id")
+        if name == 'set':
+            command.add_argument('--name', required=True, help="Profile name, e.g. COPD")
+            command.add_argument('overrides', nargs='+', help="<vital>.<severity>.<min|max>=<value>")
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        list_profiles()
+        return
+    scope = f"ward {args.ward}" if args.ward is not None else f"patient {args.patient}"
+    with app.app_context():
+        if args.command == 'set':
+            try:
+                set_profile(args.name, parse_assignments(args.overrides), ward=args.ward, patient_id=args.patient)
+            except ValueError as e:
+                sys.exit(f"Error: {e}")
+            print(f"Set threshold profile '{args.name}' for {scope}.")
+        elif delete_profile(ward=args.ward, patient_id=args.patient):
+            print(f"Cleared the threshold profile for {scope}.")
+        else:
+            print(f"No threshold profile for {scope}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Upgrade the database schema to the latest revision, in every shard.
+
+Migrations are Alembic revisions under migrations/versions (see
+utils.migrations). Data backfills run in batches of --batch-size rows,
+one transaction each, with --pause seconds between batches, so the app,
+/update and the device gateway keep running during a migration.
+Re-running after an interruption resumes the backfills where they
+stopped. Running it on a new or up-to-date database does nothing.
+--downgrade undoes revisions back to the one given ('base' undoes them
+all), losing the data only the newer schema holds; back up first.
+
+Usage:
+    python migrate_db.py
+    python migrate_db.py --batch-size 50000 --pause 0.2
+    python migrate_db.py --current
+    python migrate_db.py --downgrade 0003
+    alembic revision -m "add patient.bed"  # new revision in migrations/versions
+"""
+
+import argparse
+import time
+
+from app import app, db
+from utils.migrations import DEFAULT_BATCH_SIZE, DEFAULT_PAUSE, current_revision, downgrade, upgrade
+from utils.shards import shard_keys
+
+def migrate_db(revision='head', batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """Upgrade every shard to ``revision``, printing progress."""
+    with app.app_context():
+        for key in shard_keys():
+            engine = db.engines[key]
+            started = time.perf_counter()
+            print(f"Upgrading {engine.url.database or engine.url} from {current_revision(engine) or 'an unversioned schema'}...")
+            upgrade(engine, revision, batch_size, pause)
+            print(f"Now at {current_revision(engine)} ({time.perf_counter() - started:.1f}s).")
+
+def downgrade_db(revision):
+    """Downgrade every shard to ``revision``, printing progress."""
+    with app.app_context():
+        for key in shard_keys():
+            engine = db.engines[key]
+            print(f"Downgrading {engine.url.database or engine.url} from {current_revision(engine) or 'an unversioned schema'}...")
+            downgrade(engine, revision)
+            print(f"Now at {current_revision(engine) or 'base'}.")
+
+def show_current():
+    with app.app_context():
+        for key in shard_keys():
+            engine = db.engines[key]
+            print(f"{engine.url.database or engine.url}: {current_revision(engine) or 'unversioned'}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the database schema in every shard.")
+    parser.add_argument('--revision', default='head', help="Revision to upgrade to (default: the latest)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per backfill transaction")
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE, help="Seconds to wait between batches")
+    parser.add_argument('--current', action='store_true', help="Only print each shard's revision")
+    parser.add_argument('--downgrade', metavar='REVISION', help="Downgrade to REVISION instead ('base' for all)")
+    args = parser.parse_args(argv)
+    if args.current:
+        show_current()
+        return
+    if args.downgrade:
+        downgrade_db(args.downgrade)
+        return
+    migrate_db(args.revision, args.batch_size, args.pause)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Alembic environment for migrate_db.py.
+
+migrate_db.py passes a connection for each shard in
+config.attributes['connection']. Run through the alembic command line
+(e.g. ``alembic revision -m "..."``), the app's default database is used.
+"""
+
+import os
+import sys
+
+from alembic import context
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from db import db
+import models  # noqa: F401  (registers the tables on db.metadata)
+
+config = context.config
+
+def run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=db.metadata,
+        # Each revision commits on its own, so backfills can run between them
+        transaction_per_migration=True,
+        render_as_batch=connection.dialect.name == 'sqlite',
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    raise SystemExit("Offline (--sql) mode is not supported: backfills need a database connection.")
+
+connection = config.attributes.get('connection')
+if connection is not None:
+    run_migrations(connection)
+else:
+    from app import app
+    with app.app_context(), db.engine.connect() as connection:
+        run_migrations(connection)
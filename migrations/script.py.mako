@@ -0,0 +1,26 @@
+"""
+${message}
+
+Revision ID: ${up_revision}
+Revises: ${down_revision | comma,n}
+Create Date: ${create_date}
+
+Keep the schema changes quick and move data changes into batched
+backfills (see utils.migrations).
+"""
+
+from alembic import op
+import sqlalchemy as sa
+${imports if imports else ""}
+from utils.migrations import add_column, plan_backfill, run_backfill
+
+revision = ${repr(up_revision)}
+down_revision = ${repr(down_revision)}
+branch_labels = ${repr(branch_labels)}
+depends_on = ${repr(depends_on)}
+
+def upgrade():
+    ${upgrades if upgrades else "pass"}
+
+def downgrade():
+    ${downgrades if downgrades else "pass"}
@@ -0,0 +1,58 @@
+"""
+Add alert.acknowledged, alert.severity and alert.escalation_level.
+
+Replaces migrate_alert_db.py. Alerts that predate the acknowledged
+column are marked acknowledged, and alerts outside the critical
+thresholds are marked critical, in batches.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from utils.migrations import add_column, forget_backfills, has_column, plan_backfill, run_backfill
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# The alert table as of this revision (values were still stored as floats)
+alert = sa.table('alert', sa.column('id', sa.Integer), sa.column('vital_type', sa.String),
+                 sa.column('value', sa.Float), sa.column('acknowledged', sa.Boolean),
+                 sa.column('severity', sa.String))
+
+# Format: {vital_type: (min, max)}, the critical thresholds as of this
+# revision; max is None when only the lower bound is checked
+CRITICAL = {'heart_rate': (50, 120), 'spo2': (90, None), 'temp': (35.5, 38.5)}
+
+def outside_critical():
+    """Condition for alerts outside the critical thresholds of their vital sign."""
+    conditions = []
+    for vital_type, (low, high) in CRITICAL.items():
+        outside = alert.c.value < low
+        if high is not None:
+            outside = outside | (alert.c.value > high)
+        conditions.append((alert.c.vital_type == vital_type) & outside)
+    return sa.or_(*conditions)
+
+def upgrade():
+    if add_column('alert', sa.Column('acknowledged', sa.Boolean, server_default=sa.false())):
+        plan_backfill('0001.alert.acknowledged', 'alert')
+    if add_column('alert', sa.Column('severity', sa.String(10), nullable=False, server_default='warning')):
+        plan_backfill('0001.alert.severity', 'alert')
+    add_column('alert', sa.Column('escalation_level', sa.Integer, nullable=False, server_default='0'))
+
+    # Alerts from before the feature count as acknowledged
+    run_backfill('0001.alert.acknowledged', alert, {'acknowledged': True})
+    run_backfill('0001.alert.severity', alert, {'severity': 'critical'}, outside_critical())
+
+def downgrade():
+    # Acknowledgements, severities and escalations are lost
+    for column in ('escalation_level', 'severity', 'acknowledged'):
+        if has_column('alert', column):
+            op.drop_column('alert', column)
+    forget_backfills('0001.')
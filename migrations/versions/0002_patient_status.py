@@ -0,0 +1,93 @@
+"""
+Move each patient's latest vitals and alert flags into patient_status.
+
+Replaces migrate_patient_status.py. There is one row per patient, so the
+copy runs in the revision's transaction.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy import inspect
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# Columns that moved from patient to patient_status
+STATUS_COLUMNS = ['heart_rate', 'spo2', 'temp', 'vitals_updated',
+                  'heart_rate_alert', 'spo2_alert', 'temp_alert']
+
+# Format: {column: scale}; patient held floats, patient_status stores
+# integer units of 1/scale
+SCALES = {'heart_rate': 1, 'spo2': 10, 'temp': 10}
+FLAGS = ['heart_rate_alert', 'spo2_alert', 'temp_alert']
+
+# The patient_status table as of this revision
+metadata = sa.MetaData()
+sa.Table('patient', metadata, sa.Column('id', sa.Integer, primary_key=True))
+patient_status = sa.Table(
+    'patient_status', metadata,
+    sa.Column('patient_id', sa.Integer, sa.ForeignKey('patient.id'), primary_key=True),
+    sa.Column('vitals_updated', sa.DateTime, index=True),
+    *(sa.Column(column, sa.Integer) for column in SCALES),
+    *(sa.Column(column, sa.Boolean, nullable=False, server_default=sa.false()) for column in FLAGS),
+)
+
+def upgrade():
+    bind = op.get_bind()
+    if 'patient' not in inspect(bind).get_table_names():
+        return
+    patient_status.create(bind, checkfirst=True)
+    columns = {column['name'] for column in inspect(bind).get_columns('patient')}
+    moved = [column for column in STATUS_COLUMNS if column in columns]
+    if not moved:
+        return
+
+    # Copy the state of patients that have any, then drop the old columns
+    select_list = ', '.join(
+        f'COALESCE({column}, FALSE)' if column in FLAGS
+        else f'CAST(ROUND({column} * {SCALES[column]}) AS INTEGER)' if column in SCALES
+        else column
+        for column in moved
+    )
+    copied = bind.execute(sa.text(
+        f"INSERT INTO patient_status (patient_id, {', '.join(moved)}) "
+        f"SELECT id, {select_list} FROM patient "
+        f"WHERE id NOT IN (SELECT patient_id FROM patient_status) "
+        f"AND ({' OR '.join(f'{column} IS NOT NULL' for column in moved)})"
+    )).rowcount
+    print(f"Copied the latest state of {copied} patients into patient_status.")
+
+    for column in moved:
+        try:
+            with bind.begin_nested():
+                bind.execute(sa.text(f'ALTER TABLE patient DROP COLUMN {column}'))
+        except sa.exc.DBAPIError as e:
+            # e.g. SQLite before 3.35; the column is left unused
+            print(f"Could not drop patient.{column} ({e.orig}); it is no longer used.")
+
+def downgrade():
+    bind = op.get_bind()
+    if 'patient_status' not in inspect(bind).get_table_names():
+        return
+    columns = {column['name'] for column in inspect(bind).get_columns('patient')}
+    for column in STATUS_COLUMNS:
+        if column not in columns:
+            column_type = sa.Float if column in SCALES else sa.Boolean if column in FLAGS else sa.DateTime
+            op.add_column('patient', sa.Column(column, column_type))
+
+    # Copy the state back as floats, then drop the table
+    copied = bind.execute(sa.text(
+        f"UPDATE patient SET ({', '.join(STATUS_COLUMNS)}) = (SELECT "
+        + ', '.join(f'{column} * 1.0 / {SCALES[column]}' if column in SCALES else column
+                    for column in STATUS_COLUMNS)
+        + " FROM patient_status WHERE patient_status.patient_id = patient.id) "
+        "WHERE id IN (SELECT patient_id FROM patient_status)"
+    )).rowcount
+    print(f"Copied the latest state of {copied} patients back into patient.")
+    op.drop_table('patient_status')
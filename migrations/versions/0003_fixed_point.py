@@ -0,0 +1,73 @@
+"""
+Store vital_sign and alert values as fixed-point integers.
+
+Replaces migrate_fixed_point.py. On SQLite each table is renamed,
+recreated with INTEGER columns and copied back in batches, one
+transaction per batch (see utils.migrations.rebuild_fixed_point_table).
+Other databases keep their float columns, which FixedPoint also reads.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import context, op
+
+from utils.migrations import DEFAULT_BATCH_SIZE, rebuild_fixed_point_table
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# Format: {table: {column: scale}}, stored as integer units of 1/scale
+SCALES = {
+    'vital_sign': {'heart_rate': 1, 'spo2': 10, 'temp': 10},
+    'alert': {'value': 100},
+}
+
+def tables(value_type):
+    """The vital_sign and alert tables as of this revision, with ``value_type`` for the scaled columns."""
+    metadata = sa.MetaData()
+    sa.Table('patient', metadata, sa.Column('id', sa.Integer, primary_key=True))
+    return [
+        sa.Table(
+            'vital_sign', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('patient_id', sa.Integer, sa.ForeignKey('patient.id'), nullable=False),
+            sa.Column('timestamp', sa.DateTime),
+            *(sa.Column(column, value_type) for column in SCALES['vital_sign']),
+            sqlite_autoincrement=True,
+        ),
+        sa.Table(
+            'alert', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('patient_id', sa.Integer, sa.ForeignKey('patient.id'), nullable=False),
+            sa.Column('timestamp', sa.DateTime),
+            sa.Column('vital_type', sa.String(20), nullable=False),
+            sa.Column('value', value_type, nullable=False),
+            sa.Column('threshold', sa.String(20), nullable=False),
+            sa.Column('severity', sa.String(10), nullable=False, server_default='warning'),
+            sa.Column('acknowledged', sa.Boolean),
+            sa.Column('escalation_level', sa.Integer, nullable=False, server_default='0'),
+            sqlite_autoincrement=True,
+        ),
+    ]
+
+def rebuild(value_type, to_fixed_point):
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    batch_size = context.config.attributes.get('batch_size', DEFAULT_BATCH_SIZE)
+    with op.get_context().autocommit_block():
+        engine = op.get_bind().engine
+        for table in tables(value_type):
+            copied = rebuild_fixed_point_table(engine, table, SCALES[table.name], batch_size, to_fixed_point)
+            if copied:
+                print(f"Converted {copied} {table.name} rows in {engine.url.database}.")
+
+def upgrade():
+    rebuild(sa.Integer, to_fixed_point=True)
+
+def downgrade():
+    rebuild(sa.Float, to_fixed_point=False)
@@ -0,0 +1,28 @@
+"""
+Add alert.acknowledged_at, for the time-to-acknowledge statistics.
+
+Existing alerts keep it empty. Run rebuild_alert_rollups.py afterwards
+to count them in the hourly rollups.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from utils.migrations import add_column, has_column
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if add_column('alert', sa.Column('acknowledged_at', sa.DateTime)):
+        print("Run rebuild_alert_rollups.py to count existing alerts in /alerts/stats.")
+
+def downgrade():
+    if has_column('alert', 'acknowledged_at'):
+        op.drop_column('alert', 'acknowledged_at')
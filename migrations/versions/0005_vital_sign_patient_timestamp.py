@@ -0,0 +1,26 @@
+"""
+Index vital_sign by (patient_id, timestamp).
+
+Restoring a patient's trends and warming its sparklines read its readings
+since a point in time; without the index both scan the whole table.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+from utils.migrations import create_index, has_index
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    create_index('ix_vital_sign_patient_timestamp', 'vital_sign', ['patient_id', 'timestamp'])
+
+def downgrade():
+    if has_index('vital_sign', 'ix_vital_sign_patient_timestamp'):
+        op.drop_index('ix_vital_sign_patient_timestamp', 'vital_sign')
@@ -0,0 +1,29 @@
+"""
+Partial index of unacknowledged alerts by (severity, timestamp).
+
+Loading the alert index and polling for escalations read the
+unacknowledged alerts; without the index both scan every alert ever
+raised. Only unacknowledged rows are indexed, so it stays small.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from utils.migrations import create_index, has_index
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    create_index('ix_alert_unacknowledged', 'alert', ['severity', 'timestamp'],
+                 sqlite_where=sa.text('acknowledged = 0'), postgresql_where=sa.text('NOT acknowledged'))
+
+def downgrade():
+    if has_index('alert', 'ix_alert_unacknowledged'):
+        op.drop_index('ix_alert_unacknowledged', 'alert')
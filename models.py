@@ -3,6 +3,8 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import check_password_hash
 
+from utils.vitals import VITALS
+
 class User(db.Model, UserMixin):
     """User data model for authentication."""
     id = db.Column(db.Integer, primary_key=True)
@@ -16,52 +18,196 @@ class User(db.Model, UserMixin):
     def __repr__(self):
         return f'<User {self.username}>'
 
+def _latest(column, default=None):
+    """Read-only Patient attribute for a PatientStatus column."""
+    return property(lambda self: getattr(self.status, column) if self.status else default,
+                    doc=f"Latest {column} from patient_status")
+
+class FixedPoint(db.TypeDecorator):
+    """A float stored as an integer number of 1/scale units (tenths by default).
+
+    SQLite stores small integers in 1-2 bytes instead of 8 for a REAL, so
+    vitals reported to a fixed precision take a fraction of the space.
+    Values are rounded to the scale on the way in and read back as floats.
+    """
+    impl = db.Integer
+    cache_ok = True
+    
+    def __init__(self, scale=10):
+        super().__init__()
+        self.scale = scale
+    
+    def encode(self, value):
+        return None if value is None else round(value * self.scale)
+    
+    def quantize(self, value):
+        """Round ``value`` to the stored precision."""
+        return None if value is None else self.encode(value) / self.scale
+    
+    def process_bind_param(self, value, dialect):
+        return self.encode(value)
+    
+    process_literal_param = process_bind_param
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / self.scale
+    
+    @property
+    def python_type(self):
+        return float
+
+def _add_vital_columns(model, make_column):
+    """Add one column per registered vital sign (see utils.vitals), named after it."""
+    for vital in VITALS:
+        setattr(model, vital.name, make_column(vital))
+
+def _alert_flag():
+    return db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
 class Patient(db.Model):
     """Patient data model with vital signs."""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     room = db.Column(db.String(20), nullable=False)
     
-    # Latest vital signs
-    heart_rate = db.Column(db.Integer)
-    spo2 = db.Column(db.Float)
-    temp = db.Column(db.Float)
-    vitals_updated = db.Column(db.DateTime)
+    # Latest vital signs and alert flags live in patient_status, loaded in the
+    # same query; they are written with upserts (see utils.patient_status)
+    status = db.relationship('PatientStatus', uselist=False, lazy='joined', viewonly=True)
     
-    # Alert flags
-    heart_rate_alert = db.Column(db.Boolean, default=False)
-    spo2_alert = db.Column(db.Boolean, default=False)
-    temp_alert = db.Column(db.Boolean, default=False)
+    # Each vital sign and its alert flag are added below from the registry,
+    # e.g. heart_rate and heart_rate_alert
+    vitals_updated = _latest('vitals_updated')
     
     @property
     def has_alert(self):
         """Return True if any vital sign has an alert."""
-        return self.heart_rate_alert or self.spo2_alert or self.temp_alert
+        return any(getattr(self, vital.flag) for vital in VITALS)
     
     def __repr__(self):
         return f'<Patient {self.name}>'
 
+class PatientStatus(db.Model):
+    """Latest vital signs and alert flags of a patient, rewritten on every reading."""
+    __tablename__ = 'patient_status'
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), primary_key=True)
+    vitals_updated = db.Column(db.DateTime, index=True)
+    # Latest value of each vital sign, then one alert flag per vital sign
+    
+    def __repr__(self):
+        return f'<PatientStatus {self.patient_id} @ {self.vitals_updated}>'
+
+_add_vital_columns(PatientStatus, lambda vital: db.Column(FixedPoint(vital.scale)))
+for _vital in VITALS:
+    setattr(PatientStatus, _vital.flag, _alert_flag())
+    setattr(Patient, _vital.name, _latest(_vital.name))
+    setattr(Patient, _vital.flag, _latest(_vital.flag, False))
+
 class VitalSign(db.Model):
     """Vital signs data model."""
+    __table_args__ = (
+        # Trend restores and sparkline warming read a patient's recent readings
+        db.Index('ix_vital_sign_patient_timestamp', 'patient_id', 'timestamp'),
+        # AUTOINCREMENT lets each shard start its ids in its own range (utils.shards)
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.now)
-    heart_rate = db.Column(db.Float)
-    spo2 = db.Column(db.Float)
-    temp = db.Column(db.Float)
+    # One column per vital sign, e.g. heart_rate in whole bpm, spo2 and temp in tenths
     
     def __repr__(self):
         return f'<VitalSign {self.patient_id} @ {self.timestamp}>'
 
+_add_vital_columns(VitalSign, lambda vital: db.Column(FixedPoint(vital.scale)))
+
 class Alert(db.Model):
     """Alert data model for vital sign threshold violations."""
+    __table_args__ = (
+        # The alert index and escalation poll read only unacknowledged alerts
+        db.Index('ix_alert_unacknowledged', 'severity', 'timestamp',
+                 sqlite_where=db.text('acknowledged = 0'), postgresql_where=db.text('NOT acknowledged')),
+        {'sqlite_autoincrement': True},  # See VitalSign
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.now)
-    vital_type = db.Column(db.String(20), nullable=False)  # heart_rate, spo2, temp
-    value = db.Column(db.Float, nullable=False)
+    vital_type = db.Column(db.String(20), nullable=False)  # a registered vital, e.g. heart_rate
+    value = db.Column(FixedPoint(scale=100), nullable=False)  # hundredths (trend alerts store a slope)
     threshold = db.Column(db.String(20), nullable=False)  # e.g., "60-100", ">= 95", "36.5-37.5"
+    severity = db.Column(db.String(10), nullable=False, default='warning', server_default='warning')  # warning, critical
     acknowledged = db.Column(db.Boolean, default=False)
+    acknowledged_at = db.Column(db.DateTime)  # None for alerts acknowledged before this was recorded
+    escalation_level = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # tiers escalated so far
+    
+    def __repr__(self):
+        return f'<Alert {self.vital_type}={self.value} for Patient {self.patient_id}>' 
+
+class AlertRollup(db.Model):
+    """Alert counts per hour, vital type, severity and room (see utils.alert_rollups)."""
+    hour = db.Column(db.DateTime, primary_key=True)  # start of the hour the alerts were raised in
+    vital_type = db.Column(db.String(20), primary_key=True)
+    severity = db.Column(db.String(10), primary_key=True)
+    room = db.Column(db.String(20), primary_key=True)
+    alerts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    acknowledged = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    timed_acks = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # with a known wait
+    ack_seconds = db.Column(db.Float, nullable=False, default=0, server_default='0')  # total wait of timed_acks
+    
+    def __repr__(self):
+        return f'<AlertRollup {self.hour} {self.room} {self.vital_type}/{self.severity}>'
+
+class ThresholdProfile(db.Model):
+    """Alert threshold overrides for a ward or a patient (see utils.threshold_profiles)."""
+    id = db.Column(db.Integer, primary_key=True)
+    ward = db.Column(db.String(20), unique=True)  # set for a ward profile
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), unique=True)  # set for a patient profile
+    name = db.Column(db.String(100), nullable=False)  # e.g. "COPD", "Paediatrics"
+    overrides = db.Column(db.Text, nullable=False)  # JSON: {vital_type: {severity: {'min': ..., 'max': ...}}}
+    updated = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    
+    def __repr__(self):
+        return f'<ThresholdProfile {self.name} for {self.ward or f"patient {self.patient_id}"}>'
+
+class ChangeEvent(db.Model):
+    """One entry of the append-only change feed (see utils.change_feed)."""
+    # AUTOINCREMENT so sequence numbers are never reused after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)  # when it was recorded
+    kind = db.Column(db.String(10), nullable=False)  # 'vitals', 'alert' or 'ack'
+    patient_id = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.seq} {self.kind} for Patient {self.patient_id}>'
+
+class PatientTrend(db.Model):
+    """Snapshot of a patient's rolling-window statistics (see utils.trends)."""
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), primary_key=True)
+    state = db.Column(db.Text, nullable=False)  # JSON
+    updated = db.Column(db.DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f'<PatientTrend {self.patient_id} @ {self.updated}>'
+
+class ImportCheckpoint(db.Model):
+    """Progress of a bulk import, committed with each imported chunk."""
+    source = db.Column(db.String(500), primary_key=True)  # absolute path of the input file
+    file_size = db.Column(db.Integer, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f'<ImportCheckpoint {self.source} @ {self.rows_done}>'
+
+class MigrationCheckpoint(db.Model):
+    """Progress of a batched migration backfill, committed with each batch (see utils.migrations)."""
+    name = db.Column(db.String(100), primary_key=True)  # e.g. "0001.alert.severity"
+    last_id = db.Column(db.BigInteger, nullable=False, default=0)  # rows up to this id are done
+    end_id = db.Column(db.BigInteger, nullable=False, default=0)  # last row that existed when planned
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    done = db.Column(db.Boolean, nullable=False, default=False)
+    updated = db.Column(db.DateTime, default=datetime.now)
     
     def __repr__(self):
-        return f'<Alert {self.vital_type}={self.value} for Patient {self.patient_id}>' 
\ No newline at end of file
+        return f'<MigrationCheckpoint {self.name} @ {self.last_id}/{self.end_id}>'
@@ -0,0 +1,20 @@
+"""
+Precompile Jinja templates for the serverless deployment.
+
+Run this before deploying so the compiled modules ship in the bundle and
+api/index.py can skip template parsing on cold starts.
+
+Usage:
+    python precompile_templates.py
+"""
+
+from api.index import app
+from utils.template_cache import COMPILED_DIR, compile_app_templates
+
+def precompile_templates():
+    """Compile all templates into the compiled_templates directory."""
+    count = compile_app_templates(app, COMPILED_DIR)
+    print(f"Compiled {count} templates into {COMPILED_DIR}")
+
+if __name__ == "__main__":
+    precompile_templates()
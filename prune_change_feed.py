@@ -0,0 +1,31 @@
+"""
+Delete change feed entries older than the retention window.
+
+The change feed (utils.change_feed) only grows, so run this periodically,
+e.g. daily from cron. Consumers that fall further behind than the window
+must reload from the tables.
+
+Usage:
+    python prune_change_feed.py
+    python prune_change_feed.py --days 2
+"""
+
+import argparse
+
+from app import app
+from utils.change_feed import DEFAULT_RETENTION_DAYS, prune_changes
+
+def prune_change_feed(days=DEFAULT_RETENTION_DAYS):
+    """Prune every shard's feed, printing a summary."""
+    with app.app_context():
+        deleted = prune_changes(days)
+    print(f"Deleted {deleted} change feed entries older than {days} days.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete old change feed entries.")
+    parser.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS, help="Keep this many days of changes")
+    args = parser.parse_args(argv)
+    prune_change_feed(args.days)
+
+if __name__ == "__main__":
+    main()
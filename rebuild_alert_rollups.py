@@ -0,0 +1,35 @@
+"""
+Recompute the hourly alert rollups behind /alerts/stats from the alert table.
+
+The rollups are kept up to date as alerts are raised and acknowledged.
+Run this to backfill them after an upgrade, or after loading alerts with
+import_vitals.py or generate_dataset.py, which write alerts directly.
+Each shard is recounted in one transaction, during which its alerts
+can't be written.
+
+Usage:
+    python rebuild_alert_rollups.py
+    python rebuild_alert_rollups.py --chunk-size 50000
+"""
+
+import argparse
+import time
+
+from app import app
+from utils.alert_rollups import DEFAULT_CHUNK_SIZE, rebuild_rollups
+
+def rebuild_alert_rollups(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rebuild the rollups in every shard, printing a summary."""
+    started = time.perf_counter()
+    with app.app_context():
+        counted = rebuild_rollups(chunk_size)
+    print(f"Counted {counted} alerts into the hourly rollups in {time.perf_counter() - started:.1f}s.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the hourly alert rollups from the alert table.")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Alerts read per fetch")
+    args = parser.parse_args(argv)
+    rebuild_alert_rollups(args.chunk_size)
+
+if __name__ == "__main__":
+    main()
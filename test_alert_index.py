@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from db import db
+from models import Patient, Alert
+from utils.alert_index import alert_index, init_alert_index
+from utils.change_feed import ack_change, alert_change, record_changes
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    init_alert_index(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"),
+                            Patient(id=2, name="Patient B", room="102")])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def make_alert(patient_id, severity, minutes_ago, vital_type='heart_rate'):
+    return Alert(patient_id=patient_id, vital_type=vital_type, value=130, threshold='60-100',
+                 severity=severity, timestamp=datetime.now() - timedelta(minutes=minutes_ago))
+
+def test_orders_by_severity_then_age(app):
+    """Test that critical alerts come first, oldest first within a severity."""
+    db.session.add_all([make_alert(1, 'warning', 30), make_alert(2, 'critical', 1),
+                        make_alert(1, 'critical', 10), make_alert(2, 'warning', 5)])
+    db.session.commit()
+    
+    top = alert_index().top(3)
+    assert [(a.severity, a.patient_id) for a in top] == [('critical', 1), ('critical', 2), ('warning', 1)]
+    assert len(alert_index()) == 4
+    assert alert_index().patients_for(top)[2].name == "Patient B"
+
+def test_updates_incrementally_without_reloading(app, monkeypatch):
+    """Test that creation and acknowledgement update a loaded index in place."""
+    db.session.add(make_alert(1, 'warning', 30))
+    db.session.commit()
+    index = alert_index()
+    assert len(index) == 1
+    
+    def fail():
+        raise AssertionError("index was reloaded")
+    monkeypatch.setattr(index, 'load', fail)
+    
+    critical = make_alert(2, 'critical', 0, 'spo2')
+    db.session.add(critical)
+    db.session.commit()
+    assert [a.id for a in index.top()] == [critical.id, 1]
+    
+    critical.acknowledged = True
+    db.session.commit()
+    assert [a.id for a in index.top()] == [1]
+    
+    # Rolled back changes are not applied
+    db.session.add(make_alert(2, 'critical', 0))
+    db.session.flush()
+    db.session.rollback()
+    assert [a.id for a in index.top()] == [1]
+
+def test_picks_up_other_processes_from_change_feed(app, monkeypatch):
+    """Test that alerts raised and acknowledged elsewhere are applied from the feed, not a reload."""
+    first = make_alert(1, 'warning', 30)
+    db.session.add(first)
+    db.session.commit()
+    index = alert_index()
+    assert len(index) == 1
+    monkeypatch.setattr(index, 'load', lambda: pytest.fail("index was reloaded"))
+
+    # Another process writes with Core, so no ORM events fire here
+    table = Alert.__table__
+    alert_id = db.session.execute(table.insert().values(
+        patient_id=2, vital_type='spo2', value=85, threshold='>= 95', severity='critical',
+        timestamp=datetime.now(), acknowledged=False)).inserted_primary_key[0]
+    db.session.execute(table.update().where(table.c.id == first.id).values(acknowledged=True))
+    raised = db.session.get(Alert, alert_id)
+    record_changes([alert_change(raised), ack_change(first, datetime.now())])
+    db.session.commit()
+    assert [a.id for a in index.top()] == [first.id]
+
+    index.sync()
+    assert [(a.id, a.severity, a.value) for a in index.top()] == [(alert_id, 'critical', 85)]
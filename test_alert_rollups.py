@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from db import db
+from models import Alert, AlertRollup, Patient
+from utils.alert_rollups import alert_stats, count_acknowledged, rebuild_rollups, rollup_key
+from utils.ingest import ingest_readings
+
+NOW = datetime(2024, 1, 2, 12, 30)
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"), Patient(id=2, name="Patient B", room="102")])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def rollups():
+    return sorted(tuple(row) for row in db.session.execute(sa.select(AlertRollup.__table__)))
+
+def ingest_and_acknowledge(app):
+    """Raise alerts over three hours on both ingest paths and acknowledge patient 1's spo2 alerts."""
+    for core in (True, False):
+        app.config['INGEST_CORE'] = core
+        ingest_readings([{'patient_id': 1 + i % 2, 'heart_rate': 130 if i % 3 else 72, 'spo2': 92.0,
+                          'temp': 37.0, 'timestamp': NOW - timedelta(minutes=20 * i)} for i in range(9)])
+    alerts = Alert.query.filter_by(patient_id=1, vital_type='spo2').all()
+    for alert in alerts:
+        alert.acknowledged, alert.acknowledged_at = True, alert.timestamp + timedelta(minutes=4)
+        # As the routes do, with a single acknowledgement time per call
+        count_acknowledged([rollup_key(alert)], alert.acknowledged_at)
+    db.session.commit()
+
+def test_incremental_rollups_match_rebuild(app):
+    """Test that rollups kept up by ingest and acknowledgements equal a rebuild from the alert table."""
+    ingest_and_acknowledge(app)
+    incremental = rollups()
+    assert sum(row[4] for row in incremental) == Alert.query.count() == 30
+
+    assert rebuild_rollups(chunk_size=7) == 30
+    assert rollups() == incremental
+
+def test_stats_read_rollups_by_hour_room_and_vital(app):
+    """Test the stats breakdowns, mean time to acknowledge and filters."""
+    ingest_and_acknowledge(app)
+    stats = alert_stats(hours=24, now=NOW)
+
+    assert stats['totals'] == {'alerts': 30, 'acknowledged': 10, 'mean_ack_seconds': 240.0}
+    assert [(row['room'], row['alerts'], row['mean_ack_seconds']) for row in stats['by_room']] == [
+        ('101', 16, 240.0), ('102', 14, None)]
+    assert [row['hour'] for row in stats['by_hour']] == ['2024-01-02T09:00:00', '2024-01-02T10:00:00',
+                                                         '2024-01-02T11:00:00', '2024-01-02T12:00:00']
+    assert {(row['vital_type'], row['severity']): row['alerts'] for row in stats['by_vital']} == {
+        ('heart_rate', 'critical'): 12, ('spo2', 'warning'): 18}
+
+    assert alert_stats(hours=1, room='102', now=NOW)['totals']['alerts'] == 4
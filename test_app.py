@@ -1,7 +1,8 @@
 import pytest
 import json
-from app import app, THRESHOLDS, db, create_sample_data
+from app import app, db, create_sample_data
 from models import Patient, VitalSign, Alert, User
+from utils.alerting import threshold_label
 from flask_login import current_user
 
 @pytest.fixture
@@ -100,7 +101,7 @@ def test_update_abnormal_heart_rate(client):
         assert len(alerts) == 1
         assert alerts[0].vital_type == "heart_rate"
         assert alerts[0].value == 120
-        assert alerts[0].threshold == f"{THRESHOLDS['heart_rate']['min']}-{THRESHOLDS['heart_rate']['max']}"
+        assert alerts[0].threshold == threshold_label('heart_rate', 'warning')
         
         # Verify patient is at risk
         patient = Patient.query.get(1)
@@ -0,0 +1,94 @@
+import pytest
+from datetime import datetime, timedelta
+from flask import Flask
+from db import db
+from models import Patient, VitalSign, Alert, ImportCheckpoint
+from utils.bulk_import import import_readings
+from utils.export import stream_export
+
+START = datetime(2024, 1, 1, 0, 0, 0)
+
+@pytest.fixture
+def import_app():
+    """Create a bare app with an empty in-memory database."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Test Patient", room="101"))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def write_csv(path, count):
+    lines = ['patient_id,timestamp,heart_rate,spo2,temp']
+    for i in range(count):
+        # Every 5th reading has a critical heart rate
+        heart_rate = 130 if i % 5 == 0 else 75
+        lines.append(f"1,{(START + timedelta(minutes=i)).isoformat()},{heart_rate},98.0,36.9")
+    path.write_text('\n'.join(lines) + '\n')
+
+def test_import_inserts_readings_and_alerts(import_app, tmp_path):
+    """Test that readings and their classified alerts are inserted."""
+    path = tmp_path / 'history.csv'
+    write_csv(path, 10)
+    
+    rows, alerts = import_readings(db.engine, str(path), chunk_size=3)
+    
+    assert (rows, alerts) == (10, 2)
+    assert VitalSign.query.count() == 10
+    alert = Alert.query.order_by(Alert.timestamp).first()
+    assert alert.vital_type == 'heart_rate'
+    assert alert.threshold == '50-120'
+    assert alert.acknowledged is True
+    # Timestamps are stored so ORM range filters still match
+    assert VitalSign.query.filter(VitalSign.timestamp >= START + timedelta(minutes=9)).count() == 1
+
+def test_readings_are_classified_as_stored(import_app, tmp_path):
+    """Test that values are rounded to their stored precision before they are classified."""
+    path = tmp_path / 'history.csv'
+    path.write_text('patient_id,timestamp,heart_rate,spo2,temp\n'
+                    f'1,{START.isoformat()},120.4,89.96,36.9\n'
+                    f'1,{(START + timedelta(minutes=1)).isoformat()},75,89.94,36.9\n')
+
+    assert import_readings(db.engine, str(path)) == (2, 3)
+    assert [vital.spo2 for vital in VitalSign.query.order_by(VitalSign.timestamp)] == [90.0, 89.9]
+    # 120.4 bpm is stored as 120 and 89.96% as 90.0, inside the critical limits
+    assert [(alert.vital_type, alert.value, alert.severity) for alert in Alert.query.order_by(Alert.id)] == [
+        ('heart_rate', 120, 'warning'), ('spo2', 90.0, 'warning'), ('spo2', 89.9, 'critical')]
+
+def test_interrupted_import_resumes_from_checkpoint(import_app, tmp_path):
+    """Test that an interrupted import resumes without duplicating rows."""
+    path = tmp_path / 'history.csv'
+    write_csv(path, 10)
+    
+    def interrupt(rows_done):
+        raise KeyboardInterrupt
+    
+    with pytest.raises(KeyboardInterrupt):
+        import_readings(db.engine, str(path), chunk_size=4, progress=interrupt)
+    assert VitalSign.query.count() == 4
+    
+    rows, _ = import_readings(db.engine, str(path), chunk_size=4)
+    assert rows == 6
+    assert VitalSign.query.count() == 10
+    assert db.session.get(ImportCheckpoint, str(path)).rows_done == 10
+    
+    # A completed import has nothing left to do
+    assert import_readings(db.engine, str(path)) == (0, 0)
+
+def test_ndjson_export_round_trip(import_app, tmp_path):
+    """Test that an NDJSON export can be imported back."""
+    csv_path = tmp_path / 'history.csv'
+    write_csv(csv_path, 5)
+    import_readings(db.engine, str(csv_path))
+    
+    ndjson_path = tmp_path / 'export.ndjson'
+    ndjson_path.write_text(''.join(stream_export(db.engine, 'vitals', 'ndjson')))
+    rows, alerts = import_readings(db.engine, str(ndjson_path))
+    
+    assert (rows, alerts) == (5, 1)
+    assert VitalSign.query.count() == 10
@@ -0,0 +1,80 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from db import db
+from models import Alert, Patient
+from utils.change_feed import ack_change, head_cursor, read_changes, record_changes, wait_for_changes
+from utils.ingest import ingest_readings
+
+START = datetime(2024, 1, 1, 8, 0)
+
+def make_app(uri='sqlite:///:memory:', core=True):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['INGEST_CORE'] = core
+    db.init_app(app)
+    return app
+
+def ingest_feed(core, monkeypatch):
+    monkeypatch.setattr('utils.ingest.notify_critical_alerts', lambda patient, alerts: None)
+    app = make_app(core=core)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"), Patient(id=2, name="Patient B", room="102")])
+        db.session.commit()
+        ingest_readings([{'patient_id': 1 + i % 2, 'heart_rate': 72 if i < 3 else 130, 'spo2': 97.0,
+                          'timestamp': START + timedelta(minutes=i)} for i in range(4)])
+        first = read_changes(limit=2)
+        rest = read_changes(first['cursor'])
+        assert read_changes(rest['cursor'])['changes'] == []
+        db.session.remove()
+        db.drop_all()
+    return first, rest
+
+def test_both_ingest_paths_write_the_same_feed(monkeypatch):
+    """Test that a batch appends one vitals change per patient and one per alert, read in pages by cursor."""
+    core = ingest_feed(True, monkeypatch)
+    orm = ingest_feed(False, monkeypatch)
+    strip = lambda page: [(c['seq'], c['kind'], c['patient_id'], c['data']) for c in page['changes']]
+    assert [strip(page) for page in core] == [strip(page) for page in orm]
+
+    first, rest = core
+    assert first['more'] and first['cursor'] == '2' and rest['cursor'] == '3'
+    kinds = [(c['kind'], c['patient_id']) for c in first['changes'] + rest['changes']]
+    assert kinds == [('vitals', 1), ('vitals', 2), ('alert', 2)]
+    assert first['changes'][1]['data']['vitals_updated'] == (START + timedelta(minutes=3)).isoformat()
+    assert rest['changes'][0]['data']['value'] == 130 and rest['changes'][0]['data']['severity'] == 'critical'
+
+def test_long_poll_returns_changes_committed_by_another_worker(tmp_path):
+    """Test that a waiting consumer wakes up for a commit made elsewhere and times out without one."""
+    app = make_app(f"sqlite:///{tmp_path / 'feed.db'}")
+    app.config['CHANGE_FEED_POLL_SECONDS'] = 0.05
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Patient A", room="101"))
+        db.session.add(Alert(id=7, patient_id=1, timestamp=START, vital_type='spo2', value=89.0,
+                             threshold='>= 90', severity='critical'))
+        db.session.commit()
+        cursor = head_cursor()
+        started = time.monotonic()
+        assert wait_for_changes(cursor, timeout=0.2)['changes'] == []
+        assert time.monotonic() - started >= 0.2
+
+        def acknowledge():
+            time.sleep(0.2)
+            with app.app_context():
+                alert = db.session.get(Alert, 7)
+                alert.acknowledged = True
+                record_changes([ack_change(alert, START + timedelta(minutes=5))])
+                db.session.commit()
+
+        worker = threading.Thread(target=acknowledge)
+        worker.start()
+        page = wait_for_changes(cursor, timeout=10)
+        worker.join()
+        assert [(c['kind'], c['data']) for c in page['changes']] == [
+            ('ack', {'id': 7, 'vital_type': 'spo2', 'acknowledged_at': '2024-01-01T08:05:00'})]
+        assert page['cursor'] == '1'
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from db import db
+from models import Patient, Alert
+from utils.escalation import EscalationEngine, init_escalation
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['ESCALATION_TIERS'] = ((60, 'ATTENDER_EMAIL'), (120, 'ESCALATION_EMAIL'))
+    db.init_app(app)
+    init_escalation(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Test Patient", room="101"))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def add_alert(severity='critical', seconds_ago=0, patient_id=1):
+    alert = Alert(patient_id=patient_id, vital_type='spo2', value=85, threshold='>= 90',
+                  severity=severity, timestamp=datetime.now() - timedelta(seconds=seconds_ago))
+    db.session.add(alert)
+    db.session.commit()
+    return alert
+
+def test_escalates_through_tiers_until_acknowledged(app):
+    """Test that an unacknowledged critical alert escalates tier by tier."""
+    engine = app.extensions['escalation']
+    alert = add_alert()
+    add_alert('warning')
+    assert len(engine) == 1
+    
+    now = time.time()
+    assert engine.pop_due(now) == []
+    assert engine.pop_due(now + 61) == [(alert.id, 1)]
+    assert engine.escalate(alert.id, 1)
+    # Escalating the same level again is a no-op (e.g. a second engine)
+    assert not engine.escalate(alert.id, 1)
+    assert db.session.get(Alert, alert.id).escalation_level == 1
+    
+    # Acknowledging cancels the next tier
+    alert = db.session.get(Alert, alert.id)
+    alert.acknowledged = True
+    db.session.commit()
+    assert len(engine) == 0
+    assert engine.pop_due(now + 121) == []
+
+def test_polls_alerts_from_other_processes(app):
+    """Test that critical alerts inserted outside the ORM are picked up by polling."""
+    engine = app.extensions['escalation']
+    db.session.execute(Alert.__table__.insert(), [
+        {'patient_id': 1, 'vital_type': 'heart_rate', 'value': 130, 'threshold': '50-120',
+         'severity': 'critical', 'timestamp': datetime.now(), 'acknowledged': False},
+    ])
+    db.session.commit()
+    assert len(engine) == 0
+    
+    engine.poll()
+    assert len(engine) == 1
+    # The alert is acknowledged elsewhere, so its deadline passes without escalating
+    db.session.execute(Alert.__table__.update().values(acknowledged=True))
+    db.session.commit()
+    [(alert_id, level)] = engine.pop_due(time.time() + 61)
+    assert not engine.escalate(alert_id, level)
+
+def test_restart_escalates_overdue_alerts_one_tier_at_a_time(app):
+    """Test that a restarted engine escalates alerts nobody was paged for, then schedules later tiers from the escalation."""
+    stale, recent = add_alert(seconds_ago=3600), add_alert(seconds_ago=90)
+    done = add_alert(seconds_ago=3600)
+    db.session.get(Alert, done.id).escalation_level = 2
+    db.session.commit()
+    engine = EscalationEngine(app, app.config['ESCALATION_TIERS'], poll_seconds=0)
+    engine.poll()
+    assert len(engine) == 2
+
+    now = time.time()
+    assert engine.pop_due(now) == [(stale.id, 1), (recent.id, 1)]
+    assert engine.escalate(stale.id, 1) and engine.escalate(recent.id, 1)
+    # The second tier follows 60s after the escalation, not 120s after the alert
+    assert engine.pop_due(now + 30) == []
+    assert sorted(engine.pop_due(now + 61)) == [(stale.id, 2), (recent.id, 2)]
+    assert db.session.get(Alert, stale.id).escalation_level == 1
+
+def test_alerts_of_deleted_patients_are_dropped(app):
+    """Test that an alert whose patient is gone is not escalated or retried."""
+    engine = app.extensions['escalation']
+    alert = add_alert(patient_id=2)
+    [(alert_id, level)] = engine.pop_due(time.time() + 61)
+    assert not engine.escalate(alert_id, level)
+    assert len(engine) == 0
+    assert db.session.get(Alert, alert.id).escalation_level == 0
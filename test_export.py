@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime, timedelta
+from flask import Flask
+from db import db
+from models import Patient, VitalSign, Alert
+from utils.export import stream_export
+
+START = datetime(2024, 1, 1, 0, 0, 0)
+
+@pytest.fixture
+def export_app():
+    """Create a bare app with two patients' vitals history in memory."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"),
+                            Patient(id=2, name="Patient B", room="102")])
+        for hour in range(5):
+            for patient_id in (1, 2):
+                db.session.add(VitalSign(patient_id=patient_id, timestamp=START + timedelta(hours=hour),
+                                         heart_rate=70 + hour, spo2=98.0, temp=36.8))
+        db.session.add(Alert(patient_id=1, timestamp=START, vital_type='spo2', value=91.5,
+                             threshold='>= 95', acknowledged=False))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_csv_export_filters_by_patient_and_time(export_app):
+    """Test CSV export of one patient's vitals within a time range."""
+    chunks = list(stream_export(db.engine, 'vitals', 'csv', patient_id=1,
+                                start=START + timedelta(hours=1), end=START + timedelta(hours=4),
+                                chunk_size=2))
+    
+    # Rows are yielded chunk by chunk rather than all at once
+    assert len(chunks) == 2
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert [row['heart_rate'] for row in rows] == ['71.0', '72.0', '73.0']
+    assert {row['patient_id'] for row in rows} == {'1'}
+    assert rows[0]['timestamp'] == '2024-01-01T01:00:00'
+
+def test_csv_export_with_no_rows_has_header(export_app):
+    """Test that an empty export still has a header row."""
+    output = ''.join(stream_export(db.engine, 'vitals', 'csv', patient_id=99))
+    assert output.strip() == 'id,patient_id,timestamp,heart_rate,spo2,temp'
+
+def test_ndjson_alert_export(export_app):
+    """Test NDJSON export of alerts."""
+    lines = ''.join(stream_export(db.engine, 'alerts', 'ndjson')).splitlines()
+    
+    assert len(lines) == 1
+    alert = json.loads(lines[0])
+    assert alert['vital_type'] == 'spo2'
+    assert alert['value'] == 91.5
+    assert alert['timestamp'] == '2024-01-01T00:00:00'
+
+def test_parquet_export(export_app):
+    """Test Parquet export writes one row group per chunk."""
+    pq = pytest.importorskip('pyarrow.parquet')
+    data = b''.join(stream_export(db.engine, 'vitals', 'parquet', chunk_size=4))
+    
+    parquet_file = pq.ParquetFile(io.BytesIO(data))
+    assert parquet_file.metadata.num_rows == 10
+    assert parquet_file.metadata.num_row_groups == 3
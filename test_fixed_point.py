@@ -0,0 +1,62 @@
+import pytest
+import sqlalchemy as sa
+from datetime import datetime
+from flask import Flask
+from db import db
+from models import Alert, Patient, VitalSign
+from utils.migrations import rebuild_fixed_point_table
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Patient A", room="101"))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_vitals_are_stored_as_integers_and_read_as_floats(app):
+    """Test the fixed-point round trip, including filters on encoded columns."""
+    db.session.add(VitalSign(patient_id=1, timestamp=datetime(2024, 1, 1), heart_rate=72, spo2=97.5, temp=36.85))
+    db.session.add(Alert(patient_id=1, timestamp=datetime(2024, 1, 1), vital_type='temp', value=1.26,
+                         threshold='trend +0.5/h'))
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp FROM vital_sign").one() == (72, 975, 368)
+        assert conn.exec_driver_sql("SELECT value FROM alert").scalar() == 126
+
+    db.session.expire_all()
+    vital = VitalSign.query.filter(VitalSign.spo2 < 97.6, VitalSign.temp > 36.7).one()
+    assert (vital.heart_rate, vital.spo2, vital.temp) == (72.0, 97.5, 36.8)
+    assert isinstance(vital.heart_rate, float)
+    assert Alert.query.one().value == 1.26
+
+def test_migration_converts_float_rows_in_batches(tmp_path):
+    """Test that the migration rebuilds a float table, keeps ids and the sequence, and is idempotent."""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE vital_sign (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER NOT NULL, "
+                             "timestamp DATETIME, heart_rate FLOAT, spo2 FLOAT, temp FLOAT)")
+        conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('vital_sign', 1000)")
+        for i in range(5):
+            conn.exec_driver_sql("INSERT INTO vital_sign (patient_id, timestamp, heart_rate, spo2, temp) "
+                                 "VALUES (1, '2024-01-01 00:00:00.000000', ?, ?, ?)",
+                                 (70.0 + i, 96.5, None if i == 2 else 37.1))
+
+    assert rebuild_fixed_point_table(engine, VitalSign.__table__, {'heart_rate': 1, 'spo2': 10, 'temp': 10}, batch_size=2) == 5
+    assert rebuild_fixed_point_table(engine, VitalSign.__table__, {'heart_rate': 1, 'spo2': 10, 'temp': 10}, batch_size=2) == 0
+
+    inspector = sa.inspect(engine)
+    assert 'vital_sign_float' not in inspector.get_table_names()
+    assert {column['name']: str(column['type']) for column in inspector.get_columns('vital_sign')}['spo2'] == 'INTEGER'
+    with engine.begin() as conn:
+        rows = conn.execute(sa.select(VitalSign.__table__)).all()
+        assert [row.id for row in rows] == [1001, 1002, 1003, 1004, 1005]
+        assert [(row.heart_rate, row.spo2, row.temp) for row in rows][1:3] == [(71.0, 96.5, 37.1), (72.0, 96.5, None)]
+        conn.execute(VitalSign.__table__.insert().values(patient_id=1, heart_rate=80))
+        assert conn.execute(sa.select(sa.func.max(VitalSign.id))).scalar() == 1006
@@ -0,0 +1,90 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from flask import Flask, render_template_string
+from db import db
+from models import Patient
+from utils import notifications
+from utils.flight_recorder import init_flight_recorder, span
+from utils.notifications import NotificationDispatcher
+
+@pytest.fixture
+def recorder_app():
+    """Create a bare app with the flight recorder and an in-memory database."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['FLIGHT_RECORDER_SIZE'] = 2
+    db.init_app(app)
+    init_flight_recorder(app)
+    
+    @span('load_patients')
+    def load_patients():
+        return Patient.query.all()
+    
+    @app.route('/patients')
+    def patients():
+        names = [p.name for p in load_patients()]
+        return render_template_string('{{ names|join(",") }}', names=names)
+    
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(name="Test Patient", room="101"))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_fast_requests_are_not_recorded(recorder_app):
+    """Test that requests under the threshold leave no trace."""
+    recorder_app.config['FLIGHT_RECORDER_THRESHOLD_MS'] = 60000
+    recorder_app.test_client().get('/patients')
+    
+    assert recorder_app.extensions['flight_recorder'].snapshot() == []
+
+def test_slow_request_timeline_is_recorded(recorder_app):
+    """Test that a slow request keeps its SQL, span and template timeline."""
+    recorder_app.config['FLIGHT_RECORDER_THRESHOLD_MS'] = 0
+    client = recorder_app.test_client()
+    client.get('/patients?ward=a')
+    
+    traces = client.get('/debug/slow-requests.json').get_json()
+    assert len(traces) == 1
+    trace = traces[0]
+    assert trace['path'] == '/patients?ward=a'
+    assert trace['status'] == 200
+    kinds = [event['kind'] for event in trace['timeline']]
+    assert 'sql' in kinds and 'template' in kinds
+    assert any(e['kind'] == 'span' and e['name'] == 'load_patients' for e in trace['timeline'])
+    assert trace['sql_count'] == kinds.count('sql')
+
+def test_ring_buffer_keeps_last_traces(recorder_app):
+    """Test that only the configured number of traces is kept, newest first."""
+    recorder_app.config['FLIGHT_RECORDER_THRESHOLD_MS'] = 0
+    client = recorder_app.test_client()
+    for i in range(4):
+        client.get(f'/patients?n={i}')
+    
+    traces = recorder_app.extensions['flight_recorder'].snapshot()
+    assert [t['path'] for t in traces] == ['/patients?n=3', '/patients?n=2']
+
+def test_notification_sends_are_recorded(recorder_app, monkeypatch):
+    """Test that queueing a critical alert notification and sending its digest show up as spans."""
+    sent = []
+    settings = {'server': 'localhost', 'port': 25, 'username': None, 'password': None,
+                'sender': 'hospital@example.com'}
+    monkeypatch.setattr(notifications, '_dispatcher', NotificationDispatcher(settings, window=0, send=sent.append))
+    monkeypatch.setenv('ATTENDER_EMAIL', 'nurse@example.com')
+    alert = SimpleNamespace(id=1, vital_type='spo2', value=85.0, threshold='>= 90',
+                            timestamp=datetime(2024, 1, 1, 12, 0))
+    
+    @recorder_app.route('/notify')
+    def notify():
+        return str(notifications.send_critical_alert_notification(Patient.query.first(), [alert]))
+    
+    recorder_app.config['FLIGHT_RECORDER_THRESHOLD_MS'] = 0
+    assert recorder_app.test_client().get('/notify').text == 'True'
+    
+    assert len(sent) == 1
+    trace = recorder_app.extensions['flight_recorder'].snapshot()[0]
+    spans = [e['name'] for e in trace['timeline'] if e['kind'] == 'span']
+    assert spans == ['send_notification_digest', 'send_critical_alert_notification']
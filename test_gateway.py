@@ -0,0 +1,117 @@
+import asyncio
+import random
+import threading
+import pytest
+from flask import Flask
+from db import db
+from models import Patient, VitalSign, Alert
+from gateway import DeviceGateway, parse_reading
+import fake_monitor
+from fake_monitor import encode_reading, fake_reading, run_monitor
+from utils.ingest import ingest_in_app
+from utils.vitals import VITALS, VitalType
+
+def test_parse_json_and_line_protocol():
+    """Test that both wire formats parse to the same reading."""
+    expected = {'patient_id': 3, 'heart_rate': 72.0, 'spo2': 97.5, 'temp': 36.9}
+    assert parse_reading(b'{"patient_id": 3, "heart_rate": 72, "spo2": 97.5, "temp": 36.9}\n') == expected
+    assert parse_reading(b'vitals,patient_id=3 heart_rate=72,spo2=97.5,temp=36.9 1700000000\n') == expected
+    with pytest.raises(ValueError):
+        parse_reading(b'vitals heart_rate=72\n')
+
+def test_fake_monitor_sends_every_registered_vital(monkeypatch):
+    """Test that simulated readings carry the registry's vitals in both wire formats."""
+    rng = random.Random(4)
+    for _ in range(20):
+        reading = fake_reading(7, rng)
+        assert set(reading) == {'patient_id', *(vital.name for vital in VITALS)}
+        assert parse_reading(encode_reading(reading, 'line')) == parse_reading(encode_reading(reading))
+    
+    resp_rate = VitalType('resp_rate', 'Respiratory Rate', '/min', 1, warning=(12, 20), critical=(8, 25))
+    monkeypatch.setattr(fake_monitor, 'VITALS', VITALS + [resp_rate])
+    reading = fake_reading(7, rng)
+    assert f"resp_rate={reading['resp_rate']}" in encode_reading(reading, 'line').decode()
+
+def run_gateway(ingest, monitors, **options):
+    """Run a gateway on a free port, drive it with monitors, then flush it."""
+    async def scenario():
+        gateway = DeviceGateway(ingest, **options)
+        host, port = await gateway.start('127.0.0.1', 0)
+        await asyncio.gather(*(monitor(host, port) for monitor in monitors))
+        await gateway.close()
+        return gateway
+    return asyncio.run(scenario())
+
+def test_micro_batches_preserve_per_device_order():
+    """Test that readings arrive in batches with each device's order intact."""
+    batches = []
+    
+    def ingest(batch):
+        batches.append(list(batch))
+    
+    def monitor(patient_id):
+        readings = [{'patient_id': patient_id, 'heart_rate': float(i)} for i in range(50)]
+        return lambda host, port: run_monitor(host, port, patient_id, 50, 0, readings=readings)
+    
+    gateway = run_gateway(ingest, [monitor(p) for p in range(1, 11)], batch_size=64)
+    
+    assert gateway.stats['readings'] == 500
+    assert all(len(batch) <= 64 for batch in batches)
+    assert len(batches) < 500
+    received = [r for batch in batches for r in batch]
+    for patient_id in range(1, 11):
+        assert [r['heart_rate'] for r in received if r['patient_id'] == patient_id] == list(map(float, range(50)))
+
+def test_backpressure_bounds_the_queue():
+    """Test that a slow ingest pauses connections instead of growing the queue."""
+    release = threading.Event()
+    
+    async def scenario():
+        gateway = DeviceGateway(lambda batch: release.wait(5), batch_size=10, queue_size=50)
+        host, port = await gateway.start('127.0.0.1', 0)
+        sender = asyncio.create_task(run_monitor(host, port, 1, 2000, 0, 'line'))
+        await asyncio.sleep(0.2)
+        depth = gateway.queue.qsize()
+        release.set()
+        await sender
+        await gateway.close()
+        return gateway, depth
+    
+    gateway, depth = asyncio.run(scenario())
+    assert depth <= 50
+    assert gateway.stats['readings'] == 2000
+
+def test_gateway_ingests_into_database():
+    """Test the gateway end to end with the shared ingest logic."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Test Patient", room="101"))
+        db.session.commit()
+    
+    readings = [{'patient_id': 1, 'heart_rate': 75, 'spo2': 98, 'temp': 37.0},
+                {'patient_id': 1, 'heart_rate': 110, 'spo2': 98, 'temp': 37.0}]
+    run_gateway(ingest_in_app(app), [lambda h, p: run_monitor(h, p, 1, 2, 0, readings=readings)])
+    
+    with app.app_context():
+        assert [v.heart_rate for v in VitalSign.query.order_by(VitalSign.id)] == [75, 110]
+        alert = Alert.query.one()
+        assert (alert.vital_type, alert.threshold) == ('heart_rate', '60-100')
+        db.drop_all()
+
+def test_failed_readings_are_retried_alone(monkeypatch):
+    """Test that a reading the ingest failed to store is retried without the stored ones."""
+    monkeypatch.setattr('utils.ingest_queue.RETRY_BACKOFF', 0)
+    calls = []
+    
+    def ingest(batch):
+        calls.append([r['heart_rate'] for r in batch])
+        return [RuntimeError("database is locked") if len(calls) == 1 and r['heart_rate'] == 1 else None
+                for r in batch]
+    
+    readings = [{'patient_id': 1, 'heart_rate': float(i)} for i in range(3)]
+    gateway = run_gateway(ingest, [lambda h, p: run_monitor(h, p, 1, 3, 0, readings=readings)], linger=0.2)
+    assert calls == [[0.0, 1.0, 2.0], [1.0]]
+    assert gateway.stats['dropped'] == 0
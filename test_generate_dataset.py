@@ -0,0 +1,57 @@
+import pytest
+from datetime import datetime
+from flask import Flask
+from db import db
+from models import Patient, VitalSign, Alert
+from utils.alerting import DEFAULT_EVALUATOR, VITAL_TYPES
+
+np = pytest.importorskip('numpy')
+import generate_dataset
+from generate_dataset import generate_blocks, generate_to_database
+
+END = datetime(2024, 1, 8, 0, 0, 0)
+
+@pytest.fixture
+def dataset_app():
+    """Create a bare app with an empty in-memory database."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_same_seed_same_data_regardless_of_block_size(monkeypatch):
+    """Test that generation is reproducible and independent of block size."""
+    def collect():
+        return np.concatenate([values['heart_rate'] for _, _, values
+                               in generate_blocks(list(range(1, 9)), END, 288, 300, seed=7)])
+    
+    first = collect()
+    monkeypatch.setattr(generate_dataset, 'BLOCK_ROWS', 288 * 3)
+    assert np.array_equal(first, collect())
+    
+    other_seed = np.concatenate([values['heart_rate'] for _, _, values
+                                 in generate_blocks(list(range(1, 9)), END, 288, 300, seed=8)])
+    assert not np.array_equal(first, other_seed)
+
+def test_bulk_alerts_match_per_reading_classification(dataset_app):
+    """Test that bulk alerts match classifying reading by reading."""
+    progress = []
+    readings, alerts = generate_to_database(db.engine, patients=5, days=2, interval=600, seed=3, end=END,
+                                            report=lambda *totals: progress.append(totals))
+    
+    assert readings == 5 * 288 == VitalSign.query.count()
+    assert progress[-1] == (readings, alerts)
+    expected = sum(len(DEFAULT_EVALUATOR.classify({vital_type: getattr(v, vital_type) for vital_type in VITAL_TYPES}))
+                   for v in VitalSign.query.all())
+    assert alerts == expected == Alert.query.count()
+    
+    # Latest state is set from each patient's last reading
+    patient = Patient.query.first()
+    last = VitalSign.query.filter_by(patient_id=patient.id).order_by(VitalSign.timestamp.desc()).first()
+    assert patient.vitals_updated == last.timestamp == END
+    assert patient.heart_rate == last.heart_rate
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from db import db
+from models import Alert, Patient, PatientStatus, VitalSign
+from utils import ingest
+from utils.alert_events import subscribe
+from utils.ingest import UnknownPatient, ingest_readings
+from utils.trends import init_trends
+
+START = datetime.now().replace(microsecond=0) - timedelta(minutes=40)
+
+def readings():
+    """Normal, warning, critical, partial and trending readings for three patients."""
+    batch = []
+    for i in range(40):
+        timestamp = START + timedelta(minutes=i)
+        batch.append({'patient_id': 1, 'heart_rate': 72, 'spo2': 97.5,
+                      'temp': round(36.6 + 1.2 * i / 60, 1), 'timestamp': timestamp})
+        batch.append({'patient_id': 2, 'heart_rate': 110 if i % 10 == 0 else 80.4,
+                      'spo2': 85.04 if i == 20 else None, 'timestamp': timestamp})
+    batch.append({'patient_id': 3, 'temp': 39.0, 'timestamp': START})
+    return batch
+
+def run_ingest(core, monkeypatch):
+    """Ingest readings() in batches on one path and return everything it wrote and emitted."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['INGEST_CORE'] = core
+    app.config['TREND_ALERTS'] = True
+    db.init_app(app)
+    init_trends(app)
+    events, notified = [], []
+    subscribe(app, lambda action, value: events.append((action, tuple(value))))
+    monkeypatch.setattr(ingest, 'notify_critical_alerts', lambda patient, alerts: notified.append(
+        (patient.id, patient.name, [(alert.id, alert.vital_type, alert.value) for alert in alerts])))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=i, name=f"Patient {i}", room=f"10{i}") for i in (1, 2, 3)])
+        db.session.commit()
+        batch = readings()
+        results = []
+        for i in range(0, len(batch), 16):
+            results.extend(ingest_readings(batch[i:i + 16]))
+        tables = {
+            model.__tablename__: [tuple(row) for row in db.session.execute(sa.select(*model.__table__.columns))]
+            for model in (VitalSign, Alert, PatientStatus)
+        }
+        returned = [((vital.patient_id, vital.timestamp, vital.heart_rate, vital.spo2, vital.temp),
+                     [(alert.id, alert.vital_type, alert.value, alert.severity) for alert in alerts])
+                    for vital, alerts in results]
+        db.session.remove()
+        db.drop_all()
+    return tables, returned, events, notified
+
+def test_core_path_matches_orm_path(monkeypatch):
+    """Test that the Core fast path writes, returns and emits exactly what the ORM path does."""
+    orm = run_ingest(False, monkeypatch)
+    core = run_ingest(True, monkeypatch)
+
+    tables, _, events, notified = core
+    assert len(tables['vital_sign']) == 81
+    assert {row[3] for row in tables['alert']} >= {'heart_rate', 'spo2', 'temp'}
+    assert any(row[5].startswith('trend') for row in tables['alert'])
+    assert events and notified
+
+    for expected, actual in zip(orm, core):
+        assert actual == expected
+
+def test_core_path_statements_do_not_grow_with_batch_size(monkeypatch):
+    """Test that a batch costs a fixed number of statements, not one per reading."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"), Patient(id=2, name="Patient B", room="102")])
+        db.session.commit()
+        statements = []
+        sa.event.listen(db.engine, 'before_cursor_execute',
+                        lambda conn, cursor, statement, *args: statements.append(statement))
+
+        counts = []
+        for size in (2, 200):
+            statements.clear()
+            ingest_readings([{'patient_id': 1 + i % 2, 'heart_rate': 130, 'spo2': 97, 'temp': 37.0,
+                              'timestamp': START + timedelta(seconds=i)} for i in range(size)])
+            counts.append(len(statements))
+        # Patients, readings, alerts, their ids, latest state, rooms and alert rollups, change feed
+        assert counts[0] == counts[1] <= 8
+        assert db.session.execute(sa.select(sa.func.count()).select_from(Alert)).scalar() == 202
+        db.session.remove()
+        db.drop_all()
+
+def test_unknown_patients_are_rejected_before_writing(monkeypatch):
+    """Test that a reading of a missing patient is rejected on its own, leaving no trace."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['TREND_ALERTS'] = True
+    db.init_app(app)
+    trends = init_trends(app)
+    notified = []
+    monkeypatch.setattr(ingest, 'notify_critical_alerts', lambda patient, alerts: notified.append(patient.name))
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Patient A", room="101"))
+        db.session.commit()
+
+        results = ingest_readings([{'patient_id': 1, 'heart_rate': 150, 'timestamp': START},
+                                   {'patient_id': 99, 'heart_rate': 150, 'timestamp': START}])
+        assert isinstance(results[1], UnknownPatient) and results[1].patient_id == 99
+        assert [alert.severity for alert in results[0][1]] == ['critical']
+        assert notified == ["Patient A"]
+        assert db.session.execute(sa.select(VitalSign.patient_id)).scalars().all() == [1]
+        assert trends.get(99) is None
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from utils.ingest import UnknownPatient
+from utils.ingest_queue import (IngestQueue, InvalidReading, QueueFull, ReadingRejected, ingest_with_retry,
+                                validate_reading)
+
+def blocked_queue(**options):
+    """Return a queue whose writer is stuck on its first batch until released."""
+    batches = []
+    started = threading.Event()
+    release = threading.Event()
+    
+    def ingest(readings):
+        started.set()
+        release.wait(5)
+        batches.append([r['patient_id'] for r in readings])
+    
+    queue = IngestQueue(ingest, **options)
+    queue.submit({'patient_id': 0})
+    started.wait(5)
+    return queue, batches, release
+
+def test_critical_readings_jump_the_queue():
+    """Test that critical readings are written before earlier normal ones."""
+    queue, batches, release = blocked_queue(capacity=10, batch_size=2)
+    futures = [queue.submit({'patient_id': 1}), queue.submit({'patient_id': 2}, 'warning'),
+               queue.submit({'patient_id': 3}, 'critical')]
+    release.set()
+    assert [f.result(5) for f in futures] == ['stored'] * 3
+    assert batches == [[0], [3, 1], [2]]
+
+def test_critical_readings_keep_each_patients_order():
+    """Test that a patient's pending readings are written before its critical one."""
+    queue, batches, release = blocked_queue(capacity=10)
+    futures = [queue.submit({'patient_id': 1, 'heart_rate': 70}), queue.submit({'patient_id': 2}),
+               queue.submit({'patient_id': 1, 'heart_rate': 110}, 'warning'),
+               queue.submit({'patient_id': 1, 'heart_rate': 150}, 'critical')]
+    release.set()
+    assert [f.result(5) for f in futures] == ['stored'] * 4
+    assert batches == [[0], [1, 1, 1, 2]]
+
+def test_normal_readings_are_coalesced_then_rejected():
+    """Test load shedding once the queue fills up."""
+    queue, batches, release = blocked_queue(capacity=3, coalesce_at=2)
+    first = queue.submit({'patient_id': 1, 'heart_rate': 70})
+    queue.submit({'patient_id': 2})
+    latest = queue.submit({'patient_id': 1, 'heart_rate': 75})
+    queue.submit({'patient_id': 3}, 'warning')
+    
+    with pytest.raises(QueueFull) as e:
+        queue.submit({'patient_id': 4})
+    assert e.value.retry_after >= 1
+    with pytest.raises(QueueFull):
+        queue.submit({'patient_id': 4}, 'warning')
+    critical = queue.submit({'patient_id': 4}, 'critical')
+    
+    release.set()
+    assert (first.result(5), latest.result(5), critical.result(5)) == ('coalesced', 'stored', 'stored')
+    assert batches[1] == [4, 1, 2, 3]
+
+def test_failed_batches_fail_their_readings(monkeypatch):
+    """Test that a batch that keeps failing surfaces the error to its callers."""
+    monkeypatch.setattr('utils.ingest_queue.MAX_INGEST_ATTEMPTS', 2)
+    
+    def ingest(readings):
+        raise RuntimeError("database is locked")
+    
+    future = IngestQueue(ingest).submit({'patient_id': 1}, 'critical')
+    with pytest.raises(RuntimeError):
+        future.result(5)
+
+def test_only_failed_readings_are_retried(monkeypatch):
+    """Test that stored readings are not written again and a rejected one fails alone."""
+    monkeypatch.setattr('utils.ingest_queue.RETRY_BACKOFF', 0)
+    calls = []
+    
+    def ingest(readings):
+        calls.append([r['patient_id'] for r in readings])
+        return [ReadingRejected("unknown patient") if r['patient_id'] == 99
+                else RuntimeError("database is locked") if r['patient_id'] == 2 and len(calls) == 1
+                else None for r in readings]
+    
+    queue, batches, release = blocked_queue(capacity=10)
+    queue.ingest = ingest
+    futures = [queue.submit({'patient_id': p}, 'warning') for p in (1, 99, 2)]
+    release.set()
+    assert futures[0].result(5) == futures[2].result(5) == 'stored'
+    with pytest.raises(ReadingRejected):
+        futures[1].result(5)
+    assert calls == [[1, 99, 2], [2]]
+
+def test_validate_reading_coerces_or_rejects():
+    """Test that readings are converted to ints and floats, and malformed ones refused."""
+    assert validate_reading({'patient_id': '1', 'heart_rate': '72', 'spo2': 97.5, 'temp': None}) == {
+        'patient_id': 1, 'heart_rate': 72.0, 'spo2': 97.5}
+    for data in (None, [1], {'heart_rate': 150}, {'patient_id': 'x'}, {'patient_id': 1.5},
+                 {'patient_id': 1, 'heart_rate': 'abc'}, {'patient_id': 1, 'spo2': float('nan')}):
+        with pytest.raises(InvalidReading):
+            validate_reading(data)
+
+def test_errors_that_would_repeat_are_not_retried():
+    """Test that TypeError and ValueError fail the batch once instead of being retried."""
+    calls = []
+
+    def ingest(readings):
+        calls.append(len(readings))
+        raise TypeError("not all arguments converted during string formatting")
+
+    errors = ingest_with_retry(ingest, [{'patient_id': 1}, {'patient_id': 2}], backoff=0)
+    assert calls == [2]
+    assert all(isinstance(error, TypeError) for error in errors)
+
+class RecordingQueue:
+    """Stands in for the ingest queue; fails every reading as of an unknown patient."""
+
+    def __init__(self):
+        self.readings = []
+
+    def submit(self, reading, severity=None):
+        self.readings.append((reading, severity))
+        future = Future()
+        future.set_exception(UnknownPatient(reading['patient_id']))
+        return future
+
+def test_update_endpoint_rejects_malformed_readings(monkeypatch):
+    """Test that /update answers 400 for a bad body before queueing, and accepts a numeric string patient_id."""
+    import api.index
+    queue = RecordingQueue()
+    monkeypatch.setattr(api.index, 'ingest_queue', queue)
+    client = api.index.app.test_client()
+
+    for body in ({'heart_rate': 150}, {'patient_id': 1, 'heart_rate': 'abc'}, [1, 2]):
+        response = client.post('/update', json=body)
+        assert response.status_code == 400
+        assert 'Retry-After' not in response.headers
+    assert client.post('/update', data='not json', content_type='application/json').status_code == 400
+    assert queue.readings == []
+
+    assert client.post('/update', json={'patient_id': '1', 'heart_rate': '150'}).status_code == 404
+    [(reading, severity)] = queue.readings
+    assert (reading['patient_id'], reading['heart_rate'], severity) == (1, 150.0, 'critical')
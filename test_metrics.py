@@ -0,0 +1,65 @@
+import pytest
+from flask import Flask, render_template_string
+from db import db
+from models import Patient
+from utils.metrics import MetricsRegistry, init_metrics, REQUEST_SQL_QUERIES
+
+@pytest.fixture
+def metrics_app():
+    """Create a bare instrumented app backed by an in-memory database."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    init_metrics(app)
+    
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        # One query per patient, the pattern the metrics should expose
+        ids = [p.id for p in Patient.query.all()]
+        names = [db.session.get(Patient, i, populate_existing=True).name for i in ids]
+        return render_template_string('{{ names|join(",") }}', names=names)
+    
+    with app.app_context():
+        db.create_all()
+        for i in range(3):
+            db.session.add(Patient(name=f"Patient {i}", room=str(100 + i)))
+        db.session.commit()
+        db.session.expunge_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_counter_and_histogram_rendering():
+    """Test the text exposition format of counters and histograms."""
+    registry = MetricsRegistry()
+    counter = registry.counter('alerts_total', 'Alerts.', ('severity',))
+    histogram = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    
+    counter.inc(severity='critical')
+    counter.inc(2, severity='warning')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    
+    output = registry.render()
+    assert '# TYPE alerts_total counter' in output
+    assert 'alerts_total{severity="critical"} 1' in output
+    assert 'alerts_total{severity="warning"} 2' in output
+    assert 'latency_seconds_bucket{le="0.1"} 1' in output
+    assert 'latency_seconds_bucket{le="1"} 2' in output
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in output
+    assert 'latency_seconds_count 2' in output
+
+def test_request_sql_queries_are_recorded_per_route(metrics_app):
+    """Test that per-request SQL counts are recorded and exposed."""
+    client = metrics_app.test_client()
+    before = REQUEST_SQL_QUERIES.count(route='/n-plus-one', method='GET')
+    
+    response = client.get('/n-plus-one')
+    assert response.data == b'Patient 0,Patient 1,Patient 2'
+    assert REQUEST_SQL_QUERIES.count(route='/n-plus-one', method='GET') == before + 1
+    
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_sql_queries_count{route="/n-plus-one",method="GET"}' in metrics
+    # 1 list query + 3 per-patient lookups lands in the le="5" bucket, not le="2"
+    assert 'http_request_sql_queries_bucket{route="/n-plus-one",method="GET",le="2"} 0' in metrics
+    assert 'http_request_template_seconds_total{route="/n-plus-one",method="GET"}' in metrics
@@ -0,0 +1,101 @@
+import sqlite3
+import pytest
+import sqlalchemy as sa
+from utils import migrations
+from utils.migrations import current_revision, downgrade, upgrade
+
+def old_database(path, alerts=10):
+    """Create a database with the schema from before the migrations."""
+    engine = sa.create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE patient (id INTEGER PRIMARY KEY, name VARCHAR(100), room VARCHAR(20), "
+                             "heart_rate FLOAT, spo2 FLOAT, temp FLOAT, vitals_updated DATETIME, "
+                             "heart_rate_alert BOOLEAN, spo2_alert BOOLEAN, temp_alert BOOLEAN)")
+        conn.exec_driver_sql("INSERT INTO patient VALUES (1, 'Patient A', '101', 72, 97.5, 36.9, "
+                             "'2024-01-01 00:00:00.000000', 0, 1, NULL)")
+        conn.exec_driver_sql("CREATE TABLE vital_sign (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER NOT NULL, "
+                             "timestamp DATETIME, heart_rate FLOAT, spo2 FLOAT, temp FLOAT)")
+        conn.exec_driver_sql("INSERT INTO vital_sign (patient_id, timestamp, heart_rate, spo2, temp) "
+                             "VALUES (1, '2024-01-01 00:00:00.000000', 72, 97.5, 36.9)")
+        conn.exec_driver_sql("CREATE TABLE alert (id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id INTEGER NOT NULL, "
+                             "timestamp DATETIME, vital_type VARCHAR(20) NOT NULL, value FLOAT NOT NULL, "
+                             "threshold VARCHAR(50) NOT NULL)")
+        for i in range(alerts):
+            conn.exec_driver_sql("INSERT INTO alert (patient_id, timestamp, vital_type, value, threshold) "
+                                 "VALUES (1, '2024-01-01 00:00:00.000000', 'spo2', ?, '>= 95')", (85.0 if i % 2 else 93.0,))
+    return engine
+
+def test_upgrade_converts_an_old_database_and_is_idempotent(tmp_path):
+    """Test that the revisions bring an unversioned database to head, and that re-running changes nothing."""
+    engine = old_database(tmp_path / 'old.db')
+    upgrade(engine, batch_size=3, pause=0)
+    assert current_revision(engine) == '0006'
+    assert 'ix_vital_sign_patient_timestamp' in {index['name'] for index in sa.inspect(engine).get_indexes('vital_sign')}
+    assert 'ix_alert_unacknowledged' in {index['name'] for index in sa.inspect(engine).get_indexes('alert')}
+
+    with engine.connect() as conn:
+        alerts = conn.exec_driver_sql("SELECT value, acknowledged, severity, escalation_level FROM alert").all()
+        assert alerts[:2] == [(9300, 1, 'warning', 0), (8500, 1, 'critical', 0)]
+        assert [severity for _, _, severity, _ in alerts].count('critical') == 5
+        assert conn.exec_driver_sql("SELECT * FROM patient").all() == [(1, 'Patient A', '101')]
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp, spo2_alert FROM patient_status").one() == (72, 975, 369, 1)
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp FROM vital_sign").one() == (72, 975, 369)
+        assert conn.exec_driver_sql("SELECT name, rows_done, done FROM migration_checkpoint ORDER BY name").all() == [
+            ('0001.alert.acknowledged', 10, 1), ('0001.alert.severity', 5, 1)]
+
+    upgrade(engine, batch_size=3, pause=0)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT value, acknowledged, severity, escalation_level FROM alert").all() == alerts
+
+def test_backfill_lets_writers_in_between_batches_and_resumes(tmp_path, monkeypatch, capsys):
+    """Test that each batch commits on its own, so ingest can write, and that an interrupted backfill resumes."""
+    path = tmp_path / 'old.db'
+    engine = old_database(path)
+    pauses = []
+
+    def write_between_batches(seconds):
+        # A writer that gives up almost at once fails if a batch still holds the lock
+        with sqlite3.connect(path, timeout=0.05) as writer:
+            writer.execute("INSERT INTO alert (patient_id, timestamp, vital_type, value, threshold, acknowledged, "
+                           "severity, escalation_level) VALUES (1, '2024-01-01 00:01:00.000000', 'spo2', 85.0, "
+                           "'>= 95', 0, 'critical', 0)")
+        pauses.append(seconds)
+        if len(pauses) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(migrations.time, 'sleep', write_between_batches)
+    with pytest.raises(KeyboardInterrupt):
+        upgrade(engine, batch_size=3, pause=0.01)
+    assert current_revision(engine) is None
+
+    monkeypatch.setattr(migrations.time, 'sleep', lambda seconds: None)
+    upgrade(engine, batch_size=3, pause=0.01)
+    assert 'resuming after id 6' in capsys.readouterr().out
+    assert current_revision(engine) == '0006'
+    with engine.connect() as conn:
+        # Rows written during the migration are not marked acknowledged
+        assert conn.exec_driver_sql("SELECT id, acknowledged FROM alert WHERE id > 8").all() == [
+            (9, 1), (10, 1), (11, 0), (12, 0)]
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM alert WHERE acknowledged").scalar() == 10
+
+def test_downgrade_restores_the_old_schema_and_upgrades_again(tmp_path):
+    """Test that downgrading to base gives back the old tables and values, and that upgrading again works."""
+    engine = old_database(tmp_path / 'old.db')
+    upgrade(engine, batch_size=3, pause=0)
+    downgrade(engine, 'base')
+    assert current_revision(engine) is None
+
+    inspector = sa.inspect(engine)
+    assert 'patient_status' not in inspector.get_table_names()
+    assert [column['name'] for column in inspector.get_columns('alert')] == [
+        'id', 'patient_id', 'timestamp', 'vital_type', 'value', 'threshold']
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp, spo2_alert FROM patient").one() == (72, 97.5, 36.9, 1)
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp FROM vital_sign").one() == (72, 97.5, 36.9)
+        assert conn.exec_driver_sql("SELECT value FROM alert ORDER BY id LIMIT 2").scalars().all() == [93.0, 85.0]
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM migration_checkpoint").scalar() == 0
+
+    upgrade(engine, batch_size=3, pause=0)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT severity FROM alert").scalars().all().count('critical') == 5
+        assert conn.exec_driver_sql("SELECT heart_rate, spo2, temp FROM patient_status").one() == (72, 975, 369)
@@ -0,0 +1,90 @@
+import socketserver
+import threading
+from datetime import datetime
+import pytest
+from utils.notifications import Notice, NotificationDispatcher, RateLimiter, build_digest
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for smtplib to send messages."""
+    
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+    
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append(data.decode())
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def notice(alert_id, patient_id, vital_type='spo2'):
+    return Notice(alert_id, patient_id, f"Patient {patient_id}", f"10{patient_id}", vital_type,
+                  85.0, '>= 90', datetime(2024, 1, 1, 12, 0), 0)
+
+def dispatcher_for(server, **options):
+    settings = {'server': '127.0.0.1', 'port': server.server_address[1], 'username': None,
+                'password': None, 'sender': 'hospital@example.com'}
+    return NotificationDispatcher(settings, **options)
+
+def test_alert_storm_is_coalesced_over_one_connection(smtp_server):
+    """Test that many alerts become one digest per recipient set over a pooled connection."""
+    dispatcher = dispatcher_for(smtp_server, window=60)
+    for i in range(50):
+        dispatcher.submit([notice(i, i % 5)], ['nurse@example.com'])
+    dispatcher.submit([notice(100, 1)], ['doctor@example.com'])
+    
+    assert dispatcher.flush() == 0  # Still inside the window
+    assert dispatcher.flush(force=True) == 2
+    assert smtp_server.connections == 1
+    digest = next(m for m in smtp_server.messages if 'nurse@example.com' in m)
+    assert 'CRITICAL: 50 alerts for 5 patients' in digest
+    assert digest.count('SpO2: 85.0') == 50
+
+def test_rate_limit_delays_but_keeps_alerts(smtp_server):
+    """Test that a recipient over the limit gets later alerts merged into the next digest."""
+    dispatcher = dispatcher_for(smtp_server, window=0, rate_per_minute=1)
+    dispatcher.submit([notice(1, 1)], ['nurse@example.com'])
+    dispatcher.submit([notice(2, 1)], ['nurse@example.com'])
+    dispatcher.submit([notice(3, 2)], ['nurse@example.com'])
+    assert len(smtp_server.messages) == 1
+    
+    assert dispatcher.flush(force=True) == 1
+    assert len(smtp_server.messages) == 2
+    assert 'CRITICAL: 2 alerts for 2 patients' in smtp_server.messages[1]
+    assert smtp_server.connections == 1
+
+def test_digest_subject_and_rate_limiter():
+    """Test digest subjects for one patient and the token bucket refill."""
+    message = build_digest([notice(1, 3), notice(2, 3, 'heart_rate')], 'a@example.com', ['b@example.com'])
+    assert message['Subject'] == 'CRITICAL: 2 alerts for Patient 3 (Room 103)'
+    
+    limiter = RateLimiter(per_minute=2)
+    limiter.take(['b'], 0)
+    limiter.take(['b'], 0)
+    assert limiter.wait_time(['b'], 0) == pytest.approx(30)
+    assert limiter.wait_time(['b'], 30) == 0
@@ -0,0 +1,57 @@
+from datetime import datetime
+import pytest
+from flask import Flask, render_template
+from db import db
+from models import Patient
+from utils.patient_rows import patient_row, patient_rows
+from utils.patient_status import status_row, upsert_status
+from utils.vitals import init_vitals
+
+@pytest.fixture
+def app():
+    app = Flask(__name__, template_folder='templates')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    init_vitals(app)
+
+    @app.template_filter('datetime')
+    def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
+        return value.strftime(format) if value else ""
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=i, name=f"Patient {i}", room=str(100 + i)) for i in range(1, 4)])
+        db.session.commit()
+        upsert_status([status_row(1, datetime(2024, 1, 1, 12), {'heart_rate': 72, 'spo2': 97.5, 'temp': 36.8}),
+                       status_row(2, datetime(2024, 1, 1, 12), {'heart_rate': 130, 'spo2': 92.0, 'temp': 37.0},
+                                  {'heart_rate', 'spo2'})])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def test_rows_match_orm_patients_without_touching_session(app):
+    """Test that rows carry the same values as Patient and leave the session empty."""
+    pending = Patient(id=4, name="Not flushed", room="104")
+    db.session.add(pending)
+    rows = patient_rows()
+
+    # No autoflush: the pending patient is not seen, and nothing is identity-mapped
+    assert [row.id for row in rows] == [1, 2, 3]
+    assert len(db.session.identity_map) == 0
+    db.session.expunge(pending)
+
+    attrs = ('id', 'name', 'room', 'heart_rate', 'spo2', 'temp', 'vitals_updated',
+             'heart_rate_alert', 'spo2_alert', 'temp_alert', 'has_alert')
+    for row, patient in zip(rows, Patient.query.order_by(Patient.id)):
+        assert tuple(getattr(row, a) for a in attrs) == tuple(getattr(patient, a) for a in attrs)
+    assert [row.current_risk for row in rows] == [False, True, False]
+    assert patient_row(2) == rows[1] and patient_row(99) is None
+
+def test_rows_render_patient_table(app):
+    """Test that the table fragment renders from rows."""
+    with app.test_request_context():
+        app.add_url_rule('/acknowledge/<int:patient_id>/<string:vital_type>', 'acknowledge_alert')
+        html = render_template('table_content.html', patients=patient_rows([1, 2]))
+    assert html.count('<tr') == 2
+    assert html.count('at-risk') == 1
+    assert '130 bpm' in html and '97.5%' in html
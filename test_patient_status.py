@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from db import db
+from models import Patient, PatientStatus
+from utils.ingest import ingest_readings
+from utils.patient_status import clear_alert_flags, status_row, upsert_status
+
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Patient A", room="101"),
+                            Patient(id=2, name="Patient B", room="102")])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def capture_statements():
+    statements = []
+    sa.event.listen(db.engine, 'before_cursor_execute',
+                    lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+def test_upsert_keeps_latest_reading_and_missing_vitals(app):
+    """Test that upserts merge by timestamp and never touch the patient row."""
+    statements = capture_statements()
+    upsert_status([status_row(1, NOW, {'heart_rate': 72, 'spo2': 97.0, 'temp': 36.8}),
+                   status_row(1, NOW + timedelta(seconds=10), {'heart_rate': 130}, {'heart_rate'}),
+                   status_row(2, NOW, {'heart_rate': 80, 'spo2': 88.0, 'temp': 37.0}, {'spo2'})])
+    db.session.commit()
+
+    # A late reading, and a reading with only SpO2
+    upsert_status([status_row(1, NOW - timedelta(minutes=5), {'heart_rate': 60, 'spo2': 99.0, 'temp': 36.0})])
+    upsert_status([status_row(2, NOW + timedelta(seconds=10), {'spo2': 96.0})])
+    db.session.commit()
+
+    a, b = db.session.get(Patient, 1), db.session.get(Patient, 2)
+    assert (a.heart_rate, a.spo2, a.temp, a.has_alert) == (130, 97.0, 36.8, True)
+    assert a.vitals_updated == NOW + timedelta(seconds=10)
+    assert (b.heart_rate, b.spo2, b.spo2_alert, b.has_alert) == (80, 96.0, False, False)
+    assert not any('patient ' in s.lower() and s.lower().startswith(('update', 'insert')) for s in statements)
+
+def test_ingest_updates_status_and_acknowledge_clears_flag_only(app):
+    """Test that ingest fills patient_status and clearing a flag leaves the vitals alone."""
+    ingest_readings([{'patient_id': 1, 'heart_rate': 72, 'spo2': 91, 'temp': 37.0, 'timestamp': NOW},
+                     {'patient_id': 2, 'heart_rate': 75, 'spo2': 98, 'temp': 36.9, 'timestamp': NOW}])
+    patient = db.session.get(Patient, 1)
+    assert (patient.spo2, patient.spo2_alert, patient.heart_rate_alert) == (91, True, False)
+    assert db.session.get(Patient, 2).has_alert is False
+
+    statements = capture_statements()
+    clear_alert_flags([1], 'spo2')
+    clear_alert_flags([1], 'unknown')
+    db.session.commit()
+    status = db.session.get(PatientStatus, 1)
+    assert (status.spo2, status.spo2_alert, status.vitals_updated) == (91, False, NOW)
+    assert [s.split(' WHERE')[0] for s in statements if s.startswith('UPDATE')] == \
+        ['UPDATE patient_status SET spo2_alert=?']
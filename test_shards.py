@@ -0,0 +1,107 @@
+from datetime import datetime
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from db import db
+from models import Alert, Patient, VitalSign
+from utils.alert_index import alert_index, init_alert_index
+from utils.bulk_import import import_readings
+from utils.export import stream_export
+from utils.ingest import ingest_readings
+from utils.patient_rows import patient_rows
+from utils.shards import (SHARD_ID_BITS, configure_shards, create_patient, create_shard_tables,
+                          shard_engines, shard_for_alert, use_shard)
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'main.db'}"
+    app.config['SHARD_DATABASE_URLS'] = f"sqlite:///{tmp_path / 'ward1.db'},sqlite:///{tmp_path / 'ward2.db'}"
+    app.config['SHARD_WARDS'] = 'W01=1,W02=2'
+    configure_shards(app)
+    db.init_app(app)
+    init_alert_index(app)
+    with app.app_context():
+        create_shard_tables()
+        patients = {}
+        for name, room in [("A", "W01-01"), ("B", "W02-01"), ("C", "W01-02"), ("D", "W02-02")]:
+            patient, key = create_patient(name, room)
+            patients[name] = (patient.id, key)
+        db.session.commit()
+        yield app, patients
+    # init_app registers a metadata per bind on the shared db; drop them so
+    # apps created by other tests don't look for these binds
+    for key in ('shard1', 'shard2'):
+        db.metadatas.pop(key, None)
+
+def rows_in(key, model):
+    with db.engines[key].connect() as conn:
+        return conn.execute(sa.select(model.__table__.c.patient_id if model is not Patient else Patient.id)).scalars().all()
+
+def test_ingest_routes_each_patient_to_its_ward_shard(app):
+    """Test that readings and alerts are stored in the owning shard with non-overlapping ids."""
+    app, patients = app
+    assert [key for _, key in patients.values()] == ['shard1', 'shard2', 'shard1', 'shard2']
+
+    ingest_readings([{'patient_id': patient_id, 'heart_rate': 150, 'spo2': 97, 'temp': 37.0,
+                      'timestamp': datetime(2024, 1, 1, 12)} for patient_id, _ in patients.values()])
+
+    for name, (patient_id, key) in patients.items():
+        assert patient_id in rows_in(key, Patient)
+        assert rows_in(key, VitalSign).count(patient_id) == 1
+        assert rows_in(key, Alert).count(patient_id) == 1
+    assert rows_in(None, VitalSign) == []
+
+    # Ids name their shard
+    for _, key in patients.values():
+        with db.engines[key].connect() as conn:
+            alert_id = conn.execute(sa.select(Alert.id)).scalar()
+        assert alert_id >> SHARD_ID_BITS == ['shard1', 'shard2'].index(key) + 1
+        assert shard_for_alert(alert_id) == key
+
+def test_hospital_wide_views_merge_shards(app):
+    """Test that patient rows and the alert queue fan out over every shard."""
+    app, patients = app
+    ingest_readings([{'patient_id': patients['B'][0], 'heart_rate': 110, 'timestamp': datetime(2024, 1, 1, 12)},
+                     {'patient_id': patients['C'][0], 'spo2': 85, 'timestamp': datetime(2024, 1, 1, 12, 1)}])
+
+    rows = patient_rows()
+    assert [row.id for row in rows] == sorted(patient_id for patient_id, _ in patients.values())
+    assert {row.name for row in rows if row.has_alert} == {'B', 'C'}
+
+    index = alert_index()
+    index.invalidate()
+    top = index.top()
+    assert [entry.patient_id for entry in top] == [patients['C'][0], patients['B'][0]]  # critical first
+    assert {info.name for info in index.patients_for(top).values()} == {'B', 'C'}
+
+    # Acknowledging in the owning shard updates the index
+    with use_shard(shard_for_alert(top[0].id)):
+        db.session.get(Alert, top[0].id).acknowledged = True
+        db.session.commit()
+    assert [entry.patient_id for entry in index.top()] == [patients['B'][0]]
+
+def test_bulk_writers_and_exports_cover_every_shard(app, tmp_path):
+    """Test that imports and generated data go to each patient's shard and exports merge the shards."""
+    app, patients = app
+    ids = [patient_id for patient_id, _ in patients.values()]
+    path = tmp_path / 'history.csv'
+    path.write_text('patient_id,timestamp,heart_rate,spo2,temp\n' + ''.join(
+        f"{patient_id},2024-01-01T12:0{i}:00,{130 if i == 0 else 75},98.0,36.9\n" for i, patient_id in enumerate(ids)))
+
+    assert import_readings(shard_engines(), str(path), chunk_size=3) == (4, 1)
+    for patient_id, key in patients.values():
+        assert rows_in(key, VitalSign).count(patient_id) == 1
+    assert rows_in(None, VitalSign) == []
+    assert import_readings(shard_engines(), str(path)) == (0, 0)
+
+    exported = ''.join(stream_export(shard_engines(), 'vitals', 'csv')).splitlines()
+    assert [int(line.split(',')[1]) for line in exported[1:]] == ids  # merged by timestamp
+
+    generate_dataset = pytest.importorskip('generate_dataset')
+    generate_dataset.generate_to_database(shard_engines(), patients=30, days=0.1, interval=600, seed=1)
+    for index, key in enumerate(('shard1', 'shard2'), start=1):
+        with db.engines[key].connect() as conn:
+            rooms = dict(conn.execute(sa.select(Patient.id, Patient.room)).all())
+        assert all(patient_id % 3 == index and room.startswith(f'W0{index}') for patient_id, room in rooms.items())
+        assert set(rows_in(key, VitalSign)) == set(rooms)
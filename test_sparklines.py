@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from db import db
+from models import Patient, VitalSign
+from utils.ingest import ingest_readings
+from utils.sparklines import SparklineBuffers, init_sparklines
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    init_sparklines(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Test Patient", room="101"))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def test_ring_buffer_keeps_last_hour_in_fixed_memory():
+    """Test that old minutes are overwritten and each minute keeps its latest reading."""
+    buffers = SparklineBuffers(seconds=3600, points=60)
+    start = datetime(2024, 1, 1, 12, 0)
+    for i in range(180):  # Three hours, one reading every minute
+        buffers.add(1, start + timedelta(minutes=i), {'heart_rate': 60 + i, 'spo2': 97.0})
+    sizes = (len(buffers._rings[1].buckets), len(buffers._rings[1].values))
+
+    # A second reading in the last minute replaces the first
+    now = start + timedelta(minutes=179, seconds=30)
+    buffers.add(1, now, {'heart_rate': 300})
+    series = buffers.series(1, 'heart_rate', now.timestamp())
+
+    assert [value for _, value in series] == [60 + i for i in range(120, 179)] + [300]
+    assert [offset for offset, _ in series] == list(range(60))
+    assert (len(buffers._rings[1].buckets), len(buffers._rings[1].values)) == sizes == (60, 180)
+
+    # Missing vitals and stale readings are skipped
+    assert buffers.series(1, 'temp', now.timestamp()) == []
+    buffers.add(1, start, {'heart_rate': 1})
+    assert buffers.series(1, 'heart_rate', now.timestamp())[-1] == (59, 300)
+    assert '<polyline' in buffers.svg(1, 'heart_rate', now.timestamp())
+    assert buffers.svg(1, 'temp', now.timestamp()) == ''
+
+def test_sparklines_warmed_from_database_and_filled_on_ingest(app):
+    """Test that stored readings warm the buffers once per patient and new readings are added on ingest."""
+    now = datetime.now()
+    db.session.add_all([
+        VitalSign(patient_id=1, heart_rate=70 + i, spo2=97, temp=37.0, timestamp=now - timedelta(minutes=10 - i))
+        for i in range(5)
+    ] + [VitalSign(patient_id=1, heart_rate=200, spo2=97, temp=37.0, timestamp=now - timedelta(hours=2))])
+    db.session.commit()
+
+    buffers = app.extensions['sparklines']
+    buffers.warm([1, 2])
+    assert [value for _, value in buffers.series(1, 'heart_rate')] == [70, 71, 72, 73, 74]
+    assert buffers.series(2, 'heart_rate') == []
+
+    # Warming again does not query the database
+    db.session.add(VitalSign(patient_id=1, heart_rate=150, spo2=97, temp=37.0, timestamp=now - timedelta(minutes=1)))
+    db.session.commit()
+    buffers.warm([1])
+    assert buffers.series(1, 'heart_rate')[-1][1] == 74
+
+    ingest_readings([{'patient_id': 1, 'heart_rate': 90, 'spo2': 96, 'temp': 37.2, 'timestamp': now}])
+    assert buffers.series(1, 'heart_rate')[-1][1] == 90
+    assert buffers.series(1, 'temp')[-1][1] == pytest.approx(37.2)
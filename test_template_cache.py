@@ -0,0 +1,40 @@
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from flask import Flask, render_template
+from app import format_datetime
+from utils.template_cache import compile_app_templates, configure_template_cache
+
+@pytest.fixture
+def template_app():
+    """Create a bare Flask app that renders the project templates."""
+    app = Flask(__name__)
+    app.add_template_filter(format_datetime, 'datetime')
+    return app
+
+def render_card(app):
+    patient = SimpleNamespace(id=1, name="Test Patient", room="101", has_alert=True,
+                              heart_rate=120, spo2=97.6, temp=36.9,
+                              heart_rate_alert=True, spo2_alert=False, temp_alert=False,
+                              vitals_updated=datetime(2024, 1, 1, 12, 0, 0))
+    with app.app_context():
+        return render_template('_patient_card.html', patient=patient)
+
+def test_precompiled_templates_render_same_output(template_app, tmp_path):
+    """Test that precompiled templates render exactly like the sources."""
+    expected = render_card(template_app)
+    
+    compiled_dir = tmp_path / 'compiled'
+    assert compile_app_templates(template_app, str(compiled_dir)) > 0
+    assert configure_template_cache(template_app, str(compiled_dir), str(tmp_path / 'cache'))
+    
+    assert render_card(template_app) == expected
+
+def test_stale_precompiled_templates_are_ignored(template_app, tmp_path):
+    """Test that a build with a mismatched fingerprint falls back to sources."""
+    compiled_dir = tmp_path / 'compiled'
+    compile_app_templates(template_app, str(compiled_dir))
+    (compiled_dir / 'templates.sha1').write_text('stale')
+    
+    assert not configure_template_cache(template_app, str(compiled_dir), str(tmp_path / 'cache'))
+    assert 'Test Patient' in render_card(template_app)
@@ -0,0 +1,94 @@
+import json
+from datetime import datetime
+import pytest
+from flask import Flask
+from db import db
+from models import Alert, Patient, ThresholdProfile
+from utils.alerting import DEFAULT_EVALUATOR
+from utils.bulk_import import import_readings
+from utils.ingest import ingest_readings
+from utils.threshold_profiles import (delete_profile, evaluator_for, init_threshold_profiles,
+                                      parse_overrides, set_profile)
+
+def make_app(core=False):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['INGEST_CORE'] = core
+    app.config['THRESHOLD_REFRESH_SECONDS'] = 3600
+    db.init_app(app)
+    init_threshold_profiles(app)
+    return app
+
+@pytest.mark.parametrize('core', [False, True])
+def test_ward_and_patient_profiles_are_layered_on_both_ingest_paths(monkeypatch, core):
+    """Test that a patient's profile applies over their ward's, which applies over the defaults."""
+    monkeypatch.setattr('utils.ingest.notify_critical_alerts', lambda patient, alerts: None)
+    app = make_app(core)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="COPD patient", room="101"),
+                            Patient(id=2, name="Ward 1 patient", room="102"),
+                            Patient(id=3, name="Ward 2 patient", room="201")])
+        db.session.commit()
+        set_profile('Cardiac', {'heart_rate': {'warning': {'max': 120}}}, ward='1')
+        set_profile('COPD', {'spo2': {'warning': {'min': 88}, 'critical': {'min': 85}}}, patient_id=1)
+
+        results = ingest_readings([{'patient_id': patient_id, 'heart_rate': 110, 'spo2': 89.0,
+                                    'timestamp': datetime(2024, 1, 1)} for patient_id in (1, 2, 3)])
+        raised = [sorted((alert.vital_type, alert.severity) for alert in alerts) for _, alerts in results]
+        assert raised == [
+            [],
+            [('spo2', 'critical')],
+            [('heart_rate', 'warning'), ('spo2', 'critical')],
+        ]
+        # Patients without a profile share the default evaluator
+        assert evaluator_for(3) is DEFAULT_EVALUATOR
+        db.session.remove()
+        db.drop_all()
+
+def test_bulk_imports_use_profiles(tmp_path):
+    """Test that imported readings are classified with the patient's profile."""
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="COPD patient", room="101"),
+                            Patient(id=2, name="Other patient", room="102")])
+        db.session.commit()
+        set_profile('COPD', {'spo2': {'warning': {'min': 88}, 'critical': {'min': 85}}}, patient_id=1)
+        path = tmp_path / 'history.csv'
+        path.write_text('patient_id,timestamp,heart_rate,spo2,temp\n'
+                        '1,2024-01-01T00:00:00,75,89.0,36.9\n'
+                        '2,2024-01-01T00:00:00,75,89.0,36.9\n')
+
+        assert import_readings(db.engine, str(path)) == (2, 1)
+        assert [(alert.patient_id, alert.severity) for alert in Alert.query.all()] == [(2, 'critical')]
+        db.session.remove()
+        db.drop_all()
+
+def test_changes_by_other_workers_are_picked_up_on_refresh():
+    """Test that profiles written elsewhere apply after a refresh, and that bad overrides are rejected."""
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(id=1, name="Patient A", room="W03-12"))
+        db.session.commit()
+        profiles = app.extensions['threshold_profiles']
+        assert evaluator_for(1).classify({'spo2': 89.0})[0][2] == 'critical'
+
+        # Written by another process: not seen until the next refresh
+        db.session.add(ThresholdProfile(ward='W03', name="Respiratory", updated=datetime.now(),
+                                        overrides=json.dumps({'spo2': {'critical': {'min': 85.0}}})))
+        db.session.commit()
+        assert evaluator_for(1).classify({'spo2': 89.0})[0][2] == 'critical'
+        profiles.invalidate()
+        assert evaluator_for(1).classify({'spo2': 89.0})[0][2] == 'warning'
+
+        assert delete_profile(ward='W03')
+        assert evaluator_for(1) is DEFAULT_EVALUATOR
+
+        with pytest.raises(ValueError):
+            parse_overrides({'spo2': {'warning': {'min': 101}}})
+        with pytest.raises(ValueError):
+            parse_overrides({'blood_pressure': {'warning': {'max': 140}}})
+        db.session.remove()
+        db.drop_all()
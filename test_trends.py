@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from flask import Flask
+from db import db
+from models import Patient, Alert, PatientTrend
+from utils.ingest import ingest_readings
+from utils.trends import RollingWindow, TrendTracker, init_trends, news2_points
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['TREND_ALERTS'] = True
+    db.init_app(app)
+    init_trends(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Patient(id=1, name="Rising", room="101"), Patient(id=2, name="Flat", room="102")])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def test_rolling_window_matches_full_recomputation():
+    """Test the incremental statistics against NumPy over the samples in the window."""
+    rng = np.random.default_rng(0)
+    window = RollingWindow(window_seconds=600, bucket_seconds=60)
+    times = np.arange(0, 1800, 15.0)
+    values = 37 + times / 3600 + rng.normal(0, 0.1, len(times))
+    for t, x in zip(times, values):
+        window.add(1_700_000_000 + t, x)
+    
+    # Buckets that ended more than the window ago were evicted
+    kept = times >= 1800 - 600 - 60
+    t, x = times[kept][-window.count:], values[kept][-window.count:]
+    assert window.count == len(x)
+    assert window.mean() == pytest.approx(x.mean())
+    assert window.variance() == pytest.approx(x.var(ddof=1))
+    assert window.slope() == pytest.approx(np.polyfit(t, x, 1)[0] * 3600)
+
+def test_news2_points():
+    """Test NEWS2 bands for the measured parameters."""
+    assert [news2_points('spo2', v) for v in (91, 93, 95, 96)] == [3, 2, 1, 0]
+    assert [news2_points('heart_rate', v) for v in (40, 45, 70, 100, 120, 140)] == [3, 1, 0, 1, 2, 3]
+    assert [news2_points('temp', v) for v in (35.0, 35.5, 37.0, 38.5, 39.5)] == [3, 1, 0, 1, 2]
+
+def readings(start, minutes, temp_per_hour):
+    return [
+        {'patient_id': patient_id, 'heart_rate': 75, 'spo2': 98,
+         'temp': round(36.6 + (temp_per_hour if patient_id == 1 else 0) * i / 60, 1),
+         'timestamp': start + timedelta(minutes=i)}
+        for i in range(minutes) for patient_id in (1, 2)
+    ]
+
+def test_trend_alert_inside_the_normal_band(app):
+    """Test that a steady climb within thresholds raises one trend alert."""
+    ingest_readings(readings(datetime.now() - timedelta(minutes=30), 30, 1.2))
+    
+    alerts = Alert.query.all()
+    assert [(a.patient_id, a.vital_type, a.threshold) for a in alerts] == [(1, 'temp', 'trend +0.5/h')]
+    # Monitors report temperature in tenths, so the fitted slope is not exact
+    assert alerts[0].value == pytest.approx(1.2, abs=0.1)
+    summary = app.extensions['trends'].get(1).summary()
+    assert summary['news2'] == 0 and summary['risk'] == 'low'
+
+def test_recovers_from_snapshot_and_newer_readings(app):
+    """Test that a new worker restores trends from the snapshot plus readings since."""
+    start = datetime.now() - timedelta(minutes=30)
+    all_readings = readings(start, 30, 1.2)
+    tracker = app.extensions['trends']
+    ingest_readings(all_readings[:40])
+    tracker.save_snapshots(force=True)
+    db.session.commit()
+    ingest_readings(all_readings[40:])
+    assert PatientTrend.query.count() == 2
+    
+    restored = TrendTracker()
+    restored.load([1, 2])
+    for patient_id in (1, 2):
+        expected = tracker.get(patient_id).summary()
+        actual = restored.get(patient_id).summary()
+        assert actual['vitals']['temp']['count'] == expected['vitals']['temp']['count']
+        assert actual['vitals']['temp']['slope'] == pytest.approx(expected['vitals']['temp']['slope'])
@@ -0,0 +1,72 @@
+import os
+import random
+import subprocess
+import sys
+import textwrap
+import pytest
+from utils.alerting import VITAL_TYPES, classify_batch, classify_reading
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def test_batch_classification_matches_per_reading():
+    """Test that column-wise classification gives the same alerts as classify_reading."""
+    pytest.importorskip('numpy')
+    rng = random.Random(7)
+    ranges = {'heart_rate': (30, 150), 'spo2': (80, 100), 'temp': (34, 40)}
+    rows = [[None if rng.random() < 0.2 else round(rng.uniform(*ranges[vital_type]), 1)
+             for vital_type in VITAL_TYPES] for _ in range(500)]
+    rows.append([0, None, None])
+
+    expected = [classify_reading(dict(zip(VITAL_TYPES, row))) for row in rows]
+    assert classify_batch(rows) == expected
+    assert sum(map(len, expected)) > 100
+
+def test_registered_vital_is_stored_alerted_and_rendered():
+    """Test that a vital registered before the models are imported works end to end."""
+    script = textwrap.dedent("""
+        from utils.vitals import VitalType, register_vital
+        register_vital(VitalType('resp_rate', 'Respiratory Rate', '/min', 1, warning=(12, 20), critical=(8, 25),
+                                 news2_bands=((8, 3), (11, 1), (20, 0), (24, 2), (float('inf'), 3))))
+
+        from flask import Flask, render_template
+        from db import db
+        from models import Alert, Patient, VitalSign
+        from utils.ingest import ingest_readings
+        from utils.patient_rows import patient_row
+        from utils.trends import init_trends
+        from utils.vitals import init_vitals
+
+        app = Flask(__name__, template_folder='templates')
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(app)
+        init_vitals(app)
+        app.add_template_filter(lambda value, format='': str(value), 'datetime')
+        trends = init_trends(app)
+        with app.app_context():
+            db.create_all()
+            db.session.add(Patient(id=1, name="Patient A", room="101"))
+            db.session.commit()
+            for core in (True, False):
+                app.config['INGEST_CORE'] = core
+                ingest_readings([{'patient_id': 1, 'heart_rate': 72, 'resp_rate': 28.4}])
+
+            assert db.session.execute(db.select(VitalSign.resp_rate)).scalars().all() == [28.0, 28.0]
+            alerts = db.session.execute(db.select(Alert.vital_type, Alert.severity, Alert.threshold)).all()
+            assert alerts == [('resp_rate', 'critical', '8-25')] * 2
+            row = patient_row(1)
+            assert row.resp_rate == 28 and row.resp_rate_alert and not row.heart_rate_alert
+            assert trends.get(1).news2() == (3, 'medium')
+            with app.test_request_context():
+                app.add_url_rule('/acknowledge/<int:patient_id>/<string:vital_type>', 'acknowledge_alert')
+                html = render_template('table_content.html', patients=[row])
+            assert '28 /min' in html and '/acknowledge/1/resp_rate' in html
+
+            from generate_dataset import generate_to_database
+            readings, _ = generate_to_database(db.engine, 2, 1, 600, seed=1)
+            rates = db.session.execute(db.select(VitalSign.resp_rate).where(VitalSign.patient_id > 1)).scalars().all()
+            assert len(rates) == readings == 2 * 144 and all(8 < rate < 25 for rate in rates)
+        print('ok')
+    """)
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == 'ok'
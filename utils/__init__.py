@@ -0,0 +1,2 @@
+# Utility modules shared by the main application (app.py) and the
+# serverless entry point (api/index.py).
@@ -0,0 +1,72 @@
+"""
+Committed alert changes, delivered to in-process listeners.
+
+Alerts created, acknowledged or deleted through the ORM are staged on each
+flush and handed to the app's listeners once the transaction commits (and
+dropped on rollback). Listeners are called with ('add', AlertEntry) for a
+new or changed unacknowledged alert and ('remove', alert_id) once it is
+acknowledged or deleted. Core writes are not seen unless the writer
+hands them over with publish() after committing, as the ingest fast
+path does.
+
+Usage:
+    from utils.alert_events import subscribe
+    subscribe(app, lambda action, value: ...)
+"""
+
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Alert
+
+AlertEntry = namedtuple('AlertEntry', 'id patient_id vital_type value threshold severity timestamp')
+
+def alert_entry(alert):
+    """Snapshot an Alert as an AlertEntry."""
+    return AlertEntry(alert.id, alert.patient_id, alert.vital_type, alert.value,
+                      alert.threshold, alert.severity, alert.timestamp)
+
+def _listeners():
+    if not has_app_context():
+        return ()
+    return current_app.extensions.get('alert_listeners', ())
+
+def _after_flush(session, flush_context):
+    """Stage alert changes from this flush until the transaction commits."""
+    if not _listeners():
+        return
+    pending = session.info.setdefault('alert_events_pending', [])
+    for obj in session.new:
+        if isinstance(obj, Alert):
+            pending.append(('remove', obj.id) if obj.acknowledged else ('add', alert_entry(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, Alert) and session.is_modified(obj):
+            pending.append(('remove', obj.id) if obj.acknowledged else ('add', alert_entry(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Alert):
+            pending.append(('remove', obj.id))
+
+def publish(changes):
+    """Hand committed [(action, value)] alert changes to the app's listeners."""
+    for listener in _listeners():
+        for action, value in changes:
+            listener(action, value)
+
+def _after_commit(session):
+    pending = session.info.pop('alert_events_pending', None)
+    if pending:
+        publish(pending)
+
+def _after_rollback(session):
+    session.info.pop('alert_events_pending', None)
+
+def subscribe(app, listener):
+    """Call ``listener(action, value)`` for each committed alert change in ``app``."""
+    app.extensions.setdefault('alert_listeners', []).append(listener)
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,186 @@
+"""
+In-memory priority index of unacknowledged alerts.
+
+The alerts queue renders the worst alerts first: critical before warning,
+then oldest first, then by patient. Rather than querying and sorting the
+alert table on every refresh, each process keeps the unacknowledged alerts
+in a sorted list that is updated as alerts are created and acknowledged
+through the ORM (see utils.alert_events), so the queue page reads its
+top K without touching the table.
+
+Alerts raised and acknowledged by other processes (the device gateway,
+other workers) are picked up by tailing the change feed (utils.change_feed)
+every ALERT_INDEX_REFRESH_SECONDS (default 5, 0 to disable): one indexed
+query per shard for the entries since the last one seen. The alert table
+is only read on the first use, from the partial index of unacknowledged
+alerts. Alerts bulk-loaded without the feed (import_vitals.py,
+generate_dataset.py) show up once the index is reloaded, e.g. on restart.
+
+Usage:
+    from utils.alert_index import init_alert_index, alert_index
+    init_alert_index(app)
+    alerts = alert_index().top(100)
+"""
+
+import bisect
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, has_app_context
+
+from db import db
+from models import Alert, Patient
+from utils.alert_events import AlertEntry, subscribe
+from utils.change_feed import DEFAULT_RETENTION_DAYS, MAX_LIMIT, head_cursor, read_changes
+from utils.shards import each_shard, group_by_shard, use_shard
+
+# Sort rank by severity; unknown severities sort after warnings
+SEVERITY_RANK = {'critical': 0, 'warning': 1}
+
+PatientInfo = namedtuple('PatientInfo', 'id name room')
+
+def _sort_key(entry):
+    return (SEVERITY_RANK.get(entry.severity, len(SEVERITY_RANK)), entry.timestamp or datetime.min,
+            entry.patient_id, entry.id)
+
+class AlertIndex:
+    """Unacknowledged alerts kept sorted by (severity, age, patient).
+
+    Args:
+        refresh_seconds: Read the change feed when the last read is older
+            than this (0 never does once loaded)
+    """
+
+    def __init__(self, refresh_seconds=5):
+        self.refresh_seconds = refresh_seconds
+        self._keys = []  # Sorted list of sort keys
+        self._entries = {}  # Format: {alert_id: AlertEntry}
+        self._patients = {}  # Format: {patient_id: PatientInfo}
+        self._loaded_at = None
+        self._cursor = None  # Change feed cursor the index is up to
+        self._synced_at = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+    def load(self):
+        """Rebuild the index from the database (every shard)."""
+        # Taken first: changes committed during the load are replayed by sync
+        cursor = head_cursor()
+        entries, patients = {}, {}
+        for _ in each_shard():
+            rows = db.session.execute(
+                db.select(*(getattr(Alert, field) for field in AlertEntry._fields))
+                .where(Alert.acknowledged == False)  # noqa: E712
+            )
+            entries.update((row.id, AlertEntry(*row)) for row in rows)
+            patients.update((row.id, PatientInfo(*row)) for row in
+                            db.session.execute(db.select(Patient.id, Patient.name, Patient.room)))
+        with self._lock:
+            self._entries = entries
+            self._keys = sorted(_sort_key(entry) for entry in entries.values())
+            self._patients = patients
+            self._cursor = cursor
+            self._loaded_at = self._synced_at = time.monotonic()
+
+    def sync(self):
+        """Apply the alerts raised and acknowledged since the last load or sync, from the change feed.
+
+        Entries this process already applied are applied again, which
+        leaves the index unchanged.
+        """
+        cursor = self._cursor
+        while True:
+            page = read_changes(cursor, MAX_LIMIT)
+            for change in page['changes']:
+                data = change['data']
+                if change['kind'] == 'alert':
+                    self.add(AlertEntry(data['id'], change['patient_id'], data['vital_type'], data['value'],
+                                        data['threshold'], data['severity'],
+                                        datetime.fromisoformat(data['timestamp'])))
+                elif change['kind'] == 'ack':
+                    self.remove(data['id'])
+            cursor = page['cursor']
+            if not page['more']:
+                break
+        with self._lock:
+            self._cursor = cursor
+            self._synced_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a reload on next use, e.g. after a bulk insert with Core."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            self.load()
+            return
+        idle = time.monotonic() - self._synced_at
+        if idle > DEFAULT_RETENTION_DAYS * 86400:
+            # The entries since the cursor may have been pruned
+            self.load()
+        elif self.refresh_seconds and idle > self.refresh_seconds:
+            self.sync()
+
+    def add(self, entry):
+        """Add or replace an unacknowledged alert."""
+        with self._lock:
+            self.remove(entry.id)
+            self._entries[entry.id] = entry
+            bisect.insort(self._keys, _sort_key(entry))
+
+    def remove(self, alert_id):
+        """Remove an alert, e.g. once it is acknowledged."""
+        with self._lock:
+            entry = self._entries.pop(alert_id, None)
+            if entry is not None:
+                key = _sort_key(entry)
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def top(self, k=None):
+        """Return the ``k`` highest-priority alerts (all if k is None)."""
+        self._ensure_loaded()
+        with self._lock:
+            keys = self._keys if k is None else self._keys[:k]
+            return [self._entries[key[-1]] for key in keys]
+
+    def patients_for(self, entries):
+        """Return {patient_id: PatientInfo} for the given entries.
+
+        Patients created since the last load are fetched in one query per shard.
+        """
+        missing = {entry.patient_id for entry in entries} - self._patients.keys()
+        for key, patient_ids in group_by_shard(missing, lambda patient_id: patient_id).items():
+            with use_shard(key):
+                rows = db.session.execute(db.select(Patient.id, Patient.name, Patient.room)
+                                          .where(Patient.id.in_(patient_ids))).all()
+            with self._lock:
+                self._patients.update((row.id, PatientInfo(*row)) for row in rows)
+        return {entry.patient_id: self._patients.get(entry.patient_id) for entry in entries}
+
+def alert_index():
+    """Return the alert index of the current app, or None if not initialized."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('alert_index')
+
+def init_alert_index(app):
+    """Create the app's alert index and keep it updated from ORM changes."""
+    index = app.extensions['alert_index'] = AlertIndex(app.config.get('ALERT_INDEX_REFRESH_SECONDS', 5))
+
+    def apply(action, value):
+        # Changes before the first load are picked up by the load itself
+        if index._loaded_at is None:
+            return
+        if action == 'add':
+            index.add(value)
+        else:
+            index.remove(value)
+
+    subscribe(app, apply)
+    return index
@@ -0,0 +1,197 @@
+"""
+Hourly alert rollups for the ward statistics page.
+
+The alert_rollup table keeps one row per hour, vital type, severity and
+room with the number of alerts raised, how many of them have been
+acknowledged and how long those waited. Writers add to it in the same
+transaction as the alerts (count_raised when alerts are created,
+count_acknowledged when they are acknowledged), so /alerts/stats reads
+a few rows per hour instead of scanning the alert table.
+
+Alerts count towards the hour they were raised in. The room is the
+patient's room when the alert is counted. Alerts written without going
+through here (import_vitals.py, generate_dataset.py) are only counted by
+rebuild_rollups, which recomputes the table from the alert table
+(rebuild_alert_rollups.py).
+
+Usage:
+    from utils.alert_rollups import count_acknowledged, count_raised, rollup_key
+    count_raised([rollup_key(alert) for alert in alerts])
+    count_acknowledged([rollup_key(alert) for alert in alerts], datetime.now())
+"""
+
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db import db
+from models import Alert, AlertRollup, Patient
+from utils.shards import each_shard
+
+DEFAULT_STATS_HOURS = 24
+MAX_STATS_HOURS = 24 * 31
+DEFAULT_CHUNK_SIZE = 10000
+
+COUNTERS = ('alerts', 'acknowledged', 'timed_acks', 'ack_seconds')
+
+def hour_of(timestamp):
+    """Return the start of the hour ``timestamp`` falls in."""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def rollup_key(alert):
+    """Return an alert's (patient_id, timestamp, vital_type, severity)."""
+    return alert.patient_id, alert.timestamp, alert.vital_type, alert.severity
+
+def _rooms(executor, patient_ids):
+    return dict(executor.execute(sa.select(Patient.id, Patient.room).where(Patient.id.in_(list(patient_ids)))).all())
+
+def _add(executor, bind, totals):
+    """Add {(hour, vital_type, severity, room): {counter: value}} to the rollups."""
+    rows = [dict(dict.fromkeys(COUNTERS, 0), **dict(zip(('hour', 'vital_type', 'severity', 'room'), key)), **counts)
+            for key, counts in totals.items()]
+    if not rows:
+        return
+    table = AlertRollup.__table__
+    if bind.dialect.name in ('sqlite', 'postgresql'):
+        dialect = sqlite if bind.dialect.name == 'sqlite' else postgresql
+        insert = dialect.insert(table)
+        executor.execute(insert.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={column: table.c[column] + insert.excluded[column] for column in COUNTERS},
+        ), rows)
+        return
+
+    # Generic fallback: update existing rows, then insert the rest
+    for row in rows:
+        updated = executor.execute(table.update().where(
+            *(column == row[column.name] for column in table.primary_key.columns)
+        ).values({column: table.c[column] + row[column] for column in COUNTERS})).rowcount
+        if not updated:
+            executor.execute(table.insert(), [row])
+
+def count_raised(keys, rooms=None, conn=None):
+    """Count new alerts, in the same transaction that inserts them.
+
+    Args:
+        keys: (patient_id, timestamp, vital_type, severity) of each alert
+        rooms: Optional {patient_id: room}; looked up if not given
+        conn: Connection to write with (default: the db session)
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    executor = db.session if conn is None else conn
+    bind = db.session.get_bind() if conn is None else conn
+    rooms = rooms or _rooms(executor, {patient_id for patient_id, _, _, _ in keys})
+    totals = {}
+    for patient_id, timestamp, vital_type, severity in keys:
+        counts = totals.setdefault((hour_of(timestamp), vital_type, severity, rooms.get(patient_id, '')), {'alerts': 0})
+        counts['alerts'] += 1
+    _add(executor, bind, totals)
+
+def count_acknowledged(keys, acknowledged_at, rooms=None, conn=None):
+    """Count acknowledged alerts and their wait, in the same transaction.
+
+    Args:
+        keys: (patient_id, timestamp, vital_type, severity) of each alert
+            that was unacknowledged until now
+        acknowledged_at: When they were acknowledged
+        rooms: Optional {patient_id: room}; looked up if not given
+        conn: Connection to write with (default: the db session)
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    executor = db.session if conn is None else conn
+    bind = db.session.get_bind() if conn is None else conn
+    rooms = rooms or _rooms(executor, {patient_id for patient_id, _, _, _ in keys})
+    totals = {}
+    for patient_id, timestamp, vital_type, severity in keys:
+        counts = totals.setdefault((hour_of(timestamp), vital_type, severity, rooms.get(patient_id, '')),
+                                   {'acknowledged': 0, 'timed_acks': 0, 'ack_seconds': 0.0})
+        counts['acknowledged'] += 1
+        counts['timed_acks'] += 1
+        counts['ack_seconds'] += max((acknowledged_at - timestamp).total_seconds(), 0.0)
+    _add(executor, bind, totals)
+
+def rebuild_rollups(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recompute alert_rollup in every shard from the alert table.
+
+    Each shard is rebuilt in one transaction. Alerts acknowledged before
+    acknowledged_at was recorded count as acknowledged without a wait.
+
+    Returns:
+        int: Alerts counted
+    """
+    counted = 0
+    for _ in each_shard():
+        # The delete comes first: on SQLite it takes the write lock, so no
+        # alert is written or acknowledged while the shard is recounted
+        db.session.execute(AlertRollup.__table__.delete())
+        rows = db.session.execute(
+            sa.select(Alert.timestamp, Alert.vital_type, Alert.severity, Alert.acknowledged,
+                      Alert.acknowledged_at, sa.func.coalesce(Patient.room, ''))
+            .outerjoin(Patient, Patient.id == Alert.patient_id)
+            .execution_options(yield_per=chunk_size)
+        )
+        totals = {}
+        for timestamp, vital_type, severity, acknowledged, acknowledged_at, room in rows:
+            counts = totals.setdefault((hour_of(timestamp), vital_type, severity, room), dict.fromkeys(COUNTERS, 0))
+            counts['alerts'] += 1
+            if acknowledged:
+                counts['acknowledged'] += 1
+            if acknowledged and acknowledged_at is not None:
+                counts['timed_acks'] += 1
+                counts['ack_seconds'] += max((acknowledged_at - timestamp).total_seconds(), 0.0)
+            counted += 1
+        _add(db.session, db.session.get_bind(), totals)
+        db.session.commit()
+    return counted
+
+def _summary(counts):
+    timed, seconds = counts['timed_acks'], counts['ack_seconds']
+    return {'alerts': counts['alerts'], 'acknowledged': counts['acknowledged'],
+            'mean_ack_seconds': round(seconds / timed, 1) if timed else None}
+
+def _group(rows, fields):
+    groups = {}
+    for row in rows:
+        counts = groups.setdefault(tuple(row[field] for field in fields), dict.fromkeys(COUNTERS, 0))
+        for counter in COUNTERS:
+            counts[counter] += row[counter]
+    return [dict(zip(fields, key), **_summary(counts)) for key, counts in sorted(groups.items())]
+
+def alert_stats(hours=DEFAULT_STATS_HOURS, room=None, now=None):
+    """Summarize the rollups of the last ``hours`` hours, from every shard.
+
+    Args:
+        hours: Whole hours to include, counting the current one (at most
+            MAX_STATS_HOURS)
+        room: Only this room, if given
+
+    Returns:
+        dict: JSON-ready totals, plus breakdowns by hour, room and
+            (vital_type, severity); mean_ack_seconds is None without
+            timed acknowledgements
+    """
+    hours = max(1, min(hours, MAX_STATS_HOURS))
+    now = now or datetime.now()
+    start = hour_of(now) - timedelta(hours=hours - 1)
+    query = sa.select(AlertRollup.__table__).where(AlertRollup.hour >= start)
+    if room is not None:
+        query = query.where(AlertRollup.room == room)
+    rows = []
+    for _ in each_shard():
+        rows.extend(row._asdict() for row in db.session.execute(query))
+    for row in rows:
+        row['hour'] = row['hour'].isoformat()
+    return {
+        'start': start.isoformat(),
+        'end': now.isoformat(timespec='seconds'),
+        'room': room,
+        'totals': _group(rows, ())[0] if rows else _summary(dict.fromkeys(COUNTERS, 0)),
+        'by_hour': _group(rows, ('hour',)),
+        'by_room': _group(rows, ('room',)),
+        'by_vital': _group(rows, ('vital_type', 'severity')),
+    }
@@ -0,0 +1,142 @@
+"""
+Vital sign thresholds and alert classification.
+
+Shared by every path that turns readings into alerts (the /update endpoint
+in api/index.py and the bulk importer) so they classify identically.
+Default thresholds come from the vital sign registry (utils.vitals);
+patients and wards can override them (utils.threshold_profiles).
+"""
+
+import math
+
+from utils.vitals import VITALS, vital_names
+
+# Vital sign thresholds with warning and critical levels, from the registry
+# Format: {vital_type: {severity: {'min': ..., 'max': ...}}}
+THRESHOLDS = {
+    vital.name: {
+        'warning': {'min': vital.warning[0], 'max': vital.warning[1]},
+        'critical': {'min': vital.critical[0], 'max': vital.critical[1]},
+    }
+    for vital in VITALS
+}
+
+# Vitals that can't be too high (e.g. SpO2); only their lower bound is checked
+LOWER_BOUND_ONLY = {vital.name for vital in VITALS if vital.lower_bound_only}
+
+VITAL_TYPES = vital_names()
+
+def threshold_label(vital_type, severity, thresholds=THRESHOLDS):
+    """Return the threshold string stored on alerts, e.g. "60-100" or ">= 95"."""
+    limits = thresholds[vital_type][severity]
+    if vital_type in LOWER_BOUND_ONLY:
+        return f">= {limits['min']}"
+    return f"{limits['min']}-{limits['max']}"
+
+def classify_vital(vital_type, value, thresholds=THRESHOLDS):
+    """Classify a single vital sign value.
+
+    Returns:
+        tuple: (severity, threshold_str) if the value is outside a threshold,
+        otherwise None. Critical thresholds are checked before warning ones.
+    """
+    for severity in ('critical', 'warning'):
+        limits = thresholds[vital_type][severity]
+        if value < limits['min'] or (vital_type not in LOWER_BOUND_ONLY and value > limits['max']):
+            return severity, threshold_label(vital_type, severity, thresholds)
+    return None
+
+class ThresholdEvaluator:
+    """Thresholds compiled for classifying readings.
+
+    The limits and threshold labels are worked out once, so classifying a
+    reading is a few comparisons per vital sign. Per-patient thresholds
+    (utils.threshold_profiles) each get their own evaluator.
+
+    Args:
+        thresholds: Full thresholds in THRESHOLDS format
+    """
+
+    def __init__(self, thresholds=THRESHOLDS):
+        self.thresholds = thresholds
+        # Format: [(vital_type, ((severity, low, high, label), ...))], critical first
+        self._checks = []
+        for vital_type in VITAL_TYPES:
+            checks = []
+            for severity in ('critical', 'warning'):
+                limits = thresholds[vital_type][severity]
+                high = math.inf if vital_type in LOWER_BOUND_ONLY else limits['max']
+                checks.append((severity, limits['min'], high, threshold_label(vital_type, severity, thresholds)))
+            self._checks.append((vital_type, tuple(checks)))
+        self._bounds = None  # NumPy (low, high) per severity, built on first batch
+
+    def classify(self, values):
+        """Classify a reading's vital signs, given as {vital_type: value}.
+
+        Missing (falsy) values are skipped.
+
+        Returns:
+            list: (vital_type, value, severity, threshold_str) for each vital
+            outside its thresholds, in registry order
+        """
+        results = []
+        for vital_type, checks in self._checks:
+            value = values.get(vital_type)
+            if not value:
+                continue
+            for severity, low, high, label in checks:
+                if value < low or value > high:
+                    results.append((vital_type, value, severity, label))
+                    break
+        return results
+
+    def classify_batch(self, rows):
+        """Classify many readings at once, matching classify.
+
+        The comparisons run column-wise in NumPy, so the Python work is per
+        alert raised rather than per reading and vital sign.
+
+        Args:
+            rows: Sequence of value lists in VITAL_TYPES order, None if missing
+
+        Returns:
+            list: classify's result for each row
+        """
+        # Imported lazily: numpy stays out of the cold-start import path
+        import numpy as np
+
+        results = [[] for _ in rows]
+        if not results:
+            return results
+        if self._bounds is None:
+            # Format: [(level, low, high)], warning first so critical overrides it
+            self._bounds = [
+                (level, np.array([checks[i][1] for _, checks in self._checks]),
+                 np.array([checks[i][2] for _, checks in self._checks]))
+                for level, i in ((2, 1), (1, 0))
+            ]
+        values = np.array(rows, dtype=float).reshape(len(rows), len(VITAL_TYPES))
+        present = ~np.isnan(values) & (values != 0)
+        levels = np.zeros(values.shape, dtype=np.int8)  # 1: critical, 2: warning
+        for level, low, high in self._bounds:
+            levels[present & ((values < low) | (values > high))] = level
+
+        row_index, column_index = np.nonzero(levels)
+        for i, j, level in zip(row_index.tolist(), column_index.tolist(), levels[row_index, column_index].tolist()):
+            vital_type, checks = self._checks[j]
+            severity, _, _, label = checks[level - 1]
+            results[i].append((vital_type, rows[i][j], severity, label))
+        return results
+
+DEFAULT_EVALUATOR = ThresholdEvaluator()
+
+def _evaluator(thresholds):
+    return DEFAULT_EVALUATOR if thresholds is THRESHOLDS else ThresholdEvaluator(thresholds)
+
+def classify_reading(values, thresholds=THRESHOLDS):
+    """Classify a reading's vital signs, given as {vital_type: value} (see ThresholdEvaluator.classify)."""
+    return _evaluator(thresholds).classify(values)
+
+def classify_batch(rows, thresholds=THRESHOLDS):
+    """Classify many readings at once (see ThresholdEvaluator.classify_batch)."""
+    return _evaluator(thresholds).classify_batch(rows)
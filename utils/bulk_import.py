@@ -0,0 +1,204 @@
+"""
+Chunked bulk import of historical vital signs.
+
+Readings are streamed from CSV or NDJSON files and written with Core
+``executemany`` inserts, one bounded transaction per chunk. Alerts for each
+chunk are classified in the same pass, with each patient's threshold
+profile (utils.threshold_profiles, if the app has them set up), and
+inserted with their readings. The number of rows imported so far is
+stored in the ``import_checkpoint`` table in the same transaction as each
+chunk, so an interrupted import resumes exactly where it stopped.
+
+With shards (utils.shards), each chunk is split by patient and written to
+every shard in its own transaction, and each shard keeps its own
+checkpoint, so a resumed import skips exactly the rows each shard has.
+
+Input columns (CSV header or NDJSON keys): patient_id, timestamp and
+each registered vital sign (utils.vitals), e.g. heart_rate, spo2, temp. Other columns, such as the ``id`` written by
+export_data.py, are ignored.
+"""
+
+import csv
+import itertools
+import json
+import os
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from models import Alert, FixedPoint, ImportCheckpoint, VitalSign
+from utils.alerting import VITAL_TYPES
+from utils.shards import group_by_engine
+from utils.threshold_profiles import classify_batch_for
+
+DEFAULT_CHUNK_SIZE = 10000
+
+READING_FIELDS = ('patient_id', 'timestamp', *VITAL_TYPES)
+
+VITAL_COLUMNS = ('patient_id', 'timestamp', *VITAL_TYPES)
+ALERT_COLUMNS = ('patient_id', 'timestamp', 'vital_type', 'value', 'threshold', 'severity', 'acknowledged')
+CHECKPOINTS = ImportCheckpoint.__table__
+
+# Rounds each vital sign to the precision it is stored with (see models.FixedPoint)
+_QUANTIZE = [VitalSign.__table__.c[vital_type].type.quantize for vital_type in VITAL_TYPES]
+
+def _to_float(value):
+    return float(value) if value not in (None, '') else None
+
+def _parse_row(patient_id, timestamp, *vitals):
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(timestamp)
+    return (int(patient_id), timestamp, *(_to_float(value) for value in vitals))
+
+def _iter_csv(f):
+    reader = csv.reader(f)
+    header = next(reader)
+    try:
+        indexes = [header.index(field) for field in READING_FIELDS]
+    except ValueError:
+        raise ValueError(f"CSV header must include {', '.join(READING_FIELDS)}")
+    for row in reader:
+        if row:
+            yield _parse_row(*(row[i] for i in indexes))
+
+def _iter_ndjson(f):
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            yield _parse_row(*(record.get(field) for field in READING_FIELDS))
+
+def iter_readings(path):
+    """Yield (patient_id, timestamp, *vitals) tuples, in VITAL_COLUMNS order, from a file.
+
+    The format is chosen from the extension: .csv, or .ndjson/.jsonl.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        parse = _iter_csv
+    elif extension in ('.ndjson', '.jsonl'):
+        parse = _iter_ndjson
+    else:
+        raise ValueError(f"Unsupported file type: {extension} (expected .csv, .ndjson or .jsonl)")
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from parse(f)
+
+def executemany_insert(conn, table, columns, rows):
+    """Insert tuples of ``columns`` values into ``table`` with one executemany.
+
+    On SQLite the statement goes straight to the driver, skipping
+    SQLAlchemy's per-row bind processing, which otherwise dominates bulk
+    inserts. Datetimes are formatted and fixed-point vitals encoded exactly
+    as SQLAlchemy stores them so queries through the ORM still match.
+    """
+    if conn.dialect.name != 'sqlite':
+        conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        return
+    encoders = [
+        (lambda value: value.isoformat(' ', 'microseconds')) if column == 'timestamp'
+        else table.c[column].type.encode if isinstance(table.c[column].type, FixedPoint)
+        else None
+        for column in columns
+    ]
+    encoded = [(i, encode) for i, encode in enumerate(encoders) if encode is not None]
+    rows = [list(row) for row in rows]
+    for row in rows:
+        for i, encode in encoded:
+            row[i] = encode(row[i])
+    rows = [tuple(row) for row in rows]
+    placeholders = ', '.join('?' * len(columns))
+    conn.exec_driver_sql(f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+def insert_readings(conn, readings, acknowledged=True):
+    """Insert readings and their alerts on ``conn`` with executemany.
+
+    Args:
+        conn: Connection with an open transaction
+        readings: Sequence of (patient_id, timestamp, *vitals) in VITAL_COLUMNS order
+        acknowledged: Whether created alerts start out acknowledged
+
+    Returns:
+        int: Number of alerts created
+    """
+    # Classify the values as stored, as the ingest path does
+    readings = [(reading[0], reading[1], *(quantize(value) for quantize, value in zip(_QUANTIZE, reading[2:])))
+                for reading in readings]
+    executemany_insert(conn, VitalSign.__table__, VITAL_COLUMNS, readings)
+
+    alerts = [
+        (reading[0], reading[1], vital_type, value, threshold_str, severity, acknowledged)
+        for reading, classified in zip(readings, classify_batch_for([reading[0] for reading in readings],
+                                                                    [reading[2:] for reading in readings]))
+        for vital_type, value, severity, threshold_str in classified
+    ]
+    if alerts:
+        executemany_insert(conn, Alert.__table__, ALERT_COLUMNS, alerts)
+    return len(alerts)
+
+def import_readings(engine, path, chunk_size=DEFAULT_CHUNK_SIZE, acknowledged=True,
+                    restart=False, progress=None):
+    """Import a CSV/NDJSON file of readings, resuming from its checkpoint.
+
+    Args:
+        engine: SQLAlchemy engine to write to, or shard_engines() to write
+            each patient's readings to its shard
+        path: Input file path
+        chunk_size: Rows per transaction
+        acknowledged: Whether alerts for historical readings start acknowledged
+        restart: Discard any existing checkpoint and import from the start
+        progress: Optional callback called with the total rows done after
+            each chunk
+
+    Returns:
+        tuple: (rows_imported, alerts_created) for this run
+    """
+    source = os.path.abspath(path)
+    file_size = os.path.getsize(path)
+    # Format: {engine: rows of the file done in that shard}
+    done = {target: _load_checkpoint(target, path, source, file_size, restart)
+            for target in (engine.values() if isinstance(engine, dict) else [engine])}
+
+    rows_done = min(done.values())
+    readings = itertools.islice(iter_readings(path), rows_done, None)
+    rows_imported = alerts_created = 0
+    while True:
+        chunk = list(itertools.islice(readings, chunk_size))
+        if not chunk:
+            break
+        groups = group_by_engine(engine, enumerate(chunk, start=rows_done), lambda item: item[1][0])
+        rows_done += len(chunk)
+        for target, target_done in done.items():
+            if target_done >= rows_done:
+                continue
+            # Rows up to the shard's checkpoint were committed by an earlier run
+            rows = [reading for i, reading in groups.get(target, []) if i >= target_done]
+            with target.begin() as conn:
+                alerts_created += insert_readings(conn, rows, acknowledged) if rows else 0
+                conn.execute(
+                    CHECKPOINTS.update()
+                    .where(CHECKPOINTS.c.source == source)
+                    .values(rows_done=rows_done, updated=datetime.now())
+                )
+            done[target] = rows_done
+            rows_imported += len(rows)
+        if progress is not None:
+            progress(rows_done)
+
+    return rows_imported, alerts_created
+
+def _load_checkpoint(engine, path, source, file_size, restart):
+    """Return the rows of ``source`` already imported into ``engine``, creating its checkpoint."""
+    CHECKPOINTS.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        if restart:
+            conn.execute(CHECKPOINTS.delete().where(CHECKPOINTS.c.source == source))
+        checkpoint = conn.execute(
+            sa.select(CHECKPOINTS.c.file_size, CHECKPOINTS.c.rows_done)
+            .where(CHECKPOINTS.c.source == source)
+        ).first()
+        if checkpoint is None:
+            conn.execute(CHECKPOINTS.insert().values(
+                source=source, file_size=file_size, rows_done=0, updated=datetime.now()))
+            return 0
+        if checkpoint.file_size != file_size:
+            raise ValueError(f"{path} changed since its last import; use restart to import it again")
+        return checkpoint.rows_done
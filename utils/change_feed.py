@@ -0,0 +1,168 @@
+"""
+Append-only change feed for consumers in other processes.
+
+Writers add a change_event row in the same transaction as the change
+itself: one 'vitals' entry per patient per batch of readings (the
+patient_status row written), one 'alert' entry per alert raised and one
+'ack' entry per alert acknowledged. Each shard has its own feed, with
+sequence numbers that only go up, so a consumer (a dashboard, a cache
+in another worker, a push stream) keeps a cursor of the last sequence
+number it saw in each shard and reads what came after it instead of
+re-querying the tables.
+
+A cursor is a string of per-shard sequence numbers in shard order, e.g.
+"120,45"; an empty cursor starts at the oldest entry kept. On SQLite,
+writers take turns on the write lock, so entries commit in sequence
+order and a cursor never skips one. Entries older than the retention
+window are removed by prune_changes (prune_change_feed.py).
+
+Alerts written without going through here (import_vitals.py,
+generate_dataset.py) are not in the feed. A 'vitals' entry older than
+the one a consumer already applied should be ignored, as the
+patient_status upsert does.
+
+Usage:
+    from utils.change_feed import read_changes, record_changes, vitals_changes, wait_for_changes
+    record_changes(vitals_changes(status_rows))  # before the commit
+    page = wait_for_changes(cursor, timeout=25)
+    page['changes'], page['cursor']
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from db import db
+from models import ChangeEvent
+from utils.bulk_import import executemany_insert
+from utils.patient_status import latest_rows
+from utils.shards import each_shard, shard_keys, use_shard
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+MAX_WAIT_SECONDS = 30
+DEFAULT_POLL_SECONDS = 0.5
+DEFAULT_RETENTION_DAYS = 7
+
+_TABLE = ChangeEvent.__table__
+
+_COLUMNS = ('timestamp', 'kind', 'patient_id', 'data')
+
+def vitals_changes(rows):
+    """Return 'vitals' changes for patient_status rows (see utils.patient_status.status_row).
+
+    Several rows for a patient are merged into one change.
+    """
+    return [('vitals', row['patient_id'], dict(
+                {key: value for key, value in row.items() if key != 'patient_id'},
+                vitals_updated=row['vitals_updated'].isoformat()))
+            for row in latest_rows(rows)]
+
+def alert_change(alert):
+    """Return the 'alert' change for a new Alert or AlertEntry (its id must be set)."""
+    return ('alert', alert.patient_id, {
+        'id': alert.id, 'vital_type': alert.vital_type, 'value': alert.value, 'threshold': alert.threshold,
+        'severity': alert.severity, 'timestamp': alert.timestamp.isoformat(),
+    })
+
+def ack_change(alert, acknowledged_at):
+    """Return the 'ack' change for an alert acknowledged at ``acknowledged_at``."""
+    return ('ack', alert.patient_id, {'id': alert.id, 'vital_type': alert.vital_type,
+                                      'acknowledged_at': acknowledged_at.isoformat()})
+
+def record_changes(changes, conn=None):
+    """Append changes to the current shard's feed, in the caller's transaction.
+
+    Args:
+        changes: (kind, patient_id, data) tuples, e.g. from vitals_changes
+        conn: Connection to write with (default: the db session)
+    """
+    now = datetime.now()
+    rows = [(now, kind, patient_id, json.dumps(data)) for kind, patient_id, data in changes]
+    if rows:
+        executemany_insert(db.session.connection() if conn is None else conn, _TABLE, _COLUMNS, rows)
+
+def parse_cursor(cursor):
+    """Parse a cursor into one sequence number per shard.
+
+    Raises:
+        ValueError: If it is malformed or has more positions than there are shards
+    """
+    keys = shard_keys()
+    seqs = [int(part) for part in cursor.split(',')] if cursor else []
+    if len(seqs) > len(keys) or any(seq < 0 for seq in seqs):
+        raise ValueError(f"Invalid change feed cursor: {cursor!r}")
+    return seqs + [0] * (len(keys) - len(seqs))
+
+def format_cursor(seqs):
+    return ','.join(str(seq) for seq in seqs)
+
+def head_cursor():
+    """Return the cursor after the newest entry in every shard, to follow only new changes."""
+    seqs = []
+    for _ in each_shard():
+        seqs.append(db.session.execute(sa.select(sa.func.coalesce(sa.func.max(_TABLE.c.seq), 0))).scalar())
+    return format_cursor(seqs)
+
+def read_changes(cursor=None, limit=DEFAULT_LIMIT):
+    """Return the changes after ``cursor``, up to ``limit`` per shard.
+
+    Returns:
+        dict: JSON-ready {'changes': [...], 'cursor': ..., 'more': bool}.
+            Changes are in sequence order within each shard; each has
+            seq, shard (index), kind, patient_id, timestamp and data.
+            'more' is set if a shard returned ``limit`` changes and may have more.
+    """
+    seqs = parse_cursor(cursor)
+    limit = max(1, min(limit, MAX_LIMIT))
+    changes, more = [], False
+    for index, key in enumerate(shard_keys()):
+        with use_shard(key):
+            rows = db.session.execute(
+                sa.select(_TABLE).where(_TABLE.c.seq > seqs[index]).order_by(_TABLE.c.seq).limit(limit)
+            ).all()
+        more = more or len(rows) == limit
+        if rows:
+            seqs[index] = rows[-1].seq
+        changes.extend({'seq': row.seq, 'shard': index, 'kind': row.kind, 'patient_id': row.patient_id,
+                        'timestamp': row.timestamp.isoformat(), 'data': json.loads(row.data)}
+                       for row in rows)
+    return {'changes': changes, 'cursor': format_cursor(seqs), 'more': more}
+
+def wait_for_changes(cursor=None, timeout=0, limit=DEFAULT_LIMIT, poll_seconds=None):
+    """Long-poll: like read_changes, but wait up to ``timeout`` seconds for a change.
+
+    The feed is polled every ``poll_seconds`` (default: the app's
+    CHANGE_FEED_POLL_SECONDS, or 0.5), one indexed query per shard.
+    """
+    if poll_seconds is None:
+        poll_seconds = (current_app.config.get('CHANGE_FEED_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+                        if has_app_context() else DEFAULT_POLL_SECONDS)
+    deadline = time.monotonic() + min(timeout, MAX_WAIT_SECONDS)
+    while True:
+        page = read_changes(cursor, limit)
+        remaining = deadline - time.monotonic()
+        if page['changes'] or remaining <= 0:
+            return page
+        # End the read transaction so the next poll sees new commits
+        db.session.rollback()
+        time.sleep(min(poll_seconds, remaining))
+
+def prune_changes(days=DEFAULT_RETENTION_DAYS):
+    """Delete entries older than ``days`` days in every shard.
+
+    Consumers whose cursor falls behind the window miss those changes and
+    should reload from the tables.
+
+    Returns:
+        int: Entries deleted
+    """
+    before = datetime.now() - timedelta(days=days)
+    deleted = 0
+    for _ in each_shard():
+        deleted += db.session.execute(_TABLE.delete().where(_TABLE.c.timestamp < before)).rowcount
+        db.session.commit()
+    return deleted
@@ -0,0 +1,243 @@
+"""
+Columnar cold storage for old vital signs.
+
+Readings older than the retention window are sealed out of the vital_sign
+table into immutable segments, one per patient per day (plus one per late
+backfill of an already sealed day):
+
+    COLD_STORAGE_DIR/2024-01-01/<patient_id>-<first id>/id.npy
+                                                        timestamp.npy
+                                                        heart_rate.npy
+                                                        spo2.npy
+                                                        temp.npy
+
+Each column is a NumPy ``.npy`` file: ids as int64, timestamps as
+datetime64[us] and vitals as float64 with NaN for missing values. The
+directory names are the index: a day range or a patient selects segments
+by path alone. Segments are written to a temporary directory and renamed
+into place, so readers never see a partial segment.
+
+Reads memory-map the column files and filter them with vectorized masks,
+without touching the database. The export reads the segments and the
+vital_sign table as one history (see utils.export).
+
+Usage:
+    from utils.cold_storage import ColdStore, seal_vitals
+    store = ColdStore('cold')
+    seal_vitals(store, before=datetime(2024, 2, 1))
+    columns = store.scan(patient_id=3, start=datetime(2024, 1, 1))
+    np.nanmean(columns['heart_rate'])
+"""
+
+import os
+import uuid
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from db import db
+from models import VitalSign
+from utils.alerting import VITAL_TYPES
+from utils.shards import each_shard
+
+# Format: {column: dtype}, in vital_sign column order without patient_id
+SEGMENT_COLUMNS = {
+    'id': 'int64',
+    'timestamp': 'datetime64[us]',
+    **{vital_type: 'float64' for vital_type in VITAL_TYPES},
+}
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_CHUNK_SIZE = 1000
+
+DAY_FORMAT = '%Y-%m-%d'
+
+def _day_start(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return datetime.combine(value, time())
+
+class ColdStore:
+    """Sealed vital sign segments under a directory.
+
+    Args:
+        root: Directory holding one sub-directory per day
+    """
+
+    def __init__(self, root):
+        self.root = os.fspath(root)
+
+    def segments(self, patient_id=None, start=None, end=None):
+        """Yield (day, patient_id, path) of segments that may hold rows in [start, end), by day."""
+        if not os.path.isdir(self.root):
+            return
+        first_day = start.date() if start is not None else None
+        for name in sorted(os.listdir(self.root)):
+            try:
+                day = datetime.strptime(name, DAY_FORMAT).date()
+            except ValueError:
+                continue
+            if first_day is not None and day < first_day:
+                continue
+            if end is not None and datetime.combine(day, time()) >= end:
+                break
+            day_dir = os.path.join(self.root, name)
+            for segment in sorted(os.listdir(day_dir)):
+                owner, _, first_id = segment.partition('-')
+                if not first_id or not owner.isdigit():
+                    continue
+                if patient_id is None or int(owner) == patient_id:
+                    yield day, int(owner), os.path.join(day_dir, segment)
+
+    def read_segment(self, path):
+        """Return a segment's columns as read-only memory-mapped arrays.
+
+        Vital signs registered after the segment was sealed read as NaN.
+        """
+        columns = {}
+        for column in SEGMENT_COLUMNS:
+            file = os.path.join(path, f'{column}.npy')
+            if os.path.exists(file):
+                columns[column] = np.load(file, mmap_mode='r')
+            else:
+                columns[column] = np.full(len(columns['id']), np.nan)
+        return columns
+
+    def sealed_ids(self, patient_id, day):
+        """Return the ids already sealed for a patient on a day."""
+        ids = [self.read_segment(path)['id']
+               for _, _, path in self.segments(patient_id, _day_start(day), _day_start(day) + timedelta(days=1))]
+        return np.concatenate(ids) if ids else np.empty(0, dtype='int64')
+
+    def seal(self, patient_id, day, rows):
+        """Write a patient's rows from one day as a new segment.
+
+        Args:
+            patient_id: Owner of the rows
+            day: Date (or datetime) the rows fall on
+            rows: (id, timestamp, *vitals) tuples in SEGMENT_COLUMNS order
+
+        Returns:
+            int: Rows written; rows whose ids are already sealed are skipped
+        """
+        columns = {column: np.array(values, dtype=dtype)
+                   for (column, dtype), values in zip(SEGMENT_COLUMNS.items(), zip(*rows))}
+        if not columns:
+            return 0
+        keep = ~np.isin(columns['id'], self.sealed_ids(patient_id, day))
+        if not keep.all():
+            columns = {column: values[keep] for column, values in columns.items()}
+        if not len(columns['id']):
+            return 0
+        order = np.lexsort((columns['id'], columns['timestamp']))
+
+        day_dir = os.path.join(self.root, day.strftime(DAY_FORMAT))
+        os.makedirs(day_dir, exist_ok=True)
+        tmp = os.path.join(day_dir, f'.tmp-{uuid.uuid4().hex}')
+        os.mkdir(tmp)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, f'{column}.npy'), values[order])
+        os.rename(tmp, os.path.join(day_dir, f'{patient_id}-{columns["id"][order[0]]}'))
+        return len(order)
+
+    def scan(self, patient_id=None, start=None, end=None):
+        """Return sealed rows in [start, end) as arrays, ordered by timestamp and id.
+
+        Returns:
+            dict: {column: ndarray} for patient_id and each segment column
+        """
+        parts = []
+        for _, owner, path in self.segments(patient_id, start, end):
+            columns = self.read_segment(path)
+            mask = np.ones(len(columns['id']), dtype=bool)
+            if start is not None:
+                mask &= columns['timestamp'] >= np.datetime64(start, 'us')
+            if end is not None:
+                mask &= columns['timestamp'] < np.datetime64(end, 'us')
+            if mask.any():
+                selected = {column: values[mask] for column, values in columns.items()}
+                selected['patient_id'] = np.full(len(selected['id']), owner, dtype='int64')
+                parts.append(selected)
+
+        names = ['patient_id', *SEGMENT_COLUMNS]
+        if not parts:
+            return {name: np.empty(0, dtype=SEGMENT_COLUMNS.get(name, 'int64')) for name in names}
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in names}
+        order = np.lexsort((merged['id'], merged['timestamp']))
+        return {name: values[order] for name, values in merged.items()}
+
+    def iter_row_chunks(self, patient_id=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield lists of vital_sign rows (in table column order) one day at a time.
+
+        Missing vitals are None, as they are in the table.
+        """
+        columns = [column.name for column in VitalSign.__table__.columns]
+        days = sorted({day for day, _, _ in self.segments(patient_id, start, end)})
+        for day in days:
+            day_start = _day_start(day)
+            day_end = day_start + timedelta(days=1)
+            arrays = self.scan(patient_id, max(start or day_start, day_start), min(end or day_end, day_end))
+            values = [_to_python(arrays[column]) for column in columns]
+            rows = list(zip(*values))
+            for i in range(0, len(rows), chunk_size):
+                yield rows[i:i + chunk_size]
+
+def _to_python(values):
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[us]').tolist()
+    if values.dtype.kind == 'f':
+        return [None if value != value else value for value in values.tolist()]
+    return values.tolist()
+
+def cold_store():
+    """Return the current app's ColdStore, or None if COLD_STORAGE_DIR is not set."""
+    root = current_app.config.get('COLD_STORAGE_DIR')
+    return ColdStore(root) if root else None
+
+def seal_vitals(store, before, report=None):
+    """Move vital signs older than ``before`` into cold segments, in every shard.
+
+    Only whole days are sealed: ``before`` is rounded down to midnight.
+    Each patient-day is written as a segment and then deleted from the
+    table in its own transaction. Re-running after an interruption skips
+    rows that are already sealed.
+
+    Args:
+        store: ColdStore to write to
+        before: Seal readings taken before this day
+        report: Optional callback(patient_id, day, rows) after each segment
+
+    Returns:
+        int: Rows moved
+    """
+    table = VitalSign.__table__
+    cutoff = _day_start(before)
+    moved = 0
+    for _ in each_shard():
+        patient_ids = db.session.execute(
+            sa.select(table.c.patient_id).where(table.c.timestamp < cutoff).distinct()
+        ).scalars().all()
+        for patient_id in sorted(patient_ids):
+            old = sa.and_(table.c.patient_id == patient_id, table.c.timestamp < cutoff)
+            first = db.session.execute(sa.select(sa.func.min(table.c.timestamp)).where(old)).scalar()
+            while first is not None:
+                day_start = _day_start(first)
+                day = sa.and_(old, table.c.timestamp >= day_start, table.c.timestamp < day_start + timedelta(days=1))
+                rows = db.session.execute(
+                    sa.select(*(table.c[column] for column in SEGMENT_COLUMNS)).where(day)
+                ).all()
+                written = store.seal(patient_id, day_start, rows)
+                # Only delete what was read; a reading stored meanwhile waits for the next run
+                max_id = max(row[0] for row in rows)
+                db.session.execute(sa.delete(table).where(day, table.c.id <= max_id))
+                db.session.commit()
+                moved += len(rows)
+                if report:
+                    report(patient_id, day_start.date(), written)
+                first = db.session.execute(
+                    sa.select(sa.func.min(table.c.timestamp))
+                    .where(old, table.c.timestamp >= day_start + timedelta(days=1))
+                ).scalar()
+    return moved
@@ -0,0 +1,252 @@
+"""
+Escalation of critical alerts that stay unacknowledged.
+
+Each unacknowledged critical alert has a deadline per escalation tier.
+The first is measured from when the alert was raised, and each later one
+from the previous escalation, keeping the gap between the tiers' delays,
+so an escalation that ran late (e.g. after a restart) does not fire the
+remaining tiers at once. Deadlines are kept in a heap, and a single timer
+thread sleeps until the earliest one. When a deadline passes and the
+alert is still unacknowledged, the alert's escalation_level is raised and
+the tier's recipients are emailed. After the last tier, the alert stays
+escalated until someone acknowledges it. Alerts whose patient has been
+deleted are dropped.
+
+Acknowledging an alert through the ORM cancels its timer (utils.alert_events).
+Alerts raised by other processes (the device gateway, /update) are found by
+polling each shard for critical alerts with an id above the last one seen, so the
+alert table is never scanned. On startup, the first poll picks up every
+unacknowledged critical alert that has tiers left, from the partial index
+of unacknowledged alerts; ones that are overdue escalate one tier at a
+time. Acknowledgements made by other processes are
+caught by re-checking the alert when its deadline passes. The escalation
+itself is a conditional UPDATE, so two engines never escalate the same
+alert twice.
+
+Usage:
+    from utils.escalation import init_escalation
+    init_escalation(app)
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from db import db
+from models import Alert, Patient
+from utils.alert_events import subscribe
+from utils.metrics import ESCALATIONS, NOTIFICATIONS
+from utils.shards import each_shard, shard_for_alert, use_shard
+
+logger = logging.getLogger(__name__)
+
+# (seconds after the alert was raised, environment variable with recipients)
+ESCALATION_TIERS = (
+    (300, 'ATTENDER_EMAIL'),     # Remind the attenders
+    (900, 'ESCALATION_EMAIL'),   # Charge nurse / on-call doctor
+)
+
+# Seconds between polls for critical alerts raised by other processes
+DEFAULT_POLL_SECONDS = 15
+
+# Seconds before retrying an escalation that failed (e.g. database locked)
+RETRY_SECONDS = 30
+
+class EscalationEngine:
+    """Timer heap of escalation deadlines for unacknowledged critical alerts.
+
+    Args:
+        app: Flask app whose database and context the timer thread uses
+        tiers: Sequence of (delay_seconds, recipients_var), by level
+        poll_seconds: Seconds between polls for alerts from other processes
+            (0 disables polling)
+    """
+
+    def __init__(self, app, tiers=ESCALATION_TIERS, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.app = app
+        self.tiers = tuple(tiers)
+        self.poll_seconds = poll_seconds
+        self._heap = []  # Format: [[deadline, seq, alert_id, level, active]]
+        self._timers = {}  # Format: {alert_id: heap entry}
+        self._seq = itertools.count()
+        self._last_seen_ids = {}  # Format: {shard key: last alert id seen}
+        self._next_poll = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def schedule(self, alert_id, raised_at, escalation_level=0):
+        """Schedule the next escalation of an alert raised at ``raised_at`` (epoch seconds).
+
+        Alerts already scheduled or fully escalated are ignored.
+        """
+        if escalation_level >= len(self.tiers):
+            return
+        self._push(alert_id, raised_at + self.tiers[escalation_level][0], escalation_level + 1)
+
+    def _push(self, alert_id, deadline, level):
+        with self._cond:
+            if alert_id in self._timers:
+                return
+            entry = [deadline, next(self._seq), alert_id, level, True]
+            self._timers[alert_id] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                # New earliest deadline; wake the timer thread
+                self._cond.notify()
+
+    def cancel(self, alert_id):
+        """Cancel an alert's pending escalation, e.g. once it is acknowledged.
+
+        The heap entry is only marked inactive; it is discarded when it
+        reaches the top of the heap.
+        """
+        with self._cond:
+            entry = self._timers.pop(alert_id, None)
+            if entry is not None:
+                entry[-1] = False
+
+    def on_alert_change(self, action, value):
+        """alert_events listener: schedule new critical alerts, cancel acknowledged ones."""
+        if action == 'remove':
+            self.cancel(value)
+        elif value.severity == 'critical':
+            self.schedule(value.id, value.timestamp.timestamp() if value.timestamp else time.time())
+
+    def start(self):
+        """Start the timer thread (once)."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='escalation', daemon=True)
+                self._thread.start()
+
+    def pop_due(self, now=None):
+        """Remove and return (alert_id, level) for every deadline that has passed."""
+        now = time.time() if now is None else now
+        due = []
+        with self._cond:
+            while self._heap and (not self._heap[0][-1] or self._heap[0][0] <= now):
+                deadline, _, alert_id, level, active = heapq.heappop(self._heap)
+                if active:
+                    del self._timers[alert_id]
+                    due.append((alert_id, level))
+        return due
+
+    def poll(self):
+        """Schedule critical alerts committed since the last poll, by any process, in every shard."""
+        for key in each_shard():
+            query = (db.select(Alert.id, Alert.timestamp, Alert.escalation_level)
+                     .where(Alert.severity == 'critical', Alert.acknowledged == False)  # noqa: E712
+                     .order_by(Alert.id))
+            if key in self._last_seen_ids:
+                query = query.where(Alert.id > self._last_seen_ids[key])
+            else:
+                # First poll: only alerts with tiers left
+                query = query.where(Alert.escalation_level < len(self.tiers))
+            rows = db.session.execute(query).all()
+            for alert_id, timestamp, escalation_level in rows:
+                self.schedule(alert_id, timestamp.timestamp(), escalation_level)
+            if rows:
+                self._last_seen_ids[key] = rows[-1].id
+
+    def escalate(self, alert_id, level):
+        """Escalate an alert to ``level`` if it is still unacknowledged.
+
+        Returns:
+            bool: True if this call escalated the alert
+        """
+        with use_shard(shard_for_alert(alert_id)):
+            return self._escalate(alert_id, level)
+
+    def _escalate(self, alert_id, level):
+        alert = db.session.get(Alert, alert_id)
+        patient = alert and db.session.get(Patient, alert.patient_id)
+        if patient is None:
+            # Not rescheduled, so the alert leaves the heap
+            logger.warning("Not escalating alert %s: it or its patient no longer exists", alert_id)
+            return False
+        escalated = db.session.execute(
+            db.update(Alert)
+            .where(Alert.id == alert_id, Alert.acknowledged == False,  # noqa: E712
+                   Alert.escalation_level == level - 1)
+            .values(escalation_level=level)
+        ).rowcount
+        db.session.commit()
+        if not escalated:
+            # Acknowledged (possibly by another process) or already escalated
+            return False
+
+        ESCALATIONS.inc(level=level)
+        logger.warning("Escalating alert %s for %s to level %d", alert_id, patient.name, level)
+
+        # Imported lazily like in utils.ingest: only escalations need SMTP
+        from utils.notifications import send_escalation_notification
+        try:
+            send_escalation_notification(patient, alert, level, self.tiers[level - 1][1])
+        except Exception:
+            NOTIFICATIONS.inc(result='failed')
+            logger.exception("Failed to queue escalation for alert %s", alert_id)
+
+        if level < len(self.tiers):
+            # From now rather than from when the alert was raised
+            delay = self.tiers[level][0] - self.tiers[level - 1][0]
+            self._push(alert_id, time.time() + delay, level + 1)
+        return True
+
+    def _wait(self):
+        """Block until a deadline or the next poll is due."""
+        with self._cond:
+            while True:
+                now = time.time()
+                if self.poll_seconds and now >= self._next_poll:
+                    return
+                while self._heap and not self._heap[0][-1]:
+                    heapq.heappop(self._heap)
+                if self._heap and self._heap[0][0] <= now:
+                    return
+                timeout = self._heap[0][0] - now if self._heap else None
+                if self.poll_seconds:
+                    timeout = min(timeout or self.poll_seconds, self._next_poll - now)
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wait()
+            with self.app.app_context():
+                if self.poll_seconds and time.time() >= self._next_poll:
+                    self._next_poll = time.time() + self.poll_seconds
+                    try:
+                        self.poll()
+                    except Exception:
+                        logger.exception("Polling for critical alerts failed")
+                for alert_id, level in self.pop_due():
+                    try:
+                        self.escalate(alert_id, level)
+                    except Exception:
+                        logger.exception("Escalating alert %s failed, retrying in %ds", alert_id, RETRY_SECONDS)
+                        db.session.rollback()
+                        self._push(alert_id, time.time() + RETRY_SECONDS, level)
+
+def init_escalation(app):
+    """Create the app's escalation engine, started on the first request.
+
+    Config:
+        ESCALATION_ENABLED: Set to False to disable escalation (default True)
+        ESCALATION_TIERS: Sequence of (delay_seconds, recipients_var)
+        ESCALATION_POLL_SECONDS: Poll interval for alerts from other processes
+    """
+    engine = EscalationEngine(app, app.config.get('ESCALATION_TIERS', ESCALATION_TIERS),
+                              app.config.get('ESCALATION_POLL_SECONDS', DEFAULT_POLL_SECONDS))
+    app.extensions['escalation'] = engine
+    subscribe(app, engine.on_alert_change)
+
+    @app.before_request
+    def _start_escalation():
+        if app.config.get('ESCALATION_ENABLED', True):
+            engine.start()
+
+    return engine
@@ -0,0 +1,217 @@
+"""
+Streaming export of vital sign and alert history.
+
+Rows are read with SQLAlchemy Core on a dedicated connection using streamed
+results, formatted one chunk at a time and yielded to the caller, so memory
+stays constant no matter how many rows are exported. Used by both the
+``export_data.py`` CLI and the ``/export/<dataset>`` route.
+
+Vital signs sealed into cold storage (utils.cold_storage) are merged in
+by timestamp when a ColdStore is given, so an export covers the whole
+history whichever tier a reading is in. Given shard_engines()
+(utils.shards), every shard is streamed and merged the same way.
+
+Parquet output is optional and requires ``pyarrow``.
+"""
+
+import csv
+import heapq
+import io
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from models import Alert, FixedPoint, VitalSign
+
+EXPORT_TABLES = {
+    'vitals': VitalSign.__table__,
+    'alerts': Alert.__table__,
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date or datetime, returning None for empty values."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+def build_export_query(dataset, patient_id=None, start=None, end=None):
+    """Build the SELECT for a dataset filtered by patient and time range.
+
+    Args:
+        dataset: 'vitals' or 'alerts'
+        patient_id: Optional patient ID to filter on
+        start: Optional inclusive lower bound on timestamp
+        end: Optional exclusive upper bound on timestamp
+    """
+    table = EXPORT_TABLES[dataset]
+    query = sa.select(*table.columns)
+    if patient_id is not None:
+        query = query.where(table.c.patient_id == patient_id)
+    if start is not None:
+        query = query.where(table.c.timestamp >= start)
+    if end is not None:
+        query = query.where(table.c.timestamp < end)
+    return query.order_by(table.c.timestamp, table.c.id)
+
+def iter_row_chunks(engine, query, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of rows from ``query`` using a streamed result."""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+def merge_row_chunks(chunk_streams, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Merge streams of sorted row chunks into one stream of chunks sorted by ``key``."""
+    rows = heapq.merge(*((row for chunk in chunks for row in chunk) for chunks in chunk_streams), key=key)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def format_csv(columns, chunks):
+    """Yield CSV text, one string per chunk of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def format_ndjson(columns, chunks):
+    """Yield newline-delimited JSON text, one string per chunk of rows."""
+    for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + '\n'
+            for row in rows
+        )
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that collects bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _arrow_schema(pa, table):
+    """Map the table's column types to an Arrow schema."""
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, sa.Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, FixedPoint):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, sa.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, sa.Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, sa.DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def format_parquet(table, chunks):
+    """Return a generator of Parquet bytes, one row group per chunk of rows.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return _parquet_chunks(pa, pq, table, chunks)
+
+def _parquet_chunks(pa, pq, table, chunks):
+    schema = _arrow_schema(pa, table)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def stream_export(engine, dataset, fmt='csv', patient_id=None, start=None, end=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, cold=None):
+    """Stream a dataset export in the requested format.
+
+    Args:
+        engine: Engine to read, or shard_engines() to read every shard
+        cold: Optional ColdStore whose sealed vital signs are included
+
+    Returns:
+        generator: Yields str chunks for csv/ndjson and bytes for parquet
+    """
+    if dataset not in EXPORT_TABLES:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    table = EXPORT_TABLES[dataset]
+    query = build_export_query(dataset, patient_id, start, end)
+    engines = list(engine.values()) if isinstance(engine, dict) else [engine]
+    streams = [iter_row_chunks(source, query, chunk_size) for source in engines]
+    columns = [column.name for column in table.columns]
+    if cold is not None and dataset == 'vitals':
+        streams.insert(0, cold.iter_row_chunks(patient_id, start, end, chunk_size))
+    if len(streams) > 1:
+        timestamp, row_id = columns.index('timestamp'), columns.index('id')
+        chunks = merge_row_chunks(streams, key=lambda row: (row[timestamp], row[row_id]), chunk_size=chunk_size)
+    else:
+        chunks = streams[0]
+
+    if fmt == 'csv':
+        return format_csv(columns, chunks)
+    if fmt == 'ndjson':
+        return format_ndjson(columns, chunks)
+    return format_parquet(table, chunks)
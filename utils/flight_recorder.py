@@ -0,0 +1,161 @@
+"""
+Slow-request flight recorder.
+
+Requests slower than a configurable threshold keep their full timeline: each
+SQL statement with its duration and row count, each template render, and
+named spans such as ``generate_fresh_vitals`` or notification sends. The last
+N such traces are kept in a ring buffer and can be viewed or exported as JSON
+from the debug routes.
+
+While a request runs, events are appended to a plain list on ``g``; when the
+request finishes under the threshold the list is dropped, so the cost for
+fast requests is one append per event. SQL parameters are never recorded, so
+traces do not contain patient data.
+
+Configuration:
+    FLIGHT_RECORDER_THRESHOLD_MS: Minimum request duration to keep (default 1000)
+    FLIGHT_RECORDER_SIZE: Number of traces kept in the ring buffer (default 50)
+    FLIGHT_RECORDER_SAMPLE_RATE: Fraction of requests recorded at all (default 1.0)
+"""
+
+import itertools
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, has_app_context, jsonify, render_template, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class FlightRecorder:
+    """Ring buffer of slow-request traces."""
+
+    def __init__(self, size=50):
+        self.traces = deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def record(self, trace):
+        trace['id'] = next(self._ids)
+        self.traces.append(trace)
+
+    def snapshot(self):
+        """Return the stored traces, newest first."""
+        return list(reversed(self.traces))
+
+def _events():
+    """Return the current request's event list, or None if not recording."""
+    if not has_app_context():
+        return None
+    return g.get('_flight_events')
+
+@contextmanager
+def span(name):
+    """Record the enclosed block as a named span in the current trace."""
+    events = _events()
+    if events is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        events.append(('span', name, start, time.perf_counter(), None))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _events() is not None:
+        conn.info['_flight_query_start'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    events = _events()
+    start = conn.info.pop('_flight_query_start', None)
+    if events is None or start is None:
+        return
+    # sqlite3 reports -1 for SELECT statements
+    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+    events.append(('sql', statement, start, time.perf_counter(), rows))
+
+def _before_render(sender, template, context, **extra):
+    if _events() is not None:
+        g._flight_render_start = time.perf_counter()
+
+def _after_render(sender, template, context, **extra):
+    events = _events()
+    start = g.pop('_flight_render_start', None)
+    if events is not None and start is not None:
+        events.append(('template', template.name, start, time.perf_counter(), None))
+
+def _start_request():
+    sample_rate = current_app.config['FLIGHT_RECORDER_SAMPLE_RATE']
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    g._flight_start = time.perf_counter()
+    g._flight_events = []
+
+def _finish_request(response):
+    events = g.pop('_flight_events', None)
+    if events is None:
+        return response
+    start = g.pop('_flight_start')
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms < current_app.config['FLIGHT_RECORDER_THRESHOLD_MS']:
+        return response
+
+    timeline = [{
+        'kind': kind,
+        'name': name,
+        'start_ms': round((event_start - start) * 1000, 3),
+        'duration_ms': round((event_end - event_start) * 1000, 3),
+        'rows': rows,
+    } for kind, name, event_start, event_end, rows in events]
+    sql = [e for e in timeline if e['kind'] == 'sql']
+    current_app.extensions['flight_recorder'].record({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'route': request.url_rule.rule if request.url_rule else None,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 3),
+        'sql_count': len(sql),
+        'sql_ms': round(sum(e['duration_ms'] for e in sql), 3),
+        'timeline': timeline,
+    })
+    return response
+
+def slow_requests():
+    """Display the recorded slow-request traces."""
+    recorder = current_app.extensions['flight_recorder']
+    return render_template('slow_requests.html', traces=recorder.snapshot(),
+                           threshold_ms=current_app.config['FLIGHT_RECORDER_THRESHOLD_MS'])
+
+def slow_requests_json():
+    """Export the recorded slow-request traces as JSON."""
+    return jsonify(current_app.extensions['flight_recorder'].snapshot())
+
+def init_flight_recorder(app, view_decorator=None):
+    """Register the flight recorder hooks and debug routes on ``app``.
+
+    Args:
+        app: The Flask application
+        view_decorator: Optional decorator (e.g. login_required) applied to
+            the debug routes
+    """
+    app.config.setdefault('FLIGHT_RECORDER_THRESHOLD_MS', 1000)
+    app.config.setdefault('FLIGHT_RECORDER_SIZE', 50)
+    app.config.setdefault('FLIGHT_RECORDER_SAMPLE_RATE', 1.0)
+    app.extensions['flight_recorder'] = FlightRecorder(app.config['FLIGHT_RECORDER_SIZE'])
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    decorate = view_decorator or (lambda view: view)
+    app.add_url_rule('/debug/slow-requests', 'slow_requests', decorate(slow_requests))
+    app.add_url_rule('/debug/slow-requests.json', 'slow_requests_json', decorate(slow_requests_json))
@@ -0,0 +1,321 @@
+"""
+Ingest of vital sign readings.
+
+The logic behind POST /update: record the reading, classify it against the
+thresholds, update the patient's latest vitals in patient_status and the
+rolling trends and sparklines (if the app has utils.trends and
+utils.sparklines set up), create alerts, count them in the hourly alert
+rollups (utils.alert_rollups), append them to the change feed
+(utils.change_feed) and notify on critical ones. It
+is shared by the /update endpoint, which ingests one reading per request,
+and the device gateway, which ingests readings in micro-batches with one
+commit per batch (per shard, see utils.shards).
+
+Batches are written on a Core fast path: readings go in with one
+driver-level executemany, alerts with one INSERT ... RETURNING and the
+latest state with one upsert, without ORM objects, identity-map
+bookkeeping or flush ordering. The ORM path (record_reading) is kept as
+the reference and has the same results; set INGEST_CORE = False in the
+app config to use it.
+
+Readings of patients that don't exist are rejected before anything is
+written, and the rest of the batch is stored. A shard whose transaction
+fails is rolled back and its readings get the error, while the other
+shards' readings are stored; nothing after a shard's commit raises. So a
+caller retries exactly the readings that failed (see
+utils.ingest_queue.ingest_with_retry) and never stores one twice.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+
+from db import db
+from models import Alert, Patient, VitalSign
+from utils.alert_events import AlertEntry, publish
+from utils.alert_rollups import count_raised, rollup_key
+from utils.alerting import VITAL_TYPES
+from utils.bulk_import import ALERT_COLUMNS, VITAL_COLUMNS, executemany_insert
+from utils.change_feed import alert_change, record_changes, vitals_changes
+from utils.ingest_queue import ReadingRejected
+from utils.metrics import ALERTS_CREATED, NOTIFICATIONS, READINGS_INGESTED
+from utils.patient_status import status_row, upsert_status
+from utils.shards import group_by_shard, use_shard
+from utils.threshold_profiles import classify_batch_for, evaluator_for, threshold_profiles
+from utils.trends import trend_alert, trend_alert_values
+
+# A stored reading on the Core path, with the same attributes as VitalSign
+Reading = namedtuple('Reading', VITAL_COLUMNS)
+
+class UnknownPatient(ReadingRejected, LookupError):
+    """Returned in place of a result for a reading whose patient does not exist."""
+
+    def __init__(self, patient_id):
+        super().__init__(f"Unknown patient {patient_id}")
+        self.patient_id = patient_id
+
+_VITALS = VitalSign.__table__
+_ALERTS = Alert.__table__
+_INSERT_ALERTS = _ALERTS.insert().returning(_ALERTS.c.id, sort_by_parameter_order=True)
+
+def quantize_vitals(reading):
+    """Return a reading's vitals as {vital_type: value}, rounded to the
+    precision they are stored with (see models.FixedPoint)."""
+    return {vital_type: _VITALS.c[vital_type].type.quantize(reading.get(vital_type))
+            for vital_type in VITAL_TYPES}
+
+def record_reading(patient_id, vitals, timestamp=None):
+    """Add a reading and any alerts it raises to the session without committing.
+
+    ``vitals`` maps registered vital signs (utils.vitals) to their values.
+    The patient's trends are updated; its sparklines are left to the
+    caller, once the reading is committed.
+
+    Returns:
+        tuple: (vital, alerts)
+    """
+    timestamp = timestamp or datetime.now()
+    # Round to the stored precision so trends, sparklines and alerts see the stored values
+    values = quantize_vitals(vitals)
+    trends = current_app.extensions.get('trends')
+    trend_alerts = trends.update(patient_id, timestamp, values) if trends else []
+
+    vital = VitalSign(patient_id=patient_id, timestamp=timestamp, **values)
+    db.session.add(vital)
+    READINGS_INGESTED.inc()
+
+    alerts = []
+    for vital_type, value, severity, threshold_str in evaluator_for(patient_id).classify(values):
+        alert = Alert(
+            patient_id=patient_id,
+            vital_type=vital_type,
+            value=value,
+            threshold=threshold_str,
+            severity=severity,
+            timestamp=timestamp,
+            acknowledged=False
+        )
+        db.session.add(alert)
+        ALERTS_CREATED.inc(severity=severity)
+        alerts.append(alert)
+
+    for vital_type, slope in trend_alerts:
+        alert = trend_alert(patient_id, vital_type, slope, timestamp)
+        db.session.add(alert)
+        ALERTS_CREATED.inc(severity=alert.severity)
+        alerts.append(alert)
+
+    return vital, alerts
+
+def notify_critical_alerts(patient, alerts):
+    """Queue a notification for the critical alerts in ``alerts``.
+
+    Must be called after the alerts are committed. Notifications are sent
+    in the background, coalesced with other alerts (see utils.notifications).
+    Does nothing if ``patient`` is None (deleted since); never raises.
+    """
+    critical = [alert for alert in alerts if alert.severity == 'critical']
+    if not critical:
+        return
+    patient_id = critical[0].patient_id
+    if patient is None:
+        current_app.logger.warning('Not notifying on alerts of deleted patient %s', patient_id)
+        return
+
+    # Imported lazily: most readings never reach this point, so the
+    # SMTP machinery stays out of the cold-start import path.
+    from utils.notifications import send_critical_alert_notification
+    try:
+        send_critical_alert_notification(patient, critical)
+    except Exception:
+        # The alerts are already stored; escalation will follow up on them
+        NOTIFICATIONS.inc(len(critical), result='failed')
+        current_app.logger.exception('Failed to queue notification for patient %s', patient_id)
+
+def ingest_readings(readings):
+    """Ingest a batch of readings with a single commit per shard.
+
+    Args:
+        readings: Iterable of dicts with patient_id and optional timestamp
+            and registered vital signs (heart_rate, spo2, temp, ...)
+
+    Returns:
+        list: (vital, alerts) for each reading, in order; Reading tuples
+            and AlertEntry alerts on the Core path. A reading that was not
+            stored gets an exception instead: UnknownPatient if its patient
+            does not exist, or the error its shard's transaction failed with.
+    """
+    readings = list(readings)
+    results = [None] * len(readings)
+    ingest_shard = _ingest_shard_core if current_app.config.get('INGEST_CORE', True) else _ingest_shard
+    trends = current_app.extensions.get('trends')
+    for key, group in group_by_shard(enumerate(readings), lambda item: item[1]['patient_id']).items():
+        with use_shard(key):
+            patients = _patients({r['patient_id'] for _, r in group})
+            for i, r in group:
+                if r['patient_id'] not in patients:
+                    results[i] = UnknownPatient(r['patient_id'])
+            group = [(i, r) for i, r in group if r['patient_id'] in patients]
+            if not group:
+                continue
+            try:
+                shard_results = ingest_shard([r for _, r in group], patients)
+            except Exception as e:
+                current_app.logger.exception('Ingest of %d readings in shard %s failed', len(group), key)
+                # Nothing was committed; the trends the batch touched are
+                # restored from the stored readings when next seen
+                db.session.rollback()
+                if trends is not None:
+                    trends.discard(patients)
+                shard_results = [e] * len(group)
+            for (i, _), result in zip(group, shard_results):
+                results[i] = result
+    return results
+
+def _patients(patient_ids):
+    """Return {id: row with id, name and room} for the patients in the current shard."""
+    rows = db.session.execute(db.select(Patient.id, Patient.name, Patient.room).where(Patient.id.in_(patient_ids)))
+    return {row.id: row for row in rows}
+
+def _notify(results, patients):
+    """Queue notifications for the critical alerts of each (vital, alerts) result."""
+    for vital, alerts in results:
+        if any(alert.severity == 'critical' for alert in alerts):
+            notify_critical_alerts(patients.get(vital.patient_id), alerts)
+
+def _ingest_shard(readings, patients):
+    """Ingest readings of ``patients`` (see _patients) in the current shard and commit."""
+    trends = current_app.extensions.get('trends')
+    sparklines = current_app.extensions.get('sparklines')
+    if trends is not None:
+        # Restore trend state for the whole batch in two queries
+        trends.load({r['patient_id'] for r in readings})
+    profiles = threshold_profiles()
+    if profiles is not None:
+        # Look up the batch's wards for threshold profiles in one query
+        profiles.prepare({r['patient_id'] for r in readings})
+
+    results = [
+        record_reading(r['patient_id'], r, r.get('timestamp'))
+        for r in readings
+    ]
+    if trends is not None:
+        trends.save_snapshots(patient_ids={r['patient_id'] for r in readings})
+    # One upsert for the whole batch, latest reading per patient
+    statuses = [
+        status_row(vital.patient_id, vital.timestamp,
+                   {vital_type: getattr(vital, vital_type) for vital_type in VITAL_TYPES},
+                   {alert.vital_type for alert in alerts})
+        for vital, alerts in results
+    ]
+    upsert_status(statuses)
+    count_raised(rollup_key(alert) for _, alerts in results for alert in alerts)
+    db.session.flush()  # Assigns the alert ids for the change feed
+    record_changes(vitals_changes(statuses) + [alert_change(alert) for _, alerts in results for alert in alerts])
+    # Collected before the commit expires the objects
+    critical = [(vital, alerts) for vital, alerts in results
+                if any(alert.severity == 'critical' for alert in alerts)]
+    points = [(row['patient_id'], row['vitals_updated'], {vital_type: row[vital_type] for vital_type in VITAL_TYPES})
+              for row in statuses]
+    db.session.commit()
+
+    try:
+        if sparklines is not None:
+            for patient_id, timestamp, values in points:
+                sparklines.add(patient_id, timestamp, values)
+        _notify(critical, patients)
+    except Exception:
+        current_app.logger.exception('Follow-up of %d stored readings failed', len(results))
+    return results
+
+def _insert_alerts(conn, rows):
+    """Insert alert rows (dicts) and return their ids in order."""
+    if not rows:
+        return []
+    if conn.dialect.name != 'sqlite':
+        return conn.execute(_INSERT_ALERTS, rows).scalars().all()
+    # SQLAlchemy would fall back to one INSERT ... RETURNING per row here.
+    # The transaction holds the write lock, and AUTOINCREMENT gives the rows
+    # consecutive ids, so the last id is enough.
+    executemany_insert(conn, _ALERTS, ALERT_COLUMNS, [tuple(row[column] for column in ALERT_COLUMNS) for row in rows])
+    last_id = conn.exec_driver_sql('SELECT last_insert_rowid()').scalar()
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+def _ingest_shard_core(readings, patients):
+    """Ingest readings of ``patients`` in the current shard with Core statements and commit.
+
+    Same results as _ingest_shard, with Reading tuples and AlertEntry
+    alerts in place of ORM objects.
+    """
+    trends = current_app.extensions.get('trends')
+    sparklines = current_app.extensions.get('sparklines')
+    if trends is not None:
+        trends.load({r['patient_id'] for r in readings})
+
+    vitals = []
+    for r in readings:
+        patient_id = r['patient_id']
+        timestamp = r.get('timestamp') or datetime.now()
+        values = quantize_vitals(r)
+        trend_alerts = trends.update(patient_id, timestamp, values) if trends else []
+        vitals.append((Reading(patient_id, timestamp, **values), trend_alerts))
+
+    # Threshold alerts for the whole batch are classified column-wise,
+    # grouped by the patients' threshold profiles
+    classified_rows = classify_batch_for([vital.patient_id for vital, _ in vitals], [vital[2:] for vital, _ in vitals])
+    alert_rows, statuses, raised = [], [], []
+    for (vital, trend_alerts), classified in zip(vitals, classified_rows):
+        patient_id, timestamp = vital.patient_id, vital.timestamp
+        alerts = [
+            {'patient_id': patient_id, 'timestamp': timestamp, 'vital_type': vital_type, 'value': value,
+             'threshold': threshold_str, 'severity': severity, 'acknowledged': False}
+            for vital_type, value, severity, threshold_str in classified
+        ]
+        alerts.extend(trend_alert_values(patient_id, vital_type, slope, timestamp)
+                      for vital_type, slope in trend_alerts)
+        alert_rows.extend(alerts)
+        raised.append(alerts)
+        statuses.append(status_row(patient_id, timestamp, dict(zip(VITAL_TYPES, vital[2:])),
+                                   {alert['vital_type'] for alert in alerts}))
+    vitals = [vital for vital, _ in vitals]
+
+    conn = db.session.connection()
+    executemany_insert(conn, _VITALS, VITAL_COLUMNS, vitals)
+    alert_ids = iter(_insert_alerts(conn, alert_rows))
+    results = [(vital, [AlertEntry(next(alert_ids), *(alert[column] for column in AlertEntry._fields[1:]))
+                        for alert in alerts])
+               for vital, alerts in zip(vitals, raised)]
+    if trends is not None:
+        trends.save_snapshots(patient_ids={r['patient_id'] for r in readings})
+    upsert_status(statuses, conn)
+    count_raised(((row['patient_id'], row['timestamp'], row['vital_type'], row['severity']) for row in alert_rows),
+                 conn=conn)
+    record_changes(vitals_changes(statuses) + [alert_change(entry) for _, entries in results for entry in entries],
+                   conn)
+    db.session.commit()
+
+    try:
+        READINGS_INGESTED.inc(len(vitals))
+        for _, entries in results:
+            for entry in entries:
+                ALERTS_CREATED.inc(severity=entry.severity)
+        if sparklines is not None:
+            for vital in vitals:
+                sparklines.add(vital.patient_id, vital.timestamp, dict(zip(VITAL_TYPES, vital[2:])))
+        publish([('add', entry) for _, entries in results for entry in entries])
+        _notify(results, patients)
+    except Exception:
+        current_app.logger.exception('Follow-up of %d stored readings failed', len(vitals))
+    return results
+
+def ingest_in_app(app):
+    """Return a callable that runs ingest_readings in ``app``'s context.
+
+    For ingest outside a request, e.g. the device gateway and the
+    /update writer thread.
+    """
+    def ingest(readings):
+        with app.app_context():
+            return ingest_readings(readings)
+    return ingest
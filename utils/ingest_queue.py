@@ -0,0 +1,262 @@
+"""
+Bounded ingest queue with severity-aware admission control.
+
+POST /update hands readings to an IngestQueue instead of writing them in the
+request thread. A single writer thread stores them in batches (one commit
+per batch), so concurrent requests no longer contend for the SQLite write
+lock. When the writer falls behind, readings are admitted by severity:
+
+- critical: always admitted, and written before anything else (after
+  the same patient's readings already pending, which move up with it, so
+  each patient's readings are still written in order)
+- warning: admitted while the queue is below capacity, otherwise rejected
+- normal: coalesced per patient (only the latest pending reading is kept)
+  once the queue is half full, and rejected when it is full and the
+  patient has nothing pending
+
+Rejected readings raise QueueFull, which /update turns into a 429 with a
+Retry-After estimated from the writer's recent throughput.
+
+Readings are checked with validate_reading before they are queued, so a
+malformed one is refused up front instead of failing its batch. A batch
+is stored with ingest_with_retry (shared with the device gateway): only
+readings that were not stored are retried, and a reading that fails gets
+its own error without failing the rest of its batch.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from utils.metrics import INGEST_ADMITTED, INGEST_QUEUE_DEPTH, INGEST_SHED
+from utils.vitals import vital_names
+
+logger = logging.getLogger(__name__)
+
+# Attempts to store a reading before it is failed (e.g. while SQLite is locked)
+MAX_INGEST_ATTEMPTS = 5
+RETRY_BACKOFF = 0.05  # seconds before the second attempt, doubling after that
+
+# Bounds for the Retry-After estimate, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 30
+
+class QueueFull(Exception):
+    """Raised when a reading is rejected because the queue is saturated."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Ingest queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class ReadingRejected(Exception):
+    """A reading that can never be stored as sent, e.g. of a patient that does not exist; not retried."""
+
+class InvalidReading(ReadingRejected, ValueError):
+    """A reading with a missing or malformed patient_id or vital sign."""
+
+def validate_reading(data):
+    """Check a reading and convert its values to the types ingest expects.
+
+    Args:
+        data: Mapping with patient_id and any registered vital signs
+            (utils.vitals); numbers may be sent as strings
+
+    Returns:
+        dict: patient_id as an int plus each vital sign given, as a float
+
+    Raises:
+        InvalidReading: If data is not a mapping, patient_id is missing or
+            not an integer, or a vital sign is not a finite number
+    """
+    if not isinstance(data, dict):
+        raise InvalidReading("expected a JSON object")
+    patient_id = data.get('patient_id')
+    if patient_id is None or isinstance(patient_id, (bool, float)):
+        raise InvalidReading(f"patient_id must be an integer, not {patient_id!r}")
+    try:
+        reading = {'patient_id': int(patient_id)}
+    except (TypeError, ValueError):
+        raise InvalidReading(f"patient_id must be an integer, not {patient_id!r}") from None
+    for vital_type in vital_names():
+        value = data.get(vital_type)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            value = float(value)
+        except (TypeError, ValueError):
+            raise InvalidReading(f"{vital_type} must be a number, not {value!r}") from None
+        if not math.isfinite(value):
+            raise InvalidReading(f"{vital_type} must be a finite number")
+        reading[vital_type] = value
+    return reading
+
+# Errors that would happen again on every attempt
+_NOT_RETRIED = (ReadingRejected, TypeError, ValueError)
+
+def ingest_with_retry(ingest, readings, attempts=None, backoff=None):
+    """Store readings with ``ingest``, retrying only the readings that were not stored.
+
+    ``ingest`` returns a list with a result per reading, where an exception
+    marks a reading that was not stored (its transaction was rolled back);
+    any other return value means all were stored. An exception raised by
+    ``ingest`` means nothing was stored, so it must not raise once it has
+    committed anything (utils.ingest.ingest_readings doesn't). Failed
+    readings are retried on their own, except ReadingRejected ones and
+    TypeError or ValueError, which would fail the same way again.
+
+    Args:
+        attempts: Attempts per reading (default MAX_INGEST_ATTEMPTS)
+        backoff: Seconds before the second attempt, doubling after that
+            (default RETRY_BACKOFF)
+
+    Returns:
+        list: Per reading, None if it was stored or the exception it failed with
+    """
+    attempts = MAX_INGEST_ATTEMPTS if attempts is None else attempts
+    backoff = RETRY_BACKOFF if backoff is None else backoff
+    errors = [None] * len(readings)
+    pending = list(range(len(readings)))
+    for attempt in range(1, attempts + 1):
+        try:
+            results = ingest([readings[i] for i in pending])
+        except Exception as e:
+            logger.exception("Ingest of %d readings failed (attempt %d)", len(pending), attempt)
+            results = [e] * len(pending)
+        if not isinstance(results, list):
+            results = [None] * len(pending)
+        failed = []
+        for i, result in zip(pending, results):
+            errors[i] = result if isinstance(result, Exception) else None
+            if errors[i] is not None and not isinstance(errors[i], _NOT_RETRIED):
+                failed.append(i)
+        if not failed:
+            break
+        logger.warning("%d of %d readings were not stored (attempt %d)", len(failed), len(readings), attempt)
+        pending = failed
+        if attempt < attempts:
+            time.sleep(backoff * 2 ** (attempt - 1))
+    return errors
+
+class IngestQueue:
+    """Queue readings for a single writer thread, shedding load by severity.
+
+    Args:
+        ingest: Callable taking a list of reading dicts and storing them
+            (e.g. ingest_in_app(app)); see ingest_with_retry
+        capacity: Pending readings before warning and normal readings are rejected
+        batch_size: Maximum readings per ingest call
+        coalesce_at: Pending readings before normal readings are coalesced
+            per patient (defaults to half the capacity)
+    """
+
+    def __init__(self, ingest, capacity=1000, batch_size=200, coalesce_at=None):
+        self.ingest = ingest
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.coalesce_at = capacity // 2 if coalesce_at is None else coalesce_at
+        self._critical = deque()  # Format: [(reading, [futures])]
+        self._pending = OrderedDict()  # Format: {key: (reading, [futures])}
+        self._sequence = 0
+        self._rate = None  # Readings per second, smoothed
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._critical) + len(self._pending)
+
+    def submit(self, reading, severity=None):
+        """Queue a reading and return a Future for its outcome.
+
+        Args:
+            reading: Dict with patient_id and optional heart_rate, spo2, temp
+                and timestamp
+            severity: Highest alert severity of the reading ('critical',
+                'warning' or None)
+
+        Returns:
+            Future: Resolves to 'stored', or 'coalesced' if a newer reading
+            for the same patient replaced it before it was written. Fails
+            with the reading's error if it could not be stored (e.g.
+            utils.ingest.UnknownPatient).
+
+        Raises:
+            QueueFull: If the reading was rejected
+        """
+        future = Future()
+        with self._cond:
+            depth = len(self)
+            if severity == 'critical':
+                patient_id = reading['patient_id']
+                # The patient's pending readings go first, keeping its readings in order
+                earlier = [key for key, (queued, _) in self._pending.items() if queued['patient_id'] == patient_id]
+                for key in earlier:
+                    self._critical.append(self._pending.pop(key))
+                self._critical.append((reading, [future]))
+            elif severity is None and depth >= self.coalesce_at and reading['patient_id'] in self._pending:
+                # Keep the queue position but replace the older reading
+                _, futures = self._pending[reading['patient_id']]
+                self._pending[reading['patient_id']] = (reading, futures + [future])
+                INGEST_SHED.inc(reason='coalesced')
+                INGEST_ADMITTED.inc(priority='normal')
+                return future
+            elif depth >= self.capacity:
+                INGEST_SHED.inc(reason='rejected')
+                raise QueueFull(self.retry_after(depth))
+            elif severity is None and reading['patient_id'] not in self._pending:
+                self._pending[reading['patient_id']] = (reading, [future])
+            else:
+                # Warnings (and normal readings queued behind one for the
+                # same patient) are never coalesced
+                self._sequence += 1
+                self._pending[('seq', self._sequence)] = (reading, [future])
+            INGEST_ADMITTED.inc(priority=severity or 'normal')
+            INGEST_QUEUE_DEPTH.set(len(self))
+            self._start()
+            self._cond.notify()
+        return future
+
+    def retry_after(self, depth=None):
+        """Estimate the seconds until the queue has drained."""
+        depth = len(self) if depth is None else depth
+        if not self._rate:
+            return MIN_RETRY_AFTER
+        return max(MIN_RETRY_AFTER, min(MAX_RETRY_AFTER, math.ceil(depth / self._rate)))
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def _take_batch(self):
+        batch = []
+        while self._critical and len(batch) < self.batch_size:
+            batch.append(self._critical.popleft())
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popitem(last=False)[1])
+        INGEST_QUEUE_DEPTH.set(len(self))
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not len(self):
+                    self._cond.wait()
+                batch = self._take_batch()
+
+            started = time.perf_counter()
+            errors = ingest_with_retry(self.ingest, [reading for reading, _ in batch])
+
+            if not any(errors):
+                rate = len(batch) / max(time.perf_counter() - started, 1e-6)
+                self._rate = rate if self._rate is None else 0.8 * self._rate + 0.2 * rate
+            for (_, futures), error in zip(batch, errors):
+                for i, future in enumerate(futures):
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result('stored' if i == len(futures) - 1 else 'coalesced')
@@ -0,0 +1,300 @@
+"""
+Request-level instrumentation and Prometheus-style metrics.
+
+Metrics are kept in memory per process and exposed in the Prometheus text
+format on ``/metrics``. Each request records its latency, SQL query count and
+time, template render time and response size under the matched route, so an
+N+1 query pattern shows up as a route whose query count grows with the data.
+
+Usage:
+    from utils.metrics import init_metrics
+    init_metrics(app)
+"""
+
+import bisect
+import threading
+import time
+
+from flask import Response, current_app, g, has_app_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def _escape(value):
+    """Escape a label value for the text exposition format."""
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for the given label values."""
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Gauge:
+    """A value that can go up and down, with optional labels."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        """Return the current value for the given label values."""
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Histogram:
+    """A histogram of observed values with cumulative buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # Format: {label_values: [bucket_counts, sum, count]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        """Return the number of observations for the given label values."""
+        state = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2]))
+                           for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                yield self.name + '_bucket', _format_labels(self.labelnames, key, le), cumulative
+            yield self.name + '_sum', _format_labels(self.labelnames, key), total
+            yield self.name + '_count', _format_labels(self.labelnames, key), count
+
+class MetricsRegistry:
+    """A collection of metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+# Per-route request metrics
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ('route', 'method'))
+REQUEST_SQL_QUERIES = REGISTRY.histogram(
+    'http_request_sql_queries', 'SQL statements executed per request by route.',
+    ('route', 'method'), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = REGISTRY.counter(
+    'http_request_sql_seconds_total', 'Total time spent in SQL by route.', ('route', 'method'))
+REQUEST_TEMPLATE_SECONDS = REGISTRY.counter(
+    'http_request_template_seconds_total', 'Total template render time by route.', ('route', 'method'))
+RESPONSE_SIZE = REGISTRY.histogram(
+    'http_response_size_bytes', 'Response body size by route.', ('route', 'method'), SIZE_BUCKETS)
+
+# Hot-path counters
+READINGS_INGESTED = REGISTRY.counter(
+    'vitals_readings_ingested_total', 'Vital sign readings ingested.')
+ALERTS_CREATED = REGISTRY.counter(
+    'alerts_created_total', 'Alerts created by severity.', ('severity',))
+NOTIFICATIONS = REGISTRY.counter(
+    'notifications_total', 'Critical alert notifications by result (sent, failed, skipped).', ('result',))
+NOTIFICATION_EMAILS = REGISTRY.counter(
+    'notification_emails_total', 'Notification digest emails by result (sent, failed, rate_limited).', ('result',))
+SMTP_CONNECTIONS = REGISTRY.counter(
+    'smtp_connections_opened_total', 'SMTP connections opened by the notification pool.')
+VITALS_REGENERATION_RUNS = REGISTRY.counter(
+    'vitals_regeneration_runs_total', 'Runs of generate_fresh_vitals that generated new vitals.')
+
+ESCALATIONS = REGISTRY.counter(
+    'alert_escalations_total', 'Unacknowledged critical alerts escalated, by tier.', ('level',))
+
+# Ingest queue admission control
+INGEST_QUEUE_DEPTH = REGISTRY.gauge(
+    'vitals_ingest_queue_depth', 'Readings waiting in the ingest queue.')
+INGEST_ADMITTED = REGISTRY.counter(
+    'vitals_ingest_admitted_total', 'Readings admitted to the ingest queue by priority.', ('priority',))
+INGEST_SHED = REGISTRY.counter(
+    'vitals_ingest_shed_total', 'Readings shed under load by reason (coalesced, rejected).', ('reason',))
+
+def current_request_stats():
+    """Return the stats collected so far for the current request, or None."""
+    if not has_app_context():
+        return None
+    return g.get('_request_stats')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start_times', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('_query_start_times')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats = current_request_stats()
+    if stats is not None:
+        stats['sql_count'] += 1
+        stats['sql_seconds'] += elapsed
+
+def _before_render(sender, template, context, **extra):
+    stats = current_request_stats()
+    if stats is not None:
+        stats['_render_start'] = time.perf_counter()
+
+def _after_render(sender, template, context, **extra):
+    stats = current_request_stats()
+    if stats is not None and '_render_start' in stats:
+        stats['template_seconds'] += time.perf_counter() - stats.pop('_render_start')
+
+def _start_request():
+    g._request_stats = {
+        'start': time.perf_counter(),
+        'sql_count': 0,
+        'sql_seconds': 0.0,
+        'template_seconds': 0.0,
+    }
+
+def _finish_request(response):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+    labels = {
+        'route': request.url_rule.rule if request.url_rule else 'unmatched',
+        'method': request.method,
+    }
+    REQUEST_LATENCY.observe(time.perf_counter() - stats['start'], **labels)
+    REQUEST_SQL_QUERIES.observe(stats['sql_count'], **labels)
+    REQUEST_SQL_SECONDS.inc(stats['sql_seconds'], **labels)
+    REQUEST_TEMPLATE_SECONDS.inc(stats['template_seconds'], **labels)
+    # Streamed responses have no known length
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, **labels)
+    return response
+
+def metrics_view():
+    """Expose all metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def request_metrics_context():
+    """Provide a summary of the current request's stats to templates.
+
+    Only populated when the debug footer is enabled (app.debug or the
+    METRICS_DEBUG_FOOTER config value).
+    """
+    if not (current_app.debug or current_app.config.get('METRICS_DEBUG_FOOTER')):
+        return {'request_metrics': None}
+    stats = current_request_stats()
+    if stats is None:
+        return {'request_metrics': None}
+    return {'request_metrics': {
+        'elapsed_ms': (time.perf_counter() - stats['start']) * 1000,
+        'sql_count': stats['sql_count'],
+        'sql_ms': stats['sql_seconds'] * 1000,
+        'template_ms': stats['template_seconds'] * 1000,
+    }}
+
+def init_metrics(app):
+    """Register request instrumentation and the /metrics route on ``app``."""
+    # SQL timing is hooked on the Engine class so every engine is covered
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.context_processor(request_metrics_context)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,259 @@
+"""
+Versioned schema migrations with batched, resumable backfills.
+
+Revisions live in migrations/versions and are applied to every shard by
+migrate_db.py (Alembic, one alembic_version table per database). Each
+revision runs in its own transaction, which should only hold quick
+schema changes. Data backfills run after it commits, in batches of
+rows by id (migrate_db.py --batch-size), one short transaction each, so
+ingest and acknowledgements keep writing while a migration is in
+progress (on SQLite they wait for at most one batch). Each batch commits
+together with its checkpoint in migration_checkpoint, so an interrupted
+migration resumes from the last batch when it is run again.
+
+A backfill covers the rows that exist when it is planned. Plan it in the
+revision's transaction, right after the schema change it belongs to;
+rows written after that come from code that already fills the column.
+Schema changes are skipped when already applied, so revisions are safe
+on databases created by db.create_all() and on partly migrated ones.
+Revisions describe the tables they touch as of that revision (sa.table,
+sa.Table), not with the app's models, which keep changing after them.
+Each revision has a downgrade(); data that only the newer schema holds
+(e.g. which alerts were acknowledged) is lost by it.
+
+Usage (in a revision):
+    from utils.migrations import add_column, create_index, plan_backfill, run_backfill
+
+    def upgrade():
+        if add_column('alert', sa.Column('severity', sa.String(10), nullable=False, server_default='warning')):
+            plan_backfill('0001.alert.severity', 'alert')
+        run_backfill('0001.alert.severity', alert, {'severity': ...}, alert.c.value > 120)
+        create_index('ix_alert_severity', 'alert', ['severity'])
+"""
+
+import os
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+from alembic import command, context, op
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from models import MigrationCheckpoint
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_PAUSE = 0.05  # seconds between batches, so waiting writers get the lock first
+
+_CHECKPOINTS = MigrationCheckpoint.__table__
+
+def alembic_config(batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """Return the Alembic config for migrations/, with the backfill settings."""
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    config.attributes.update(batch_size=batch_size, pause=pause)
+    return config
+
+def upgrade(engine, revision='head', batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """Upgrade one database to ``revision``."""
+    config = alembic_config(batch_size, pause)
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        command.upgrade(config, revision)
+
+def downgrade(engine, revision):
+    """Downgrade one database to ``revision`` ('base' undoes every revision)."""
+    config = alembic_config()
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        command.downgrade(config, revision)
+
+def current_revision(engine):
+    """Return the revision a database is at, or None if it has never been migrated."""
+    from alembic.runtime.migration import MigrationContext
+    with engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+def _settings():
+    attributes = context.config.attributes
+    return attributes.get('batch_size', DEFAULT_BATCH_SIZE), attributes.get('pause', DEFAULT_PAUSE)
+
+def has_column(table_name, column_name):
+    inspector = inspect(op.get_bind())
+    return (table_name in inspector.get_table_names()
+            and column_name in {column['name'] for column in inspector.get_columns(table_name)})
+
+def add_column(table_name, column):
+    """Add ``column`` to a table unless it is already there.
+
+    Returns:
+        bool: Whether it was added
+    """
+    if table_name not in inspect(op.get_bind()).get_table_names() or has_column(table_name, column.name):
+        return False
+    print(f"Adding {table_name}.{column.name}...")
+    op.add_column(table_name, column)
+    return True
+
+def has_index(table_name, index_name):
+    inspector = inspect(op.get_bind())
+    return (table_name in inspector.get_table_names()
+            and index_name in {index['name'] for index in inspector.get_indexes(table_name)})
+
+def create_index(index_name, table_name, columns, **kwargs):
+    """Create an index on an existing table unless it is already there.
+
+    On PostgreSQL the index is built CONCURRENTLY, outside the revision's
+    transaction, so writers are not blocked while it builds. SQLite holds
+    the write lock for the build.
+
+    Returns:
+        bool: Whether it was created
+    """
+    if table_name not in inspect(op.get_bind()).get_table_names() or has_index(table_name, index_name):
+        return False
+    print(f"Creating index {index_name} on {table_name}...")
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(index_name, table_name, columns, postgresql_concurrently=True, **kwargs)
+    else:
+        op.create_index(index_name, table_name, columns, **kwargs)
+    return True
+
+def forget_backfills(prefix):
+    """Delete the checkpoints of backfills named ``prefix``..., so an upgrade after a downgrade plans them again."""
+    bind = op.get_bind()
+    if inspect(bind).has_table(_CHECKPOINTS.name):
+        bind.execute(_CHECKPOINTS.delete().where(_CHECKPOINTS.c.name.startswith(prefix)))
+
+def plan_backfill(name, table_name):
+    """Record a backfill over the rows of ``table_name`` that exist now.
+
+    Runs in the revision's transaction; run_backfill does the work.
+    """
+    bind = op.get_bind()
+    _CHECKPOINTS.create(bind, checkfirst=True)
+    if bind.execute(sa.select(_CHECKPOINTS.c.name).where(_CHECKPOINTS.c.name == name)).first():
+        return
+    end_id = bind.execute(sa.text(f'SELECT COALESCE(MAX(id), 0) FROM {table_name}')).scalar()
+    bind.execute(_CHECKPOINTS.insert().values(name=name, last_id=0, end_id=end_id, rows_done=0,
+                                              done=False, updated=datetime.now()))
+
+def run_backfill(name, table, values, *where):
+    """Run a planned backfill in batches: UPDATE table SET values WHERE where, by id range.
+
+    Does nothing if the backfill was not planned (the column already
+    existed) or has finished. The update must give the same result if a
+    batch is repeated.
+
+    Args:
+        name: Name passed to plan_backfill
+        table: sa.table() with an id column and the columns used
+        values: {column: value or SQL expression}
+
+    Returns:
+        int: Rows updated by this run
+    """
+    with op.get_context().autocommit_block():
+        # Outside the revision's transaction: each batch commits on its own
+        bind = op.get_bind()
+        if not inspect(bind).has_table(_CHECKPOINTS.name):
+            return 0
+        checkpoint = bind.execute(sa.select(_CHECKPOINTS).where(_CHECKPOINTS.c.name == name)).first()
+        if checkpoint is None or checkpoint.done:
+            return 0
+        batch_size, pause = _settings()
+        ids = table.c.id
+        last_id, end_id, rows_done = checkpoint.last_id, checkpoint.end_id, checkpoint.rows_done
+        updated = 0
+        if last_id:
+            print(f"  {name}: resuming after id {last_id}")
+        while last_id < end_id:
+            # The batch's last id is read before the write transaction starts
+            upper = bind.execute(sa.select(ids).where(ids > last_id, ids <= end_id).order_by(ids)
+                                 .offset(batch_size - 1).limit(1)).scalar() or end_id
+            with bind.engine.begin() as conn:
+                count = conn.execute(table.update().where(ids > last_id, ids <= upper, *where).values(values)).rowcount
+                conn.execute(_CHECKPOINTS.update().where(_CHECKPOINTS.c.name == name).values(
+                    last_id=upper, rows_done=_CHECKPOINTS.c.rows_done + count, updated=datetime.now()))
+            last_id, updated, rows_done = upper, updated + count, rows_done + count
+            print(f"  {name}: {rows_done} rows updated, up to id {last_id} of {end_id}")
+            if pause and last_id < end_id:
+                time.sleep(pause)
+        with bind.engine.begin() as conn:
+            conn.execute(_CHECKPOINTS.update().where(_CHECKPOINTS.c.name == name).values(
+                done=True, updated=datetime.now()))
+    return updated
+
+def _needs_rebuild(inspector, table_name, scales, to_fixed_point):
+    types = {column['name']: column['type'] for column in inspector.get_columns(table_name)}
+    return any(isinstance(types[name], sa.Integer) != to_fixed_point for name in scales if name in types)
+
+def rebuild_fixed_point_table(engine, table, scales, batch_size=DEFAULT_BATCH_SIZE, to_fixed_point=True):
+    """Rebuild a SQLite ``table`` with fixed-point columns and copy its rows in batches.
+
+    SQLite keeps a column's declared type for the life of the table, so
+    the table is renamed to <table>_float, recreated with INTEGER columns
+    and copied over one transaction per batch; new rows go to the new
+    table meanwhile. Re-running after an interruption resumes the copy.
+
+    Args:
+        table: sa.Table as of the revision, with the new column types
+        scales: {column: scale} of the fixed-point columns
+        to_fixed_point: False converts them back to floats (renaming the
+            table to <table>_fixed meanwhile), for a downgrade
+
+    Returns:
+        int: Rows copied
+    """
+    old = f"{table.name}_{'float' if to_fixed_point else 'fixed'}"
+    inspector = inspect(engine)
+    names = inspector.get_table_names()
+    if old not in names:
+        if table.name not in names or not _needs_rebuild(inspector, table.name, scales, to_fixed_point):
+            return 0
+        print(f"Renaming {table.name} to {old}...")
+        # Index names would clash with the new table's
+        indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old}')
+            for index in indexes:
+                conn.exec_driver_sql(f'DROP INDEX {index}')
+    table.create(engine, checkfirst=True)
+
+    old_columns = {column['name'] for column in inspect(engine).get_columns(old)}
+    columns = [column for column in table.columns if column.name in old_columns]
+    select_list = ', '.join(
+        column.name if column.name not in scales
+        else f'CAST(ROUND({column.name} * {scales[column.name]}) AS INTEGER)' if to_fixed_point
+        else f'{column.name} * 1.0 / {scales[column.name]}'
+        for column in columns
+    )
+    copy = sa.text(
+        f"INSERT INTO {table.name} ({', '.join(column.name for column in columns)}) "
+        f"SELECT {select_list} FROM {old} WHERE id > :last ORDER BY id LIMIT :limit"
+    )
+
+    copied = 0
+    with engine.begin() as conn:
+        # Keep the shard's id range (utils.shards) for new rows, so they
+        # get ids above every copied one
+        conn.execute(sa.text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT :name, seq FROM sqlite_sequence "
+            "WHERE name = :old AND NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+        ), {'name': table.name, 'old': old})
+        old_max = conn.exec_driver_sql(f'SELECT COALESCE(MAX(id), 0) FROM {old}').scalar()
+    while True:
+        with engine.begin() as conn:
+            last = conn.execute(sa.select(sa.func.coalesce(sa.func.max(table.c.id), 0))
+                                .where(table.c.id <= old_max)).scalar()
+            rows = conn.execute(copy, {'last': last, 'limit': batch_size}).rowcount
+        if not rows:
+            break
+        copied += rows
+        print(f"  {table.name}: {copied} rows copied")
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE {old}')
+    return copied
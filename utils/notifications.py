@@ -0,0 +1,372 @@
+"""
+Email notifications for critical alerts.
+
+Configured through environment variables:
+    SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD: Mail server settings
+    SENDER_EMAIL: From address
+    ATTENDER_EMAIL: Comma-separated recipients for critical alerts
+    ESCALATION_EMAIL: Comma-separated recipients for critical alerts that
+        stay unacknowledged (see utils.escalation)
+    NOTIFY_COALESCE_SECONDS: How long alerts for the same recipients are
+        collected into one digest (default 5, 0 on Vercel)
+    NOTIFY_RATE_PER_MINUTE: Emails per recipient per minute (default 6)
+    SMTP_POOL_SIZE: Persistent SMTP connections kept open (default 2)
+
+If SMTP_SERVER or the recipients are not set, notifications are skipped.
+
+Alerts are not sent one email each. They are queued on a dispatcher that
+merges everything for the same recipients within the coalescing window into
+one digest, grouped by patient, and sends it over a pooled connection. A
+recipient over their rate limit keeps collecting alerts until the next
+digest is allowed, so alerts are delayed but never dropped.
+"""
+
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from email.message import EmailMessage
+
+from utils.flight_recorder import span
+from utils.metrics import NOTIFICATION_EMAILS, NOTIFICATIONS, SMTP_CONNECTIONS
+from utils.vitals import VITALS
+
+logger = logging.getLogger(__name__)
+
+# Format: {vital_type: (label, unit)}
+VITAL_LABELS = {vital.name: (vital.text_label, vital.unit) for vital in VITALS}
+
+# Attempts to send a digest before its alerts are given up on
+MAX_SEND_ATTEMPTS = 3
+
+# Seconds an idle pooled connection is trusted without a NOOP check
+POOL_CHECK_AFTER = 30
+
+# What a notification needs from the alert and patient, captured when it
+# is queued so the dispatcher never touches ORM objects from another thread
+Notice = namedtuple('Notice', 'alert_id patient_id patient_name room vital_type value threshold '
+                              'timestamp escalation_level')
+
+def smtp_settings():
+    """Read the SMTP configuration from the environment."""
+    return {
+        'server': os.environ.get('SMTP_SERVER'),
+        'port': int(os.environ.get('SMTP_PORT', 587)),
+        'username': os.environ.get('SMTP_USERNAME'),
+        'password': os.environ.get('SMTP_PASSWORD'),
+        'sender': os.environ.get('SENDER_EMAIL', 'hospital@example.com'),
+    }
+
+def recipients_from_env(name):
+    """Return the comma-separated addresses in environment variable ``name``."""
+    return [r.strip() for r in os.environ.get(name, '').split(',') if r.strip()]
+
+def alert_notice(patient, alert, escalation_level=0):
+    """Capture what a notification needs from an alert and its patient."""
+    return Notice(alert.id, patient.id, patient.name, patient.room, alert.vital_type,
+                  alert.value, alert.threshold, alert.timestamp, escalation_level)
+
+def _notice_line(notice):
+    label, unit = VITAL_LABELS.get(notice.vital_type, (notice.vital_type, ''))
+    escalated = f" [ESCALATED, level {notice.escalation_level}]" if notice.escalation_level else ""
+    return (f"{label}: {notice.value} {unit} (threshold {notice.threshold}) "
+            f"at {notice.timestamp:%Y-%m-%d %H:%M:%S}{escalated}")
+
+def build_digest(notices, sender, recipients):
+    """Build one email for critical alerts, grouped by patient."""
+    patients = {}
+    for notice in notices:
+        patients.setdefault(notice.patient_id, []).append(notice)
+
+    prefix = "ESCALATED (unacknowledged) " if any(n.escalation_level for n in notices) else ""
+    first = notices[0]
+    if len(notices) == 1:
+        label, _ = VITAL_LABELS.get(first.vital_type, (first.vital_type, ''))
+        subject = f"{prefix}CRITICAL: {label} alert for {first.patient_name} (Room {first.room})"
+    elif len(patients) == 1:
+        subject = f"{prefix}CRITICAL: {len(notices)} alerts for {first.patient_name} (Room {first.room})"
+    else:
+        subject = f"{prefix}CRITICAL: {len(notices)} alerts for {len(patients)} patients"
+
+    lines = []
+    for patient_notices in patients.values():
+        lines.append(f"Patient: {patient_notices[0].patient_name} (Room {patient_notices[0].room})")
+        lines.extend(f"  {_notice_line(notice)}" for notice in patient_notices)
+        lines.append("")
+
+    message = EmailMessage()
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = ', '.join(recipients)
+    message.set_content('\n'.join(lines))
+    return message
+
+class SMTPPool:
+    """Persistent SMTP connections, reused across sends.
+
+    Args:
+        settings: Dict from smtp_settings()
+        size: Maximum connections open at once
+    """
+
+    def __init__(self, settings, size=2):
+        self.settings = settings
+        self._idle = []  # Format: [(smtp, last_used)]
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        settings = self.settings
+        smtp = smtplib.SMTP(settings['server'], settings['port'], timeout=10)
+        if settings['username']:
+            smtp.starttls()
+            smtp.login(settings['username'], settings['password'])
+        SMTP_CONNECTIONS.inc()
+        return smtp
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, last_used = self._idle.pop()
+            if time.monotonic() - last_used < POOL_CHECK_AFTER:
+                return smtp
+            try:
+                # The server may have dropped an idle connection
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(smtp)
+        return self._connect()
+
+    def _discard(self, smtp):
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, returning it to the pool unless it failed."""
+        with self._slots:
+            smtp = self._checkout()
+            try:
+                yield smtp
+            except BaseException:
+                self._discard(smtp)
+                raise
+            with self._lock:
+                self._idle.append((smtp, time.monotonic()))
+
+    def send(self, message):
+        """Send a message, reconnecting once if a pooled connection went stale."""
+        try:
+            with self.connection() as smtp:
+                smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            with self.connection() as smtp:
+                smtp.send_message(message)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            try:
+                smtp.quit()
+            except Exception:
+                self._discard(smtp)
+
+class RateLimiter:
+    """Token bucket per recipient.
+
+    Args:
+        per_minute: Emails each recipient may receive per minute, with
+            bursts of up to this many
+    """
+
+    def __init__(self, per_minute=6):
+        self.per_minute = per_minute
+        self._buckets = {}  # Format: {recipient: (tokens, updated)}
+
+    def _tokens(self, recipient, now):
+        tokens, updated = self._buckets.get(recipient, (self.per_minute, now))
+        return min(self.per_minute, tokens + (now - updated) * self.per_minute / 60.0)
+
+    def wait_time(self, recipients, now):
+        """Seconds until every recipient has a token (0 if they all do now)."""
+        missing = max((1 - self._tokens(r, now) for r in recipients), default=0)
+        return max(0.0, missing * 60.0 / self.per_minute)
+
+    def take(self, recipients, now):
+        for recipient in recipients:
+            self._buckets[recipient] = (self._tokens(recipient, now) - 1, now)
+
+class NotificationDispatcher:
+    """Coalesces queued notices into rate-limited digests sent over a pool.
+
+    Args:
+        settings: Dict from smtp_settings()
+        window: Seconds to collect notices for the same recipients before
+            sending (0 sends from the submitting thread straight away)
+        rate_per_minute: Emails per recipient per minute
+        pool_size: Persistent SMTP connections
+        send: Callable taking an EmailMessage (defaults to the pool)
+    """
+
+    def __init__(self, settings, window=5.0, rate_per_minute=6, pool_size=2, send=None):
+        self.settings = settings
+        self.window = window
+        self.pool = SMTPPool(settings, pool_size)
+        self.send = send or self.pool.send
+        self.limiter = RateLimiter(rate_per_minute)
+        self._pending = {}  # Format: {recipients: [notices, due, attempts]}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, notices, recipients):
+        """Queue notices for the recipients.
+
+        Returns:
+            bool: False if notifications are not configured for them
+        """
+        recipients = tuple(sorted(recipients))
+        if not self.settings['server'] or not recipients:
+            NOTIFICATIONS.inc(len(notices), result='skipped')
+            return False
+        with self._cond:
+            entry = self._pending.get(recipients)
+            if entry is None:
+                self._pending[recipients] = [list(notices), time.monotonic() + self.window, 0]
+            else:
+                entry[0].extend(notices)
+            self._cond.notify()
+        if not self.window:
+            self.flush()
+        # The timer thread sends digests held back by the window, rate
+        # limits or retries
+        if self.window or self._pending:
+            self._start()
+        return True
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+                self._thread.start()
+
+    def flush(self, now=None, force=False):
+        """Send every digest that is due and allowed by the rate limits.
+
+        Args:
+            force: Send all pending digests regardless of window and limits
+
+        Returns:
+            int: Number of emails sent
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self._cond:
+            for recipients, entry in list(self._pending.items()):
+                if not force:
+                    if entry[1] > now:
+                        continue
+                    wait = self.limiter.wait_time(recipients, now)
+                    if wait:
+                        # Over the limit: keep collecting until a token frees up
+                        entry[1] = now + wait
+                        NOTIFICATION_EMAILS.inc(result='rate_limited')
+                        continue
+                self.limiter.take(recipients, now)
+                ready.append((recipients, self._pending.pop(recipients)))
+
+        sent = 0
+        for recipients, (notices, _, attempts) in ready:
+            message = build_digest(notices, self.settings['sender'], recipients)
+            try:
+                with span('send_notification_digest'):
+                    self.send(message)
+            except Exception:
+                logger.exception("Failed to send notification digest of %d alerts", len(notices))
+                NOTIFICATION_EMAILS.inc(result='failed')
+                if attempts + 1 < MAX_SEND_ATTEMPTS:
+                    self._retry(recipients, notices, attempts + 1, now)
+                else:
+                    NOTIFICATIONS.inc(len(notices), result='failed')
+                continue
+            NOTIFICATION_EMAILS.inc(result='sent')
+            NOTIFICATIONS.inc(len(notices), result='sent')
+            sent += 1
+        return sent
+
+    def _retry(self, recipients, notices, attempts, now):
+        with self._cond:
+            entry = self._pending.setdefault(recipients, [[], now, attempts])
+            entry[0][:0] = notices
+            entry[1] = max(entry[1], now + 5 * 2 ** attempts)
+            entry[2] = attempts
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    due = min((entry[1] for entry in self._pending.values()), default=None)
+                    now = time.monotonic()
+                    if due is not None and due <= now:
+                        break
+                    self._cond.wait(None if due is None else due - now)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Notification flush failed")
+                time.sleep(1)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def notifier():
+    """Return the process-wide dispatcher, configured from the environment."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            default_window = '0' if os.environ.get('VERCEL') else '5'
+            _dispatcher = NotificationDispatcher(
+                smtp_settings(),
+                window=float(os.environ.get('NOTIFY_COALESCE_SECONDS', default_window)),
+                rate_per_minute=float(os.environ.get('NOTIFY_RATE_PER_MINUTE', 6)),
+                pool_size=int(os.environ.get('SMTP_POOL_SIZE', 2)),
+            )
+        return _dispatcher
+
+def send_critical_alert_notification(patient, alerts):
+    """Queue a notification to the attenders about critical alerts.
+
+    Args:
+        alerts: Critical alerts for ``patient``, typically from one reading
+
+    Returns:
+        bool: False if notifications are not configured
+    """
+    notices = [alert_notice(patient, alert) for alert in alerts]
+    with span('send_critical_alert_notification'):
+        return notifier().submit(notices, recipients_from_env('ATTENDER_EMAIL'))
+
+def send_escalation_notification(patient, alert, level, recipients_var):
+    """Queue a notification to an escalation tier about an unacknowledged alert.
+
+    Args:
+        level: Escalation tier, starting at 1
+        recipients_var: Environment variable with the tier's recipients
+
+    Returns:
+        bool: False if the tier has no recipients or SMTP is not configured
+    """
+    notice = alert_notice(patient, alert, escalation_level=level)
+    with span('send_escalation_notification'):
+        return notifier().submit([notice], recipients_from_env(recipients_var))
@@ -0,0 +1,65 @@
+"""
+Read-only patient rows for rendering pages.
+
+The patient table, dashboard and patient cards only read each patient's
+name, room, latest vitals and alert flags. Loading full Patient objects
+for that means identity-map bookkeeping, change tracking and a
+PatientStatus object per patient. Instead, the rendered columns are
+selected in one outer join into slotted named tuples. The query does not
+autoflush and leaves nothing in the session.
+
+Usage:
+    from utils.patient_rows import patient_row, patient_rows
+    rows = patient_rows()
+    row = patient_row(patient_id)
+"""
+
+from collections import namedtuple
+
+from db import db
+from models import Patient, PatientStatus
+from utils.shards import each_shard, shard_for_patient, shard_keys, use_shard
+from utils.vitals import VITALS
+
+_FIELDS = ('id', 'name', 'room', *(vital.name for vital in VITALS), 'vitals_updated',
+           *(vital.flag for vital in VITALS))
+
+class PatientRow(namedtuple('PatientRow', _FIELDS)):
+    """A patient's rendered columns, with the same attribute names as Patient."""
+
+    __slots__ = ()
+
+    @property
+    def has_alert(self):
+        """Return True if any vital sign has an alert."""
+        return any(getattr(self, vital.flag) for vital in VITALS)
+
+    # The dashboard counts patients at risk: those with an alert flag set
+    current_risk = has_alert
+
+_COLUMNS = (
+    Patient.id, Patient.name, Patient.room,
+    *(getattr(PatientStatus, vital.name) for vital in VITALS), PatientStatus.vitals_updated,
+    *(db.func.coalesce(getattr(PatientStatus, vital.flag), db.false()) for vital in VITALS),
+)
+
+def _select():
+    return db.select(*_COLUMNS).outerjoin(PatientStatus, PatientStatus.patient_id == Patient.id)
+
+def patient_rows(patient_ids=None):
+    """Return PatientRow tuples for all patients (or ``patient_ids``), by id, from every shard."""
+    query = _select().order_by(Patient.id)
+    if patient_ids is not None:
+        query = query.where(Patient.id.in_(list(patient_ids)))
+    rows = []
+    with db.session.no_autoflush:
+        for _ in each_shard():
+            rows.extend(PatientRow(*row) for row in db.session.execute(query))
+    # Each shard's rows are sorted; merge them by id
+    return sorted(rows) if len(shard_keys()) > 1 else rows
+
+def patient_row(patient_id):
+    """Return one patient's PatientRow, or None if there is no such patient."""
+    with db.session.no_autoflush, use_shard(shard_for_patient(patient_id)):
+        row = db.session.execute(_select().where(Patient.id == patient_id)).first()
+    return PatientRow(*row) if row is not None else None
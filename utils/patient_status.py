@@ -0,0 +1,124 @@
+"""
+Writes to the patient_status table: each patient's latest vitals and alert flags.
+
+Readings only touch this narrow table, with one upsert per batch, so the
+patient row (name, room) is never rewritten by the vitals writers and
+admin edits to it don't wait on them. Acknowledging an alert clears a
+single flag column.
+
+Upserts use INSERT ... ON CONFLICT on SQLite and PostgreSQL, and an
+UPDATE followed by an INSERT elsewhere. A reading older than the stored
+one is ignored, and a vital sign missing from a reading keeps its
+previous value and flag.
+
+Usage:
+    from utils.patient_status import status_row, upsert_status, clear_alert_flags
+    upsert_status([status_row(patient_id, timestamp, {'heart_rate': 72, 'spo2': 91.0}, {'spo2'})])
+    clear_alert_flags([patient_id], 'spo2')
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db import db
+from models import PatientStatus
+from utils.alerting import VITAL_TYPES
+
+def status_row(patient_id, timestamp, vitals, alert_types=()):
+    """Build a patient_status row for a reading.
+
+    Args:
+        vitals: {vital_type: value} of registered vital signs (utils.vitals);
+            missing ones are None
+        alert_types: Vital types the reading raised alerts for
+
+    Returns:
+        dict: Row for upsert_status
+    """
+    row = {'patient_id': patient_id, 'vitals_updated': timestamp}
+    for vital_type in VITAL_TYPES:
+        row[vital_type] = vitals.get(vital_type)
+        row[f'{vital_type}_alert'] = vital_type in alert_types
+    return row
+
+def latest_rows(rows):
+    """Merge rows per patient, in timestamp order, into one row each."""
+    merged = {}  # Format: {patient_id: row}
+    for row in sorted(rows, key=lambda row: row['vitals_updated']):
+        current = merged.get(row['patient_id'])
+        if current is None:
+            merged[row['patient_id']] = dict(row)
+            continue
+        current['vitals_updated'] = row['vitals_updated']
+        for vital_type in VITAL_TYPES:
+            if row[vital_type] is not None:
+                current[vital_type] = row[vital_type]
+                current[f'{vital_type}_alert'] = row[f'{vital_type}_alert']
+    return list(merged.values())
+
+def upsert_status(rows, conn=None):
+    """Insert or update patient_status rows built with status_row.
+
+    Args:
+        rows: Rows to write; several rows for a patient are merged first
+        conn: Connection to write with (default: the db session)
+
+    Returns:
+        int: Number of patients written
+    """
+    rows = latest_rows(rows)
+    if not rows:
+        return 0
+    executor = db.session if conn is None else conn
+    bind = db.session.get_bind() if conn is None else conn
+    table = PatientStatus.__table__
+
+    if bind.dialect.name in ('sqlite', 'postgresql'):
+        dialect = sqlite if bind.dialect.name == 'sqlite' else postgresql
+        insert = dialect.insert(table)
+        excluded = insert.excluded
+        values = {'vitals_updated': excluded.vitals_updated}
+        for vital_type in VITAL_TYPES:
+            flag = f'{vital_type}_alert'
+            values[vital_type] = sa.func.coalesce(excluded[vital_type], table.c[vital_type])
+            values[flag] = sa.case((excluded[vital_type].is_(None), table.c[flag]), else_=excluded[flag])
+        executor.execute(insert.on_conflict_do_update(
+            index_elements=[table.c.patient_id],
+            set_=values,
+            where=sa.or_(table.c.vitals_updated.is_(None),
+                         table.c.vitals_updated <= excluded.vitals_updated),
+        ), rows)
+        return len(rows)
+
+    # Generic fallback: update existing rows, then insert the rest
+    existing = set(executor.execute(
+        sa.select(table.c.patient_id).where(table.c.patient_id.in_([row['patient_id'] for row in rows]))
+    ).scalars())
+    new_rows = [row for row in rows if row['patient_id'] not in existing]
+    for row in rows:
+        if row['patient_id'] not in existing:
+            continue
+        values = {'vitals_updated': row['vitals_updated']}
+        for vital_type in VITAL_TYPES:
+            if row[vital_type] is not None:
+                values[vital_type] = row[vital_type]
+                values[f'{vital_type}_alert'] = row[f'{vital_type}_alert']
+        executor.execute(table.update().where(
+            table.c.patient_id == row['patient_id'],
+            sa.or_(table.c.vitals_updated.is_(None), table.c.vitals_updated <= row['vitals_updated']),
+        ).values(values))
+    if new_rows:
+        executor.execute(table.insert(), new_rows)
+    return len(rows)
+
+def clear_alert_flags(patient_ids, vital_type):
+    """Clear one alert flag for the given patients, in the db session.
+
+    Unknown vital types are ignored.
+    """
+    if vital_type not in VITAL_TYPES or not patient_ids:
+        return
+    table = PatientStatus.__table__
+    db.session.execute(table.update()
+                       .where(table.c.patient_id.in_(list(patient_ids)))
+                       .values({f'{vital_type}_alert': False}))
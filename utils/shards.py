@@ -0,0 +1,211 @@
+"""
+Ward-based sharding of patient data across several databases.
+
+With one SQLite file, every ward's ingest, polling and acknowledgements
+serialize on its write lock. Setting SHARD_DATABASE_URLS adds one
+database per shard next to the default one (shard 0). Each shard holds
+the full schema for its own patients: patient, patient_status,
+vital_sign, alert and patient_trend rows. Users stay in the default
+database; bulk import checkpoints are kept in each shard next to the rows
+they cover.
+
+Routing needs no directory lookups:
+- A patient lives in shard ``patient_id % shard count``. New patients
+  get the next free id that falls in their ward's shard (create_patient).
+- Wards map to shards through SHARD_WARDS (e.g. "W01=1,W02=2"); other
+  wards are hashed.
+- Alert and vital sign ids from shard k start at k << SHARD_ID_BITS, so
+  ids are unique across shards and an alert id names its shard.
+
+Inside ``use_shard(key)`` every statement of the db session goes to
+that shard (see db.ShardSession). Writes must be flushed and committed
+inside the block. Hospital-wide reads loop over ``each_shard()`` and
+merge the results. Without SHARD_DATABASE_URLS there is a single shard
+and all of this is a no-op.
+
+Bulk Core writers and readers (import_vitals.py, generate_dataset.py,
+exports) take ``shard_engines()`` and split their rows with
+``group_by_engine``.
+
+Usage:
+    from utils.shards import configure_shards
+    configure_shards(app)  # before db.init_app(app)
+
+    with use_shard(shard_for_patient(patient_id)):
+        ...
+        db.session.commit()
+"""
+
+import os
+import zlib
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from db import current_shard, db
+from models import Alert, Patient, VitalSign
+
+# Ids of shard k start at k << SHARD_ID_BITS (about 10^12 ids per shard)
+SHARD_ID_BITS = 40
+
+# Tables whose ids must be unique across shards
+SHARDED_ID_TABLES = (Alert.__table__, VitalSign.__table__)
+
+class ShardRouter:
+    """Maps patients, wards and alert ids to shard bind keys.
+
+    Args:
+        keys: Bind keys of the shards in order; None is the default database
+        wards: Optional {ward: shard index}
+    """
+
+    def __init__(self, keys=(None,), wards=None):
+        self.keys = list(keys)
+        self.wards = dict(wards or {})
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, key):
+        return self.keys.index(key)
+
+    def for_patient(self, patient_id):
+        return self.keys[patient_id % len(self.keys)]
+
+    def for_id(self, row_id):
+        """Shard of an alert or vital sign id."""
+        return self.keys[min(row_id >> SHARD_ID_BITS, len(self.keys) - 1)]
+
+    def for_ward(self, ward):
+        index = self.wards.get(ward)
+        if index is None:
+            index = zlib.crc32(ward.encode()) % len(self.keys)
+        return self.keys[index]
+
+_SINGLE = ShardRouter()
+
+def parse_wards(value):
+    """Parse "W01=1,W02=2" into {'W01': 1, 'W02': 2}."""
+    wards = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        ward, _, index = item.partition('=')
+        wards[ward.strip()] = int(index)
+    return wards
+
+def configure_shards(app):
+    """Add the shard databases to the app config and register the router.
+
+    Call before db.init_app(app).
+
+    Config (or environment):
+        SHARD_DATABASE_URLS: Comma-separated URLs of shards 1..n
+        SHARD_WARDS: Ward to shard index, e.g. "W01=1,W02=2"
+    """
+    urls = app.config.get('SHARD_DATABASE_URLS', os.environ.get('SHARD_DATABASE_URLS', ''))
+    if isinstance(urls, str):
+        urls = [url.strip() for url in urls.split(',') if url.strip()]
+    binds = {f'shard{i}': url for i, url in enumerate(urls, start=1)}
+    app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), **binds}
+
+    wards = app.config.get('SHARD_WARDS', os.environ.get('SHARD_WARDS', ''))
+    if isinstance(wards, str):
+        wards = parse_wards(wards)
+    router = ShardRouter([None, *binds], wards)
+    app.extensions['shards'] = router
+    return router
+
+def shard_router():
+    """Return the current app's router (a single shard if not configured)."""
+    if not has_app_context():
+        return _SINGLE
+    return current_app.extensions.get('shards', _SINGLE)
+
+def shard_keys():
+    return shard_router().keys
+
+def shard_for_patient(patient_id):
+    return shard_router().for_patient(patient_id)
+
+def shard_for_alert(alert_id):
+    return shard_router().for_id(alert_id)
+
+def ward_of(room):
+    """Return the ward of a room: the part before '-' (W03-12 -> W03), else the floor (204 -> 2)."""
+    room = (room or '').strip()
+    if '-' in room:
+        return room.split('-', 1)[0]
+    return room[:-2] or room
+
+@contextmanager
+def use_shard(key):
+    """Route the db session to shard ``key`` inside the block."""
+    token = current_shard.set(key)
+    try:
+        yield key
+    finally:
+        current_shard.reset(token)
+
+def each_shard():
+    """Yield each shard's key with the session routed to it."""
+    for key in shard_keys():
+        with use_shard(key):
+            yield key
+
+def group_by_shard(items, patient_id=lambda item: item['patient_id']):
+    """Split items into {shard key: [items]} by patient, keeping their order."""
+    router = shard_router()
+    groups = {}
+    for item in items:
+        groups.setdefault(router.for_patient(patient_id(item)), []).append(item)
+    return groups
+
+def shard_engines():
+    """Return {shard key: engine} for every shard, in shard order."""
+    return {key: db.engines[key] for key in shard_keys()}
+
+def group_by_engine(engines, items, patient_id=lambda item: item['patient_id']):
+    """Split items into {engine: [items]} by their patient's shard, keeping their order.
+
+    Args:
+        engines: shard_engines(), or a single Engine that gets every item
+    """
+    if not isinstance(engines, dict):
+        items = list(items)
+        return {engines: items} if items else {}
+    return {engines[key]: group for key, group in group_by_shard(items, patient_id).items()}
+
+def create_patient(name, room, **kwargs):
+    """Add a patient to its ward's shard and flush it there.
+
+    The id is the next free one that routes to that shard. The caller
+    commits (still routed to the returned shard).
+
+    Returns:
+        tuple: (patient, shard key)
+    """
+    router = shard_router()
+    key = router.for_ward(ward_of(room))
+    with use_shard(key):
+        next_id = (db.session.execute(sa.select(sa.func.max(Patient.id))).scalar() or 0) + 1
+        next_id += (router.index(key) - next_id) % len(router)
+        patient = Patient(id=next_id, name=name, room=room, **kwargs)
+        db.session.add(patient)
+        db.session.flush()
+    return patient, key
+
+def create_shard_tables():
+    """Create the schema in every shard and start each shard's ids in its own range."""
+    router = shard_router()
+    for key in router.keys:
+        engine = db.engines[key]
+        db.metadata.create_all(engine)
+        start = router.index(key) << SHARD_ID_BITS
+        if not start or engine.dialect.name != 'sqlite':
+            continue
+        with engine.begin() as conn:
+            for table in SHARDED_ID_TABLES:
+                conn.execute(sa.text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+                ), {'name': table.name, 'seq': start})
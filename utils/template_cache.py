@@ -0,0 +1,84 @@
+"""
+Template loading helpers for the serverless deployment.
+
+A cold start on Vercel pays for parsing and compiling every Jinja template the
+first time it is rendered. These helpers let ``api/index.py`` load templates
+that were compiled ahead of time by ``precompile_templates.py`` and shipped in
+the bundle, falling back to the source templates with a bytecode cache.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, ModuleLoader
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(ROOT_DIR, 'templates')
+COMPILED_DIR = os.path.join(ROOT_DIR, 'compiled_templates')
+FINGERPRINT_FILE = 'templates.sha1'
+
+def templates_fingerprint(template_dir=TEMPLATE_DIR):
+    """Return a SHA-1 hex digest over the names and contents of all templates."""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(template_dir)):
+        path = os.path.join(template_dir, name)
+        if not os.path.isfile(path):
+            continue
+        digest.update(name.encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def compile_app_templates(app, target=COMPILED_DIR, template_dir=TEMPLATE_DIR):
+    """Compile all of the app's templates into Python modules under ``target``.
+
+    The app's own environment is used so custom filters such as ``datetime``
+    are known to the compiler. A fingerprint of the sources is written next
+    to the modules so stale builds are ignored at load time.
+
+    Returns:
+        int: Number of templates compiled
+    """
+    # Compile from the source loader even if the app is already configured
+    # to load precompiled modules (ModuleLoader cannot list templates).
+    env = app.jinja_env.overlay(loader=app.create_global_jinja_loader())
+    names = env.list_templates()
+    os.makedirs(target, exist_ok=True)
+    env.compile_templates(target, zip=None, ignore_errors=False)
+    with open(os.path.join(target, FINGERPRINT_FILE), 'w') as f:
+        f.write(templates_fingerprint(template_dir))
+    return len(names)
+
+def compiled_templates_current(compiled_dir=COMPILED_DIR, template_dir=TEMPLATE_DIR):
+    """Return True if ``compiled_dir`` holds a build of the current templates."""
+    try:
+        with open(os.path.join(compiled_dir, FINGERPRINT_FILE)) as f:
+            fingerprint = f.read().strip()
+    except OSError:
+        return False
+    return fingerprint == templates_fingerprint(template_dir)
+
+def configure_template_cache(app, compiled_dir=COMPILED_DIR, cache_dir=None):
+    """Set up precompiled templates and a bytecode cache for ``app``.
+
+    Precompiled modules are tried first; any template missing from them (or
+    all of them, when the build is stale) is loaded from source and its
+    bytecode cached on disk, so warm instances sharing /tmp skip the compile.
+
+    Returns:
+        bool: True if precompiled templates are in use
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'jinja-bytecode-cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if not compiled_templates_current(compiled_dir):
+        return False
+
+    app.jinja_env.loader = ChoiceLoader([
+        ModuleLoader(compiled_dir),
+        app.jinja_env.loader,
+    ])
+    return True
@@ -0,0 +1,247 @@
+"""
+Per-ward and per-patient alert thresholds.
+
+A threshold profile overrides some of the default thresholds
+(utils.alerting.THRESHOLDS) for a ward or for one patient, e.g. an SpO₂
+floor of 88 for a COPD patient or paediatric heart-rate bands for a
+ward. A patient's profile applies on top of their ward's, which applies
+on top of the defaults. The ward is taken from the room (utils.shards.ward_of).
+
+Profiles are compiled into ThresholdEvaluator objects, one per distinct
+set of thresholds, and cached per patient, so ingest classifies readings
+without reading profiles. Each process rereads the (small) profile table
+every THRESHOLD_REFRESH_SECONDS (default 30) and recompiles when it has
+changed, so changes made by other workers or manage_thresholds.py take
+effect without a restart. Changes made with set_profile and
+delete_profile apply in the current process at once. Patients' rooms
+are looked up once per refresh, one query per ingest batch.
+
+Usage:
+    from utils.threshold_profiles import init_threshold_profiles, evaluator_for, set_profile
+    init_threshold_profiles(app)
+    set_profile('COPD', {'spo2': {'warning': {'min': 88}, 'critical': {'min': 85}}}, patient_id=3)
+    evaluator_for(3).classify({'spo2': 89.0})
+"""
+
+import copy
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context
+
+from db import db
+from models import Patient, ThresholdProfile
+from utils.alerting import DEFAULT_EVALUATOR, THRESHOLDS, ThresholdEvaluator
+from utils.shards import each_shard, group_by_shard, shard_for_patient, shard_router, use_shard, ward_of
+
+SEVERITY_LEVELS = ('warning', 'critical')
+LIMITS = ('min', 'max')
+
+def parse_overrides(data):
+    """Validate threshold overrides and return them with float limits.
+
+    Args:
+        data: {vital_type: {severity: {'min': ..., 'max': ...}}}, any part
+            of which may be left out
+
+    Raises:
+        ValueError: For unknown vital types, severities or limits, or a
+            min above its max once merged with the defaults
+    """
+    overrides = {}
+    for vital_type, levels in data.items():
+        if vital_type not in THRESHOLDS:
+            raise ValueError(f"Unknown vital type: {vital_type}")
+        for severity, limits in levels.items():
+            if severity not in SEVERITY_LEVELS:
+                raise ValueError(f"Unknown severity: {severity}")
+            for limit, value in limits.items():
+                if limit not in LIMITS:
+                    raise ValueError(f"Unknown limit: {limit} (expected min or max)")
+                overrides.setdefault(vital_type, {}).setdefault(severity, {})[limit] = float(value)
+    for vital_type, levels in merge_thresholds(overrides).items():
+        for severity, limits in levels.items():
+            if limits['min'] > limits['max']:
+                raise ValueError(f"{vital_type} {severity}: min {limits['min']:g} is above max {limits['max']:g}")
+    return overrides
+
+def merge_thresholds(*overrides):
+    """Return the default thresholds with each set of overrides applied in turn."""
+    thresholds = copy.deepcopy(THRESHOLDS)
+    for layer in overrides:
+        for vital_type, levels in (layer or {}).items():
+            for severity, limits in levels.items():
+                thresholds[vital_type][severity].update(limits)
+    return thresholds
+
+class ThresholdProfiles:
+    """Compiled threshold evaluators per patient, reloaded when profiles change.
+
+    Args:
+        refresh_seconds: Reread the profile table when older than this
+            (0 never rereads once loaded)
+    """
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._profiles = {}  # Format: {('ward', ward) or ('patient', id): overrides}
+        self._signature = None
+        self._wards = {}  # Format: {patient_id: ward}
+        self._evaluators = {}  # Format: {patient_id: ThresholdEvaluator}
+        self._compiled = {}  # Format: {(ward overrides JSON, patient overrides JSON): ThresholdEvaluator}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def load(self):
+        """Reread profiles from every shard; recompile if they changed."""
+        rows = []
+        for _ in each_shard():
+            rows.extend(db.session.execute(
+                db.select(ThresholdProfile.id, ThresholdProfile.ward, ThresholdProfile.patient_id,
+                          ThresholdProfile.overrides, ThresholdProfile.updated)
+            ).all())
+        signature = sorted((row.ward or '', row.patient_id or 0, row.id, row.updated) for row in rows)
+        with self._lock:
+            if signature != self._signature:
+                self._profiles = {('ward', row.ward) if row.ward else ('patient', row.patient_id): json.loads(row.overrides)
+                                  for row in rows}
+                self._signature = signature
+                self._compiled = {}
+            # Rooms may have changed too
+            self._wards = {}
+            self._evaluators = {}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Force a reread on next use, e.g. after changing a profile."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or (self.refresh_seconds and
+                                 time.monotonic() - loaded_at > self.refresh_seconds):
+            self.load()
+
+    def prepare(self, patient_ids):
+        """Look up the wards of patients not seen since the last refresh, one query per shard."""
+        self._ensure_loaded()
+        if not self._profiles:
+            return
+        missing = set(patient_ids) - self._wards.keys()
+        for key, ids in group_by_shard(missing, lambda patient_id: patient_id).items():
+            with use_shard(key):
+                rows = db.session.execute(db.select(Patient.id, Patient.room).where(Patient.id.in_(ids))).all()
+            with self._lock:
+                self._wards.update((patient_id, None) for patient_id in ids)
+                self._wards.update((row.id, ward_of(row.room)) for row in rows)
+
+    def evaluator(self, patient_id):
+        """Return the ThresholdEvaluator for a patient's readings."""
+        self._ensure_loaded()
+        if not self._profiles:
+            return DEFAULT_EVALUATOR
+        evaluator = self._evaluators.get(patient_id)
+        if evaluator is not None:
+            return evaluator
+        if patient_id not in self._wards:
+            self.prepare([patient_id])
+        with self._lock:
+            layers = (self._profiles.get(('ward', self._wards.get(patient_id))),
+                      self._profiles.get(('patient', patient_id)))
+            key = tuple(json.dumps(layer, sort_keys=True) if layer else None for layer in layers)
+            evaluator = self._compiled.get(key)
+            if evaluator is None:
+                evaluator = DEFAULT_EVALUATOR if key == (None, None) else ThresholdEvaluator(merge_thresholds(*layers))
+                self._compiled[key] = evaluator
+            self._evaluators[patient_id] = evaluator
+            return evaluator
+
+    def classify_batch(self, patient_ids, rows):
+        """Classify rows (see ThresholdEvaluator.classify_batch), each with its patient's thresholds.
+
+        Rows are grouped by evaluator, so patients without a profile are
+        classified together.
+        """
+        self.prepare(set(patient_ids))
+        groups = {}  # Format: {id(evaluator): (evaluator, [row index])}
+        for i, patient_id in enumerate(patient_ids):
+            evaluator = self.evaluator(patient_id)
+            groups.setdefault(id(evaluator), (evaluator, []))[1].append(i)
+        results = [None] * len(rows)
+        for evaluator, indexes in groups.values():
+            for i, result in zip(indexes, evaluator.classify_batch([rows[i] for i in indexes])):
+                results[i] = result
+        return results
+
+def threshold_profiles():
+    """Return the current app's ThresholdProfiles, or None if not initialized."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('threshold_profiles')
+
+def evaluator_for(patient_id):
+    """Return the evaluator for a patient (the defaults if profiles are not set up)."""
+    profiles = threshold_profiles()
+    return profiles.evaluator(patient_id) if profiles is not None else DEFAULT_EVALUATOR
+
+def classify_batch_for(patient_ids, rows):
+    """Classify rows, each with the thresholds of the patient at the same index."""
+    profiles = threshold_profiles()
+    if profiles is None:
+        return DEFAULT_EVALUATOR.classify_batch(rows)
+    return profiles.classify_batch(patient_ids, rows)
+
+def _profile_shard(ward, patient_id):
+    if (ward is None) == (patient_id is None):
+        raise ValueError("Give exactly one of ward and patient_id")
+    return shard_router().for_ward(ward) if ward is not None else shard_for_patient(patient_id)
+
+def set_profile(name, overrides, ward=None, patient_id=None):
+    """Create or replace the profile of a ward or a patient and commit.
+
+    Args:
+        name: Profile name shown to staff, e.g. "COPD"
+        overrides: Threshold overrides (see parse_overrides)
+
+    Returns:
+        dict: The validated overrides
+    """
+    overrides = parse_overrides(overrides)
+    with use_shard(_profile_shard(ward, patient_id)):
+        profile = db.session.execute(db.select(ThresholdProfile).filter_by(ward=ward, patient_id=patient_id)).scalar()
+        if profile is None:
+            profile = ThresholdProfile(ward=ward, patient_id=patient_id)
+            db.session.add(profile)
+        profile.name = name
+        profile.overrides = json.dumps(overrides, sort_keys=True)
+        profile.updated = datetime.now()
+        db.session.commit()
+    _invalidate()
+    return overrides
+
+def delete_profile(ward=None, patient_id=None):
+    """Delete the profile of a ward or a patient and commit.
+
+    Returns:
+        bool: Whether there was one
+    """
+    with use_shard(_profile_shard(ward, patient_id)):
+        deleted = db.session.execute(ThresholdProfile.__table__.delete().where(
+            ThresholdProfile.ward == ward, ThresholdProfile.patient_id == patient_id)).rowcount
+        db.session.commit()
+    _invalidate()
+    return bool(deleted)
+
+def _invalidate():
+    profiles = threshold_profiles()
+    if profiles is not None:
+        profiles.invalidate()
+
+def init_threshold_profiles(app):
+    """Create the app's per-patient threshold cache."""
+    profiles = app.extensions['threshold_profiles'] = ThresholdProfiles(
+        app.config.get('THRESHOLD_REFRESH_SECONDS', 30))
+    return profiles
@@ -0,0 +1,375 @@
+"""
+Rolling-window vital sign statistics and an early-warning score per patient.
+
+Every ingested reading updates, in O(1), a rolling window per patient and
+vital sign over the last TREND_WINDOW_SECONDS (default 30 minutes). The
+window keeps per-minute buckets of running sums (count, sum of t, x, t*x,
+t^2 and x^2), so the mean, variance and least-squares slope come straight
+from the totals without revisiting any readings. A NEWS2-style score is
+computed from the latest values (using the heart rate, SpO2 and
+temperature parameters of NEWS2; the others are not measured here).
+
+With TREND_ALERTS enabled, a sustained slope past TREND_SLOPES (e.g.
+temperature climbing 0.5°C/h inside the normal band) raises a warning
+alert, at most once per window per patient and vital sign.
+
+State is snapshotted to the patient_trend table every
+TREND_SNAPSHOT_SECONDS. A worker that has not seen a patient yet restores
+the snapshot and replays the readings stored since.
+
+Usage:
+    from utils.trends import init_trends
+    init_trends(app)
+"""
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from db import db
+from models import Alert, PatientTrend, VitalSign
+from utils.alerting import VITAL_TYPES
+from utils.vitals import VITALS
+
+DEFAULT_WINDOW_SECONDS = 1800
+BUCKET_SECONDS = 60
+DEFAULT_SNAPSHOT_SECONDS = 60
+
+# Slope per hour that raises a trend alert; negative means falling
+TREND_SLOPES = {vital.name: vital.trend_slope for vital in VITALS if vital.trend_slope}
+
+# A trend needs at least this many readings spread over this much of the window
+MIN_TREND_SAMPLES = 6
+MIN_TREND_SPAN = 0.5
+
+# NEWS2 bands as (upper bound inclusive, points), checked in order; vital
+# signs that are not NEWS2 parameters don't count towards the score
+NEWS2_BANDS = {vital.name: vital.news2_bands for vital in VITALS if vital.news2_bands}
+
+def news2_points(vital_type, value):
+    """Return the NEWS2 points for a single value (0 if not a NEWS2 parameter)."""
+    for upper, points in NEWS2_BANDS.get(vital_type, ()):
+        if value <= upper:
+            return points
+    return 0
+
+def news2_risk(score, has_red_score=False):
+    """Return the NEWS2 clinical risk for an aggregate score."""
+    if score >= 7:
+        return 'high'
+    if score >= 5 or has_red_score:
+        return 'medium'
+    return 'low'
+
+class RollingWindow:
+    """Mean, variance and slope of (t, x) samples over a sliding time window.
+
+    Samples are kept as per-bucket sums, so updates are O(1) and memory is
+    bounded by window_seconds / bucket_seconds regardless of reading rate.
+    Times are seconds relative to ``origin`` to keep the sums well
+    conditioned.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, bucket_seconds=BUCKET_SECONDS, origin=None):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.origin = origin
+        self.buckets = deque()  # Format: [start, n, st, sx, stt, stx, sxx]
+        self.totals = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    def add(self, t, x):
+        """Add a sample at epoch seconds ``t``."""
+        if self.origin is None:
+            self.origin = t
+        t -= self.origin
+        start = t - t % self.bucket_seconds
+        if not self.buckets or start > self.buckets[-1][0]:
+            self.buckets.append([start, 0, 0.0, 0.0, 0.0, 0.0, 0.0])
+        # Late samples are counted in the newest bucket with their own time
+        bucket = self.buckets[-1]
+        for i, value in enumerate((1, t, x, t * t, t * x, x * x)):
+            bucket[i + 1] += value
+            self.totals[i] += value
+        self._evict(t)
+
+    def _evict(self, now):
+        expired = False
+        while self.buckets and self.buckets[0][0] + self.bucket_seconds <= now - self.window_seconds:
+            self.buckets.popleft()
+            expired = True
+        if expired:
+            # Re-sum the (bounded number of) buckets rather than subtracting,
+            # so rounding errors don't accumulate
+            self.totals = [sum(bucket[i + 1] for bucket in self.buckets) for i in range(6)]
+
+    @property
+    def count(self):
+        return self.totals[0]
+
+    @property
+    def span(self):
+        """Seconds covered by the buckets in the window."""
+        if not self.buckets:
+            return 0
+        return self.buckets[-1][0] - self.buckets[0][0] + self.bucket_seconds
+
+    def mean(self):
+        n, _, sx, _, _, _ = self.totals
+        return sx / n if n else None
+
+    def variance(self):
+        n, _, sx, _, _, sxx = self.totals
+        if n < 2:
+            return None
+        return max(0.0, (sxx - sx * sx / n) / (n - 1))
+
+    def slope(self):
+        """Least-squares slope in units per hour, or None."""
+        n, st, sx, stt, stx, _ = self.totals
+        denominator = n * stt - st * st
+        if n < 2 or denominator <= 1e-9:
+            return None
+        return (n * stx - st * sx) / denominator * 3600
+
+    def to_dict(self):
+        return {'origin': self.origin, 'buckets': list(map(list, self.buckets))}
+
+    @classmethod
+    def from_dict(cls, data, window_seconds=DEFAULT_WINDOW_SECONDS, bucket_seconds=BUCKET_SECONDS):
+        window = cls(window_seconds, bucket_seconds, data['origin'])
+        window.buckets.extend(data['buckets'])
+        window.totals = [sum(bucket[i + 1] for bucket in window.buckets) for i in range(6)]
+        return window
+
+class PatientTrends:
+    """Rolling windows and latest values for one patient."""
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.windows = {vital_type: RollingWindow(window_seconds) for vital_type in VITAL_TYPES}
+        self.latest = {}  # Format: {vital_type: value}
+        self.last_seen = None  # Epoch seconds of the newest reading
+        self.last_trend_alert = {}  # Format: {vital_type: epoch seconds}
+
+    def update(self, t, values):
+        """Add a reading's values, given as {vital_type: value} (None skipped)."""
+        for vital_type, value in values.items():
+            if value is None:
+                continue
+            self.windows[vital_type].add(t, value)
+            self.latest[vital_type] = value
+        self.last_seen = t if self.last_seen is None else max(self.last_seen, t)
+
+    def news2(self):
+        """Return (score, risk) from the latest values, or (None, None)."""
+        if not self.latest:
+            return None, None
+        points = [news2_points(vital_type, value) for vital_type, value in self.latest.items()]
+        score = sum(points)
+        return score, news2_risk(score, 3 in points)
+
+    def trend_alerts(self, t, slopes=TREND_SLOPES):
+        """Return [(vital_type, slope)] for sustained trends not alerted on this window."""
+        triggered = []
+        for vital_type, limit in slopes.items():
+            window = self.windows[vital_type]
+            if window.count < MIN_TREND_SAMPLES or window.span < self.window_seconds * MIN_TREND_SPAN:
+                continue
+            slope = window.slope()
+            if slope is None or slope / limit < 1:
+                # Not past the limit in the limit's direction
+                continue
+            last = self.last_trend_alert.get(vital_type)
+            if last is not None and t - last < self.window_seconds:
+                continue
+            self.last_trend_alert[vital_type] = t
+            triggered.append((vital_type, slope))
+        return triggered
+
+    def summary(self):
+        """Return the statistics shown on the patient card."""
+        score, risk = self.news2()
+        stats = {}
+        for vital_type, window in self.windows.items():
+            if window.count:
+                variance = window.variance()
+                stats[vital_type] = {
+                    'mean': window.mean(),
+                    'sd': math.sqrt(variance) if variance is not None else None,
+                    'slope': window.slope(),
+                    'count': window.count,
+                }
+        return {'news2': score, 'risk': risk, 'vitals': stats}
+
+    def to_json(self):
+        return json.dumps({
+            'windows': {vital_type: window.to_dict() for vital_type, window in self.windows.items()},
+            'latest': self.latest,
+            'last_seen': self.last_seen,
+            'last_trend_alert': self.last_trend_alert,
+        })
+
+    @classmethod
+    def from_json(cls, text, window_seconds=DEFAULT_WINDOW_SECONDS):
+        data = json.loads(text)
+        trends = cls(window_seconds)
+        for vital_type, window in data['windows'].items():
+            trends.windows[vital_type] = RollingWindow.from_dict(window, window_seconds)
+        trends.latest = data['latest']
+        trends.last_seen = data['last_seen']
+        trends.last_trend_alert = data['last_trend_alert']
+        return trends
+
+class TrendTracker:
+    """Per-patient trends for one process, with snapshot persistence.
+
+    Args:
+        window_seconds: Length of the rolling window
+        snapshot_seconds: Minimum seconds between snapshots
+        alerts: Whether sustained trends raise alerts
+    """
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, snapshot_seconds=DEFAULT_SNAPSHOT_SECONDS,
+                 alerts=False):
+        self.window_seconds = window_seconds
+        self.snapshot_seconds = snapshot_seconds
+        self.alerts = alerts
+        self._patients = {}  # Format: {patient_id: PatientTrends}
+        self._dirty = set()
+        self._last_snapshot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, patient_id):
+        """Return a patient's trends, or None if not loaded in this process."""
+        return self._patients.get(patient_id)
+
+    def load(self, patient_ids):
+        """Restore patients not yet in memory from snapshots and the readings since.
+
+        Two queries for the whole batch, whatever its size.
+        """
+        missing = set(patient_ids) - self._patients.keys()
+        if not missing:
+            return
+        with db.session.no_autoflush:
+            restored = self._restore(missing)
+        with self._lock:
+            for patient_id, trends in restored.items():
+                self._patients.setdefault(patient_id, trends)
+
+    def _restore(self, missing):
+        restored = {patient_id: PatientTrends(self.window_seconds) for patient_id in missing}
+        for patient_id, state in db.session.execute(
+                db.select(PatientTrend.patient_id, PatientTrend.state)
+                .where(PatientTrend.patient_id.in_(missing))):
+            restored[patient_id] = PatientTrends.from_json(state, self.window_seconds)
+
+        # Replay readings newer than each snapshot (or the whole window)
+        window_start = datetime.now() - timedelta(seconds=self.window_seconds)
+        since = min((datetime.fromtimestamp(trends.last_seen) if trends.last_seen else window_start
+                     for trends in restored.values()), default=window_start)
+        rows = db.session.execute(
+            db.select(VitalSign.patient_id, VitalSign.timestamp,
+                      *(getattr(VitalSign, vital_type) for vital_type in VITAL_TYPES))
+            .where(VitalSign.patient_id.in_(missing), VitalSign.timestamp > max(since, window_start))
+            .order_by(VitalSign.timestamp)
+        )
+        for patient_id, timestamp, *values in rows:
+            trends = restored[patient_id]
+            t = timestamp.timestamp()
+            if trends.last_seen is None or t > trends.last_seen:
+                trends.update(t, dict(zip(VITAL_TYPES, values)))
+        return restored
+
+    def discard(self, patient_ids):
+        """Forget patients' trends, e.g. after their readings were rolled back.
+
+        They are restored from the snapshot and stored readings when next seen.
+        """
+        with self._lock:
+            for patient_id in patient_ids:
+                self._patients.pop(patient_id, None)
+            self._dirty.difference_update(patient_ids)
+
+    def update(self, patient_id, timestamp, vitals):
+        """Add a reading to a patient's trends.
+
+        Args:
+            vitals: {vital_type: value} of registered vital signs (utils.vitals)
+
+        Returns:
+            list: (vital_type, slope) trend alerts to raise, if enabled
+        """
+        trends = self._patients.get(patient_id)
+        if trends is None:
+            self.load([patient_id])
+            trends = self._patients[patient_id]
+        t = timestamp.timestamp()
+        with self._lock:
+            trends.update(t, vitals)
+            self._dirty.add(patient_id)
+            return trends.trend_alerts(t) if self.alerts else []
+
+    def save_snapshots(self, force=False, patient_ids=None):
+        """Add snapshots of changed patients to the session if one is due.
+
+        Args:
+            force: Save even if the last snapshot is recent
+            patient_ids: Only save these patients, e.g. those in the current
+                shard; the rest stay due
+
+        Returns:
+            int: Number of snapshots written
+        """
+        if not self._dirty or (not force and time.monotonic() - self._last_snapshot < self.snapshot_seconds):
+            return 0
+        with self._lock:
+            if patient_ids is None:
+                dirty, self._dirty = self._dirty, set()
+            else:
+                dirty = self._dirty & set(patient_ids)
+                self._dirty -= dirty
+            if not dirty:
+                return 0
+            rows = [{'patient_id': patient_id, 'state': self._patients[patient_id].to_json(),
+                     'updated': datetime.now()} for patient_id in dirty]
+            if not self._dirty:
+                self._last_snapshot = time.monotonic()
+        table = PatientTrend.__table__
+        db.session.execute(table.delete().where(table.c.patient_id.in_(dirty)))
+        db.session.execute(table.insert(), rows)
+        return len(rows)
+
+def trend_alert_values(patient_id, vital_type, slope, timestamp):
+    """Return the column values of the warning alert for a sustained trend."""
+    limit = TREND_SLOPES[vital_type]
+    return {
+        'patient_id': patient_id,
+        'timestamp': timestamp,
+        'vital_type': vital_type,
+        'value': round(slope, 2),
+        'threshold': f"trend {limit:+g}/h",
+        'severity': 'warning',
+        'acknowledged': False,
+    }
+
+def trend_alert(patient_id, vital_type, slope, timestamp):
+    """Build the warning Alert for a sustained trend."""
+    return Alert(**trend_alert_values(patient_id, vital_type, slope, timestamp))
+
+def init_trends(app):
+    """Create the app's trend tracker.
+
+    Config:
+        TREND_WINDOW_SECONDS: Rolling window length (default 1800)
+        TREND_SNAPSHOT_SECONDS: Minimum seconds between snapshots (default 60)
+        TREND_ALERTS: Raise alerts for sustained trends (default False)
+    """
+    tracker = TrendTracker(app.config.get('TREND_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS),
+                           app.config.get('TREND_SNAPSHOT_SECONDS', DEFAULT_SNAPSHOT_SECONDS),
+                           app.config.get('TREND_ALERTS', False))
+    app.extensions['trends'] = tracker
+    return tracker
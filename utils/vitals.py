@@ -0,0 +1,132 @@
+"""
+Registry of the vital signs the system measures.
+
+Each VitalType is the single definition of a vital sign. Everything
+else is derived from the registry:
+- storage: one fixed-point column per vital on vital_sign and
+  patient_status, plus an alert flag (models);
+- thresholds and alert classification (utils.alerting);
+- trend limits and NEWS2 bands (utils.trends);
+- ingest fields (utils.ingest, gateway, /update, bulk import);
+- table columns, patient cards, alert labels and notifications;
+- simulated readings (app, fake_monitor).
+
+Adding a vital sign means registering it here (or with register_vital
+before the app modules are imported) and adding its columns to existing
+databases.
+
+Usage:
+    from utils.vitals import VITALS, init_vitals, vital_type
+    vital_type('spo2').label
+    simulated_value(vital_type('temp'), abnormal=True)
+    init_vitals(app)  # templates loop over `vitals`
+"""
+
+import math
+import random
+import unicodedata
+from collections import namedtuple
+
+_FIELDS = ('name label unit scale warning critical lower_bound_only '
+           'trend_slope news2_bands short_label')
+
+class VitalType(namedtuple('VitalType', _FIELDS)):
+    """One vital sign.
+
+    Attributes:
+        name: Column and reading key, e.g. 'heart_rate'
+        label: Display name, e.g. 'Heart Rate'
+        unit: Display unit, e.g. 'bpm'
+        scale: Stored as integer units of 1/scale (1: whole, 10: tenths)
+        warning, critical: (min, max) normal range for each severity
+        lower_bound_only: Only values below min raise alerts
+        trend_slope: Slope per hour that raises a trend alert, or None
+        news2_bands: NEWS2 (upper bound inclusive, points) bands, or None
+        short_label: Label for narrow columns (default: label)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name, label, unit, scale, warning, critical, lower_bound_only=False,
+                trend_slope=None, news2_bands=None, short_label=None):
+        return super().__new__(cls, name, label, unit, scale, warning, critical, lower_bound_only,
+                               trend_slope, news2_bands, short_label or label)
+
+    @property
+    def decimals(self):
+        """Decimal places the vital is stored and shown with."""
+        return round(math.log10(self.scale))
+
+    @property
+    def text_label(self):
+        """Label in plain text, for emails and logs (e.g. 'SpO2')."""
+        return unicodedata.normalize('NFKC', self.label)
+
+    @property
+    def flag(self):
+        """Name of the alert flag column on patient_status."""
+        return f'{self.name}_alert'
+
+    def format(self, value):
+        """Format a value with its unit, e.g. '72 bpm' or '97.5%'."""
+        if value is None:
+            return ''
+        separator = '' if self.unit in ('%', '°C') else ' '
+        return f"{value:.{self.decimals}f}{separator}{self.unit}"
+
+VITALS = [
+    VitalType('heart_rate', 'Heart Rate', 'bpm', 1,
+              warning=(60, 100), critical=(50, 120), trend_slope=15.0,
+              news2_bands=((40, 3), (50, 1), (90, 0), (110, 1), (130, 2), (math.inf, 3))),
+    # SpO2 can't be too high, so only its lower bound is checked
+    VitalType('spo2', 'SpO₂', '%', 10,
+              warning=(95, 100), critical=(90, 100), lower_bound_only=True, trend_slope=-2.0,
+              news2_bands=((91, 3), (93, 2), (95, 1), (math.inf, 0))),
+    VitalType('temp', 'Temperature', '°C', 10,
+              warning=(36.5, 37.5), critical=(35.5, 38.5), trend_slope=0.5,
+              news2_bands=((35.0, 3), (36.0, 1), (38.0, 0), (39.0, 1), (math.inf, 2)),
+              short_label='Temp'),
+]
+
+_BY_NAME = {vital.name: vital for vital in VITALS}
+
+def vital_type(name):
+    """Return the VitalType called ``name`` (KeyError if not registered)."""
+    return _BY_NAME[name]
+
+def vital_names():
+    """Return the registered vital names in order."""
+    return tuple(_BY_NAME)
+
+def register_vital(vital):
+    """Add a vital sign to the registry.
+
+    Must run before ``models`` and the other app modules are imported,
+    since they build their columns and constants from the registry.
+    """
+    if vital.name in _BY_NAME:
+        raise ValueError(f"Vital type already registered: {vital.name}")
+    VITALS.append(vital)
+    _BY_NAME[vital.name] = vital
+
+def simulated_value(vital, abnormal=False, rng=random):
+    """Draw a simulated value of a registered vital sign.
+
+    Normal values fall in the vital's warning range. Abnormal ones fall
+    below it (or above it, unless only the lower bound is checked), up to
+    twice as far out as the critical limit.
+    """
+    low, high = vital.warning
+    if not abnormal:
+        value = rng.uniform(low, high)
+    else:
+        step = 1 / vital.scale
+        sides = [(low - 2 * (low - vital.critical[0]), low - step)]
+        if not vital.lower_bound_only:
+            sides.append((high + step, high + 2 * (vital.critical[1] - high)))
+        value = rng.uniform(*rng.choice(sides))
+    return round(value, vital.decimals) if vital.decimals else round(value)
+
+def init_vitals(app):
+    """Make the registry available to the app's templates as ``vitals`` and ``vitals_by_name``."""
+    app.jinja_env.globals.update(vitals=VITALS, vitals_by_name=_BY_NAME)